@@ -0,0 +1,298 @@
+# bench.py
+"""
+Замеры производительности process_single по матрице параметров.
+
+Входные файлы генерируются локально (lavfi testsrc2 + sine), поэтому замеры
+воспроизводимы на любой машине с ffmpeg. Каждый случай выполняется в отдельном
+процессе Python, чтобы время CPU и пиковая память ffmpeg считались только для него.
+
+Пример:
+    python bench.py run --out baseline.json
+    python bench.py run --out new.json --compare baseline.json
+    python bench.py run --only "Пикселизация" --repeat 3
+    python bench.py compare new.json baseline.json --threshold 0.15
+
+По умолчанию параметры меняются по одному относительно базового случая
+(без фильтров, zoom/скорость 100, без наложения); --full перебирает полную матрицу.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import redirect_stdout
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCH_RESOLUTIONS = ["1920x1080", "1080x1920", "640x360"]
+BENCH_DURATION = 5
+BENCH_ZOOMS = [100, 110, 130]
+BENCH_SPEEDS = [100, 80, 125]
+BENCH_THRESHOLD = 0.10  # относительный рост времени, который считается регрессией
+COMPARED_METRICS = ("wall", "cpu")
+
+
+def _ffmpeg_path() -> str:
+    with redirect_stdout(sys.stderr):
+        from utils.ffmpeg_utils import FFMPEG_PATH_EFFECTIVE
+    return FFMPEG_PATH_EFFECTIVE
+
+
+def make_inputs(work_dir: str, resolutions: List[str], duration: int) -> Dict[str, str]:
+    """Генерирует (один раз) синтетические входные файлы и картинку для наложения."""
+    ffmpeg = _ffmpeg_path()
+    os.makedirs(work_dir, exist_ok=True)
+    inputs = {}
+    for size in resolutions:
+        path = os.path.join(work_dir, f"src_{size}_{duration}s.mp4")
+        if not os.path.exists(path):
+            subprocess.run([
+                ffmpeg, "-hide_banner", "-loglevel", "error", "-y",
+                "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=30:duration={duration}",
+                "-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=44100:duration={duration}",
+                "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p",
+                "-c:a", "aac", "-shortest", path,
+            ], check=True)
+        inputs[size] = path
+    overlay = os.path.join(work_dir, "overlay.png")
+    if not os.path.exists(overlay):
+        subprocess.run([
+            ffmpeg, "-hide_banner", "-loglevel", "error", "-y",
+            "-f", "lavfi", "-i", "color=c=red@0.5:size=240x240,format=rgba",
+            "-frames:v", "1", overlay,
+        ], check=True)
+    inputs["overlay"] = overlay
+    return inputs
+
+
+def _case(size: str, output_format: str = "Оригинальный", blur: Optional[str] = None,
+          filter_name: Optional[str] = None, zoom: int = 100, speed: int = 100,
+          overlay: bool = False) -> Dict[str, Any]:
+    case = {
+        "input": size, "output_format": output_format, "blur": blur,
+        "filter": filter_name, "zoom": zoom, "speed": speed, "overlay": overlay,
+    }
+    case["id"] = "|".join([
+        size, output_format, f"blur={blur or '-'}", f"filter={filter_name or '-'}",
+        f"zoom={zoom}", f"speed={speed}", f"overlay={int(overlay)}",
+    ])
+    return case
+
+
+def build_matrix(resolutions: List[str], full: bool = False) -> List[Dict[str, Any]]:
+    """Список случаев для замера."""
+    from utils.constants import FILTERS, REELS_FORMAT_NAME, BLUR_QUALITY_LEVELS
+
+    filter_names = [name for name in FILTERS if name != "Нет фильтра"]
+    formats = [("Оригинальный", None), (REELS_FORMAT_NAME, None)]
+    formats += [(REELS_FORMAT_NAME, quality) for quality in BLUR_QUALITY_LEVELS]
+
+    cases = []
+    for size in resolutions:
+        if full:
+            for (fmt, blur), flt, zoom, speed, ovl in itertools.product(
+                    formats, [None] + filter_names, BENCH_ZOOMS, BENCH_SPEEDS, (False, True)):
+                cases.append(_case(size, fmt, blur, flt, zoom, speed, ovl))
+            continue
+        cases.append(_case(size))
+        cases.extend(_case(size, fmt, blur) for fmt, blur in formats[1:])
+        cases.extend(_case(size, filter_name=flt) for flt in filter_names)
+        cases.extend(_case(size, zoom=zoom) for zoom in BENCH_ZOOMS[1:])
+        cases.extend(_case(size, speed=speed) for speed in BENCH_SPEEDS[1:])
+        cases.append(_case(size, overlay=True))
+    return cases
+
+
+def _children_usage() -> Dict[str, Optional[float]]:
+    if resource is None:
+        return {"cpu": None, "max_rss_kb": None}
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # ru_maxrss: килобайты в Linux, байты в macOS
+    rss = usage.ru_maxrss / 1024 if platform.system() == "Darwin" else usage.ru_maxrss
+    return {"cpu": usage.ru_utime + usage.ru_stime, "max_rss_kb": rss}
+
+
+def run_case(case: Dict[str, Any], inputs: Dict[str, str], out_path: str) -> Dict[str, Any]:
+    """Выполняет один случай в текущем процессе (вызывается из дочернего процесса)."""
+    import random
+    from utils.ffmpeg_utils import process_single
+    from utils.probe import probe_media
+
+    random.seed(case["id"])  # одинаковые случайные фильтры в каждом запуске
+    before = _children_usage()
+    started = time.perf_counter()
+    process_single(
+        inputs[case["input"]], out_path,
+        filters=[case["filter"]] if case["filter"] else [],
+        zoom_p=case["zoom"], speed_p=case["speed"],
+        overlay_file=inputs["overlay"] if case["overlay"] else None,
+        overlay_pos="Середина-Центр",
+        output_format=case["output_format"],
+        blur_background=case["blur"] is not None,
+        blur_quality=case["blur"] or "Полное",
+    )
+    wall = time.perf_counter() - started
+    after = _children_usage()
+
+    info = probe_media(out_path, use_cache=False)
+    frames = info.nb_frames or int(round(info.duration * info.fps))
+    return {
+        "wall": round(wall, 3),
+        "fps": round(frames / wall, 2) if wall > 0 else None,
+        "cpu": round(after["cpu"] - before["cpu"], 3) if after["cpu"] is not None else None,
+        "max_rss_kb": after["max_rss_kb"],
+        "frames": frames,
+        "size": os.path.getsize(out_path),
+    }
+
+
+def _run_isolated(case: Dict[str, Any], inputs: Dict[str, str], work_dir: str,
+                  verbose: bool) -> Dict[str, Any]:
+    out_path = os.path.join(work_dir, "out.mp4")
+    payload = json.dumps({"case": case, "inputs": inputs, "out_path": out_path}, ensure_ascii=False)
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "_case", payload],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.PIPE, stderr=None if verbose else subprocess.DEVNULL,
+        text=True, encoding="utf-8",
+    )
+    lines = (proc.stdout or "").strip().splitlines()
+    if proc.returncode != 0 or not lines:
+        raise RuntimeError(f"exit code {proc.returncode}")
+    return json.loads(lines[-1])
+
+
+def run_matrix(cases: List[Dict[str, Any]], inputs: Dict[str, str], work_dir: str,
+               repeat: int = 1, verbose: bool = False) -> Dict[str, Dict[str, Any]]:
+    """Замеряет все случаи; при repeat > 1 берётся медиана по каждой метрике."""
+    results = {}
+    for index, case in enumerate(cases, 1):
+        runs = []
+        try:
+            for _ in range(repeat):
+                runs.append(_run_isolated(case, inputs, work_dir, verbose))
+        except Exception as e:
+            results[case["id"]] = {"case": case, "error": str(e)}
+            print(f"[{index}/{len(cases)}] {case['id']}: ошибка ({e})", file=sys.stderr)
+            continue
+        metrics = {
+            key: (statistics.median(r[key] for r in runs) if runs[0][key] is not None else None)
+            for key in runs[0]
+        }
+        results[case["id"]] = {"case": case, **metrics}
+        print(f"[{index}/{len(cases)}] {case['id']}: {metrics['wall']:.2f} с, {metrics['fps']} к/с",
+              file=sys.stderr)
+    return results
+
+
+def _meta() -> Dict[str, Any]:
+    ffmpeg_version = ""
+    try:
+        out = subprocess.run([_ffmpeg_path(), "-version"], capture_output=True, text=True).stdout
+        ffmpeg_version = out.splitlines()[0] if out else ""
+    except OSError:
+        pass
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "ffmpeg": ffmpeg_version,
+    }
+
+
+def compare(new: Dict[str, Any], old: Dict[str, Any], threshold: float = BENCH_THRESHOLD) -> List[str]:
+    """Сравнивает два результата и возвращает список регрессий (рост метрики больше threshold)."""
+    regressions = []
+    for case_id, result in sorted(new["cases"].items()):
+        base = old["cases"].get(case_id)
+        if not base or "error" in result or "error" in base:
+            continue
+        for metric in COMPARED_METRICS:
+            was, now = base.get(metric), result.get(metric)
+            if not was or now is None:
+                continue
+            change = round((now - was) / was, 4)
+            mark = "РЕГРЕССИЯ" if change > threshold else ""
+            print(f"{case_id:<90} {metric:<5} {was:8.2f} -> {now:8.2f} ({change:+.1%}) {mark}")
+            if change > threshold:
+                regressions.append(f"{case_id} {metric} {change:+.1%}")
+    return regressions
+
+
+def _load(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Video Uniqueizer: замеры производительности обработки")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_p = sub.add_parser("run", help="Выполнить замеры")
+    run_p.add_argument("--out", default="bench_results.json", help="Куда записать результаты (JSON)")
+    run_p.add_argument("--compare", default=None, help="Сравнить с предыдущим результатом")
+    run_p.add_argument("--threshold", type=float, default=BENCH_THRESHOLD)
+    run_p.add_argument("--work-dir", default=None, help="Папка для входных и выходных файлов")
+    run_p.add_argument("--resolutions", default=",".join(BENCH_RESOLUTIONS))
+    run_p.add_argument("--duration", type=int, default=BENCH_DURATION, help="Длительность входов (сек)")
+    run_p.add_argument("--repeat", type=int, default=1, help="Повторов каждого случая (берётся медиана)")
+    run_p.add_argument("--only", default=None, help="Только случаи, id которых содержит эту строку")
+    run_p.add_argument("--full", action="store_true", help="Полная матрица вместо изменения по одному параметру")
+    run_p.add_argument("--verbose", action="store_true", help="Показывать вывод ffmpeg")
+
+    cmp_p = sub.add_parser("compare", help="Сравнить два файла результатов")
+    cmp_p.add_argument("new")
+    cmp_p.add_argument("old")
+    cmp_p.add_argument("--threshold", type=float, default=BENCH_THRESHOLD)
+
+    case_p = sub.add_parser("_case")  # служебный: один случай в отдельном процессе
+    case_p.add_argument("payload")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "_case":
+        payload = json.loads(args.payload)
+        real_stdout = sys.stdout
+        with redirect_stdout(sys.stderr):
+            result = run_case(payload["case"], payload["inputs"], payload["out_path"])
+        real_stdout.write(json.dumps(result) + "\n")
+        return 0
+
+    if args.command == "compare":
+        regressions = compare(_load(args.new), _load(args.old), args.threshold)
+        print(f"Регрессий: {len(regressions)}")
+        return 1 if regressions else 0
+
+    from utils.constants import CACHE_DIR
+    work_dir = args.work_dir or os.path.join(CACHE_DIR, "bench")
+    resolutions = [r.strip() for r in args.resolutions.split(",") if r.strip()]
+    inputs = make_inputs(work_dir, resolutions, args.duration)
+    cases = build_matrix(resolutions, args.full)
+    if args.only:
+        cases = [c for c in cases if args.only in c["id"]]
+
+    results = {"meta": _meta(), "duration": args.duration,
+               "cases": run_matrix(cases, inputs, work_dir, max(1, args.repeat), args.verbose)}
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Результаты записаны в {args.out}")
+
+    if args.compare:
+        regressions = compare(results, _load(args.compare), args.threshold)
+        print(f"Регрессий: {len(regressions)}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
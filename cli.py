@@ -0,0 +1,418 @@
+# cli.py
+"""
+Консольный (headless) режим пакетной обработки без PyQt5.
+
+Пример:
+    python cli.py job.json
+    python cli.py job.yaml --jobs 8
+
+Манифест (JSON или YAML) содержит те же параметры, что и конструктор Worker:
+    {
+        "files": ["clips/a.mp4", "clips/"],
+        "out_dir": "output",
+        "filters": ["Случ. цвет (яркость/контраст/...)"],
+        "zoom_mode": "dynamic", "zoom_min": 105, "zoom_max": 115,
+        "speed_mode": "static", "speed_min": 100,
+        "output_format": "Reels/TikTok (1080x1920)",
+        "blur_background": true,
+        "blur_quality": "Быстрое", "blur_reuse_frames": 2,
+        "strip_metadata": true,
+        "split_duration": 20,
+        "chunk_parallel": false,
+        "variants": 3,
+        "parallel_jobs": 4,
+        "resume": true,
+        "seed": 42,
+        "gif_loops": 3, "gif_silent_audio": false,
+        "output_cache": true,
+        "schedule": "longest"
+    }
+
+schedule — порядок заданий: longest (длинные первыми), shortest (короткие первыми), fifo.
+
+Результат по каждому файлу выводится в stdout отдельной строкой JSON,
+служебные сообщения ffmpeg уходят в stderr.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import redirect_stdout
+from typing import Any, Dict, List, Tuple
+
+MANIFEST_RUN_KEYS = ("files", "out_dir", "split_duration", "parallel_jobs", "variants", "resume", "output_cache",
+                     "schedule", "governor")
+
+
+def load_manifest(path: str) -> Dict[str, Any]:
+    """Читает манифест задания из JSON или YAML файла."""
+    with open(path, "r", encoding="utf-8") as f:
+        if path.lower().endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise RuntimeError("Для YAML-манифестов установите PyYAML: pip install pyyaml")
+            manifest = yaml.safe_load(f)
+        else:
+            manifest = json.load(f)
+    if not isinstance(manifest, dict):
+        raise ValueError("Манифест должен быть объектом (словарём параметров)")
+    return manifest
+
+
+def collect_inputs(paths: List[str]) -> Tuple[List[str], List[Tuple[str, str]]]:
+    """
+    Разворачивает папки из манифеста в список видео/GIF файлов.
+    Возвращает (файлы, отклонённые пути с причиной).
+    """
+    from utils.file_utils import find_videos_in_folder, is_video_file
+
+    files = []
+    rejected = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(find_videos_in_folder(path, include_gifs=True))
+        elif not os.path.exists(path):
+            rejected.append((path, "Файл не найден"))
+        elif is_video_file(path) or path.lower().endswith(".gif"):
+            files.append(path)
+        else:
+            rejected.append((path, "Не видео и не GIF"))
+    return files, rejected
+
+
+def make_emitter(out=None):
+    """Функция вывода записей JSON Lines в stdout (потокобезопасная)."""
+    results_out = out or sys.stdout
+    write_lock = threading.Lock()
+
+    def emit(record: Dict[str, Any]):
+        with write_lock:
+            results_out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            results_out.flush()
+    return emit
+
+
+def load_options(manifest: Dict[str, Any]):
+    """Параметры обработки и порядок заданий (schedule) из манифеста."""
+    from utils.constants import SCHEDULE_POLICIES, DEFAULT_SCHEDULE
+    from utils.jobs import normalize_job_options
+
+    options = normalize_job_options({k: v for k, v in manifest.items() if k not in MANIFEST_RUN_KEYS})
+    schedule = manifest.get("schedule") or DEFAULT_SCHEDULE
+    schedule = SCHEDULE_POLICIES.get(schedule, schedule)
+    if schedule not in SCHEDULE_POLICIES.values():
+        raise ValueError(f"schedule должен быть одним из: {', '.join(SCHEDULE_POLICIES.values())}")
+    return options, schedule
+
+
+def plan_batch(manifest: Dict[str, Any], options: Dict[str, Any], schedule: str, out_dir: str,
+               journal, resume: bool, emit):
+    """
+    Планирует пакет: проверка входов, задания (с нарезкой и вариантами), пропуск
+    готовых по журналу и порядок по оценке стоимости.
+    Возвращает (задания, оценки стоимости, число пропущенных, отклонённые входы).
+    """
+    from utils.jobs import iter_jobs
+    from utils.preflight import preflight
+    from utils.scheduler import order_jobs, plan_costs
+
+    files, missing = collect_inputs(manifest.get("files") or [])
+    infos, rejected = preflight(files)
+    rejected = missing + rejected
+    for path, reason in rejected:
+        emit({"status": "rejected", "input": path, "error": reason})
+    jobs = iter_jobs([path for path in files if path in infos], out_dir, options["output_format"],
+                     manifest.get("split_duration"), max(1, int(manifest.get("variants") or 1)), infos)
+    pending = []
+    skipped = 0
+    for job in jobs:
+        if resume and journal.is_done(job, options):
+            skipped += 1
+            emit({"status": "skipped", "input": job.in_path, "output": job.out_path})
+        else:
+            pending.append(job)
+    costs = plan_costs(pending, options)
+    return order_jobs(pending, costs, schedule), costs, skipped, rejected
+
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] == "coordinator":
+        return coordinator_main(argv[1:])
+    if argv and argv[0] == "node":
+        return node_main(argv[1:])
+
+    parser = argparse.ArgumentParser(description="Video Uniqueizer: пакетная обработка без графического интерфейса")
+    parser.add_argument("manifest", help="Путь к манифесту задания (.json, .yaml)")
+    parser.add_argument("--jobs", type=int, default=None, help="Сколько файлов обрабатывать одновременно")
+    parser.add_argument("--progress", action="store_true",
+                        help="Выводить также строки прогресса кодирования (status=progress)")
+    parser.add_argument("--out-dir", default=None, help="Папка для результатов (переопределяет out_dir манифеста)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Пропустить задания, уже выполненные по журналу выходной папки")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Не брать результаты из кэша и не сохранять их туда")
+    parser.add_argument("--profile", action="store_true",
+                        help="Записывать в метрики время этапов задания (probe/spawn/encode/finalize)")
+    parser.add_argument("--no-governor", action="store_true",
+                        help="Не ждать свободных ядер и памяти перед запуском задания, не закреплять ffmpeg за ядрами")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+    emit = make_emitter()
+
+    # Всё, что печатают утилиты ffmpeg, уходит в stderr, чтобы stdout оставался JSON Lines
+    with redirect_stdout(sys.stderr):
+        from utils.constants import DEFAULT_PARALLEL_JOBS, DEFAULT_OUTPUT_DIR
+        from utils.ffmpeg_utils import threads_per_job
+        from utils.jobs import run_job
+        from utils.journal import open_journal, remove_partials
+        from utils.output_cache import open_output_cache
+        from utils.metrics import open_metrics
+        from utils.cancellation import cancel_all
+        from utils.scheduler import BatchEta
+        from utils.governor import Governor
+
+        try:
+            manifest = load_manifest(args.manifest)
+            options, schedule = load_options(manifest)
+        except Exception as e:
+            emit({"status": "error", "error": f"{type(e).__name__}: {e}"})
+            return 2
+
+        out_dir = args.out_dir or manifest.get("out_dir") or DEFAULT_OUTPUT_DIR
+        parallel_jobs = max(1, args.jobs or manifest.get("parallel_jobs") or DEFAULT_PARALLEL_JOBS)
+        os.makedirs(out_dir, exist_ok=True)
+
+        threads = threads_per_job(parallel_jobs)
+        failed = 0
+        journal = open_journal(out_dir)
+        resume = (args.resume or manifest.get("resume")) and journal is not None
+        if resume:
+            remove_partials(out_dir)
+        try:
+            pending, costs, skipped, rejected = plan_batch(manifest, options, schedule, out_dir, journal, resume, emit)
+        except FileNotFoundError as e:
+            emit({"status": "error", "error": str(e)})
+            return 2
+        use_cache = not args.no_cache and manifest.get("output_cache", True)
+        output_cache = open_output_cache() if use_cache else None
+        metrics = open_metrics(profile=True) if args.profile else open_metrics()
+        eta = BatchEta(costs)
+        use_governor = not args.no_governor and manifest.get("governor", True)
+        governor = Governor(parallel_jobs) if use_governor else None
+
+        def progress_for(job):
+            if not args.progress:
+                return None
+
+            def update(stats):
+                eta.update(job.out_path, (stats["percent"] or 0.0) / 100.0)
+                emit({"status": "progress", "input": job.in_path, "output": job.out_path, **stats,
+                      "batch_eta": eta.eta()})
+            return update
+
+        def run_one(job):
+            try:
+                return run_job(job, options, threads, parallel_jobs, progress_for(job), journal, output_cache, metrics,
+                               governor)
+            finally:
+                eta.finish(job.out_path)
+
+        interrupted = False
+        with ThreadPoolExecutor(max_workers=parallel_jobs) as pool:
+            futures = {}
+            try:
+                for job in pending:
+                    futures[pool.submit(run_one, job)] = job
+                for future in as_completed(futures):
+                    try:
+                        emit({"status": "ok", **future.result()})
+                    except Exception as e:
+                        failed += 1
+                        job = futures[future]
+                        emit({"input": job.in_path, "output": job.out_path, "status": "error",
+                              "error": f"{type(e).__name__}: {e}"})
+            except KeyboardInterrupt:
+                # ffmpeg запущены в своих группах и Ctrl+C не получают: останавливаем их сами
+                interrupted = True
+                for future in futures:
+                    future.cancel()
+                cancel_all(wait=True)
+                emit({"status": "cancelled"})
+
+        if journal is not None:
+            journal.close()
+        if output_cache is not None:
+            output_cache.close()
+        if metrics is not None:
+            metrics.close()
+        if interrupted:
+            print("Cancelled by user.")
+            return 130
+        print(f"Done: {len(futures) - failed} ok, {failed} failed, {skipped} skipped, {len(rejected)} rejected.")
+    return 1 if failed or rejected else 0
+
+
+def coordinator_main(argv: List[str]) -> int:
+    """python cli.py coordinator job.json — раздаёт задания пакета узлам по сети."""
+    from utils.constants import DISTRIBUTED_PORT, DISTRIBUTED_LEASE_SECONDS, DISTRIBUTED_POLL_SECONDS
+
+    parser = argparse.ArgumentParser(prog="cli.py coordinator",
+                                     description="Координатор: очередь заданий пакета для узлов (cli.py node)")
+    parser.add_argument("manifest", help="Путь к манифесту задания (.json, .yaml)")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="Адрес, на котором принимать узлы (0.0.0.0 — вся сеть, только вместе с --token)")
+    parser.add_argument("--port", type=int, default=DISTRIBUTED_PORT, help="Порт координатора")
+    parser.add_argument("--token", default=os.environ.get("UNIQUEIZER_TOKEN"),
+                        help="Общий секрет узлов (или переменная UNIQUEIZER_TOKEN)")
+    parser.add_argument("--lease", type=float, default=DISTRIBUTED_LEASE_SECONDS,
+                        help="Срок аренды задания без heartbeat, сек")
+    parser.add_argument("--out-dir", default=None,
+                        help="Общая папка для результатов (переопределяет out_dir манифеста)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Пропустить задания, уже выполненные по журналу выходной папки")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+    emit = make_emitter()
+
+    with redirect_stdout(sys.stderr):
+        from utils.constants import DEFAULT_OUTPUT_DIR
+        from utils.journal import open_journal, remove_partials
+        from utils.distributed import Coordinator, serve
+
+        try:
+            manifest = load_manifest(args.manifest)
+            options, schedule = load_options(manifest)
+        except Exception as e:
+            emit({"status": "error", "error": f"{type(e).__name__}: {e}"})
+            return 2
+
+        out_dir = os.path.abspath(args.out_dir or manifest.get("out_dir") or DEFAULT_OUTPUT_DIR)
+        os.makedirs(out_dir, exist_ok=True)
+        journal = open_journal(out_dir)
+        resume = (args.resume or manifest.get("resume")) and journal is not None
+        if resume:
+            remove_partials(out_dir)
+        try:
+            pending, _costs, skipped, rejected = plan_batch(manifest, options, schedule, out_dir, journal, resume, emit)
+        except FileNotFoundError as e:
+            emit({"status": "error", "error": str(e)})
+            return 2
+
+        results = {"ok": 0, "error": 0}
+
+        def on_event(record: Dict[str, Any]):
+            results[record["status"]] = results.get(record["status"], 0) + 1
+            emit(record)
+
+        coordinator = Coordinator(pending, options, lease_seconds=args.lease, journal=journal, on_event=on_event)
+        try:
+            server = serve(coordinator, args.host, args.port, args.token)
+        except (ValueError, OSError) as e:
+            emit({"status": "error", "error": str(e)})
+            if journal is not None:
+                journal.close()
+            return 2
+        print(f"Coordinator: {len(pending)} job(s) on {args.host}:{server.server_address[1]}, "
+              f"{skipped} skipped, {len(rejected)} rejected.")
+        interrupted = False
+        try:
+            while not coordinator.all_done.wait(1.0):
+                pass
+        except KeyboardInterrupt:
+            interrupted = True
+            emit({"status": "cancelled"})
+        else:
+            # Узлы опрашивают координатор раз в DISTRIBUTED_POLL_SECONDS: даём им узнать, что заданий больше не будет
+            time.sleep(DISTRIBUTED_POLL_SECONDS * 2)
+        server.shutdown()
+        if journal is not None:
+            journal.close()
+        if interrupted:
+            return 130
+        print(f"Done: {results['ok']} ok, {results['error']} failed, {skipped} skipped, {len(rejected)} rejected.")
+    return 1 if results["error"] or rejected else 0
+
+
+def node_main(argv: List[str]) -> int:
+    """python cli.py node http://coordinator:8765 — берёт задания у координатора и кодирует их."""
+    parser = argparse.ArgumentParser(prog="cli.py node", description="Узел: выполняет задания координатора")
+    parser.add_argument("url", help="Адрес координатора, например http://192.168.1.10:8765")
+    parser.add_argument("--jobs", type=int, default=None, help="Сколько заданий выполнять одновременно")
+    parser.add_argument("--token", default=os.environ.get("UNIQUEIZER_TOKEN"),
+                        help="Общий секрет узлов (или переменная UNIQUEIZER_TOKEN)")
+    parser.add_argument("--name", default=None, help="Имя узла в логах координатора")
+    parser.add_argument("--map", action="append", default=[], metavar="COORD_PREFIX=NODE_PREFIX",
+                        help="Перевод путей общей папки, если она смонтирована на узле иначе")
+    parser.add_argument("--out-root", action="append", default=[], metavar="DIR",
+                        help="Общая папка результатов на узле; писать вне её узел откажется "
+                             "(по умолчанию — NODE_PREFIX из --map)")
+    parser.add_argument("--no-cache", action="store_true", help="Не использовать локальный кэш результатов")
+    parser.add_argument("--no-governor", action="store_true",
+                        help="Не ждать свободных ядер и памяти перед запуском задания, не закреплять ffmpeg за ядрами")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+    emit = make_emitter()
+
+    with redirect_stdout(sys.stderr):
+        from utils.constants import DEFAULT_PARALLEL_JOBS
+        from utils.ffmpeg_utils import threads_per_job
+        from utils.output_cache import open_output_cache
+        from utils.metrics import open_metrics
+        from utils.cancellation import cancel_all
+        from utils.distributed import CoordinatorClient, PathMap, run_node
+        from utils.governor import Governor
+
+        pairs = []
+        for item in args.map:
+            src, sep, dst = item.partition("=")
+            if not sep:
+                emit({"status": "error", "error": f"--map ожидает COORD_PREFIX=NODE_PREFIX, получено: {item}"})
+                return 2
+            pairs.append((src, dst))
+        path_map = PathMap(pairs)
+        if not (args.out_root or path_map.node_prefixes):
+            emit({"status": "error", "error": "Укажите общую папку результатов: --out-root DIR или --map"})
+            return 2
+        slots = max(1, args.jobs or DEFAULT_PARALLEL_JOBS)
+        output_cache = None if args.no_cache else open_output_cache()
+        metrics = open_metrics()
+        governor = None if args.no_governor else Governor(slots)
+        stop_event = threading.Event()
+        counts: Dict[str, int] = {}
+
+        def work():
+            counts.update(run_node(CoordinatorClient(args.url, args.token), slots, threads_per_job(slots), args.name,
+                                   path_map, output_cache, metrics, stop_event, governor, args.out_root))
+
+        # Цикл узла в отдельном потоке, чтобы Ctrl+C приходил в главный и мог остановить ffmpeg
+        node = threading.Thread(target=work, name="node")
+        node.start()
+        interrupted = False
+        try:
+            while node.is_alive():
+                node.join(1.0)
+        except KeyboardInterrupt:
+            # Текущие задания прерываются и возвращаются координатору в очередь
+            interrupted = True
+            stop_event.set()
+            cancel_all(wait=True)
+            node.join()
+        if output_cache is not None:
+            output_cache.close()
+        if metrics is not None:
+            metrics.close()
+        emit({"status": "cancelled" if interrupted else "done", **counts})
+    return 130 if interrupted else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,6 @@
+# tests/conftest.py
+import os
+import sys
+
+# Модули импортируются как utils.* из корня репозитория (как в cli.py и bench.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,29 @@
+# tests/test_chunked.py
+from utils.chunked import pick_cut_points
+from utils.constants import CHUNK_MIN_LENGTH
+
+
+def test_cuts_on_keyframes_nearest_to_even_split():
+    keyframes = [float(t) for t in range(0, 60, 2)]
+    assert pick_cut_points(keyframes, 0.0, 60.0, 3) == [0.0, 20.0, 40.0, 60.0]
+
+
+def test_picks_closest_keyframe_around_ideal_point():
+    keyframes = [0.0, 13.0, 31.0, 47.0]
+    assert pick_cut_points(keyframes, 0.0, 60.0, 2) == [0.0, 31.0, 60.0]
+
+
+def test_bounds_are_relative_to_segment():
+    keyframes = [float(t) for t in range(0, 200, 5)]
+    assert pick_cut_points(keyframes, 100.0, 160.0, 2) == [100.0, 130.0, 160.0]
+
+
+def test_skips_cuts_that_make_too_short_chunks():
+    keyframes = [float(t) for t in range(0, 20, 2)]
+    bounds = pick_cut_points(keyframes, 0.0, 20.0, 4)
+    assert bounds == [0.0, 10.0, 20.0]
+    assert all(b - a >= CHUNK_MIN_LENGTH for a, b in zip(bounds, bounds[1:]))
+
+
+def test_no_keyframes_inside_gives_single_chunk():
+    assert pick_cut_points([0.0], 0.0, 60.0, 4) == [0.0, 60.0]
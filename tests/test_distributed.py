@@ -0,0 +1,131 @@
+# tests/test_distributed.py
+import pytest
+
+import utils.distributed as distributed
+from utils.distributed import Coordinator, is_loopback
+from utils.jobs import Job, normalize_job_options
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(distributed, "time", fake)
+    return fake
+
+
+def make_coordinator(count=2, **kwargs):
+    jobs = [Job(f"in{i}.mp4", f"out{i}.mp4") for i in range(count)]
+    events = []
+    coordinator = Coordinator(jobs, normalize_job_options({}), lease_seconds=10.0,
+                              on_event=events.append, **kwargs)
+    return coordinator, events
+
+
+def test_expired_lease_returns_job_to_front_of_queue(clock):
+    coordinator, _ = make_coordinator()
+    first = coordinator.lease("node-a")
+    assert first["job"]["out_path"] == "out0.mp4"
+    clock.now += 11.0
+    again = coordinator.lease("node-b")
+    assert again["job"]["out_path"] == "out0.mp4"
+    assert not coordinator.heartbeat(first["lease"])
+    assert not coordinator.complete(first["lease"], {})
+
+
+def test_heartbeat_extends_lease(clock):
+    coordinator, _ = make_coordinator()
+    leased = coordinator.lease("node-a")
+    clock.now += 8.0
+    assert coordinator.heartbeat(leased["lease"], {"fraction": 0.5})
+    clock.now += 8.0
+    assert coordinator.lease("node-b")["job"]["out_path"] == "out1.mp4"
+    assert coordinator.complete(leased["lease"], {"elapsed": 1.0})
+
+
+def test_job_fails_after_max_attempts(clock):
+    coordinator, events = make_coordinator(count=1, max_attempts=2)
+    for _ in range(2):
+        assert coordinator.lease("node-a")["job"] is not None
+        clock.now += 11.0
+    status = coordinator.status()
+    assert status["counts"] == {"failed": 1}
+    assert status["finished"]
+    assert events == [{"status": "error", "input": "in0.mp4", "output": "out0.mp4", "error": "lease expired"}]
+    assert coordinator.lease("node-a") == {"job": None, "finished": True}
+
+
+def test_requeued_failure_does_not_count_attempt(clock):
+    coordinator, _ = make_coordinator(count=1, max_attempts=1)
+    leased = coordinator.lease("node-a")
+    assert coordinator.fail(leased["lease"], "node stopped", requeue=True)
+    leased = coordinator.lease("node-b")
+    assert leased["job"]["out_path"] == "out0.mp4"
+    assert coordinator.complete(leased["lease"], {})
+    assert coordinator.all_done.is_set()
+
+
+def test_loopback_hosts():
+    assert is_loopback("127.0.0.1")
+    assert is_loopback("localhost")
+    assert is_loopback("::1")
+    assert not is_loopback("0.0.0.0")
+
+
+class FakeClient:
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.completed = []
+        self.failed = []
+
+    def lease(self, node):
+        return self.replies.pop(0) if self.replies else {"job": None, "finished": True}
+
+    def complete(self, lease, result):
+        self.completed.append(lease)
+
+    def fail(self, lease, error, requeue=False):
+        self.failed.append((lease, requeue))
+
+
+def test_node_runs_job_again_after_lost_lease(tmp_path, monkeypatch):
+    out_path = str(tmp_path / "out.mp4")
+    job = {"in_path": str(tmp_path / "in.mp4"), "out_path": out_path}
+    options = normalize_job_options({})
+    client = FakeClient([{"job": job, "lease": lease, "options": options, "lease_seconds": 30.0}
+                         for lease in ("first", "second")])
+
+    class LostOnFirstLease:
+        def __init__(self, client, lease, job, interval):
+            self.lost = lease == "first"
+            if self.lost:
+                distributed.cancel_job(job.out_path)
+
+        def update(self, stats):
+            pass
+
+        def stop(self):
+            pass
+
+    def fake_run_job(job, options, **kwargs):
+        if distributed.registry.is_cancelled(job.out_path):
+            raise distributed.Cancelled("Задание отменено")
+        return {"output": job.out_path}
+
+    monkeypatch.setattr(distributed, "_Heartbeat", LostOnFirstLease)
+    monkeypatch.setattr(distributed, "run_job", fake_run_job)
+    counts = distributed.run_node(client, slots=1, output_roots=[str(tmp_path)])
+    assert counts == {"ok": 1, "failed": 0, "lost": 1}
+    assert client.completed == ["second"]
+    assert client.failed == []
+    assert not distributed.registry.is_cancelled(out_path)
@@ -0,0 +1,47 @@
+# tests/test_filter_graph.py
+from utils.filter_graph import Branch, ColorChain, VideoGraphBuilder, merge_linear_chains, split_filter_chain
+
+REELS = (1080, 1920)
+
+
+def test_split_keeps_quoted_commas():
+    chain = "eq=brightness=0.1,scale='min(iw,2)':'min(ih,3)',hue=s=0"
+    assert split_filter_chain(chain) == ["eq=brightness=0.1", "scale='min(iw,2)':'min(ih,3)'", "hue=s=0"]
+
+
+def test_merges_linear_chain():
+    assert merge_linear_chains(["[0:v]a[x]", "[x]b[y]", "[y]c[out]"]) == ["[0:v]a,b,c[out]"]
+
+
+def test_does_not_merge_through_split():
+    parts = ["[0:v]split=2[a][b]", "[a]f[o1]", "[b]g[o2]"]
+    assert merge_linear_chains(parts) == parts
+
+
+def test_format_and_color_fuse_into_one_chain():
+    parts, labels = VideoGraphBuilder("[0:v]", 1920, 1080, REELS).build(
+        [Branch(ColorChain.from_exprs(["hue=s=0"]), 1.0, 1.0)])
+    assert labels == ["[vout]"]
+    assert parts == ["[0:v]scale=1080:608:flags=bicubic,hue=s=0,"
+                     "pad=1080:1920:(ow-iw)/2:(oh-ih)/2:color=black,format=pix_fmts=yuv420p[vout]"]
+
+
+def test_zoom_merges_into_single_scale_and_crop():
+    parts, _ = VideoGraphBuilder("[0:v]", 1920, 1080, REELS).build([Branch(ColorChain(), 1.2, 1.0)])
+    assert len(parts) == 1
+    assert parts[0].count("scale=") == 1
+    assert "crop=1080:728" in parts[0]
+
+
+def test_original_format_without_changes_only_converts_pixels():
+    parts, labels = VideoGraphBuilder("[0:v]", 1920, 1080, None).build([Branch(ColorChain(), 1.0, 1.0)])
+    assert parts == ["[0:v]format=pix_fmts=yuv420p[vout]"]
+
+
+def test_variants_share_one_split():
+    parts, labels = VideoGraphBuilder("[0:v]", 1920, 1080, REELS).build(
+        [Branch(ColorChain(), 1.2, 1.0), Branch(ColorChain(), 1.0, 1.25)])
+    assert labels == ["[vout0]", "[vout1]"]
+    assert parts[0] == "[0:v]split=2[vsrc0][vsrc1]"
+    assert len(parts) == 3
+    assert "setpts=PTS/1.25" in parts[2]
@@ -0,0 +1,38 @@
+# tests/test_governor.py
+import pytest
+
+import utils.governor as governor
+from utils.governor import Governor
+from utils.jobs import Job, normalize_job_options
+
+
+@pytest.fixture
+def eight_cores(monkeypatch):
+    monkeypatch.setattr(governor, "_allowed_cores", lambda: list(range(8)))
+    monkeypatch.setattr(governor, "GOVERNOR_RESERVED_CORES", 0)
+
+
+def test_chunked_grant_gets_cores_of_all_its_slots(eight_cores):
+    gov = Governor(4)
+    assert gov.threads == 2
+    with gov.admit(Job("in.mp4", "out.mp4"), normalize_job_options({}), processes=3) as grant:
+        assert grant.slots == 3
+        assert grant.threads == 3 * gov.threads
+        assert grant.cores == (0, 1, 2, 3, 4, 5)
+        assert grant.filter_threads == gov.threads
+    assert gov._running == 0
+    assert gov._free == list(range(8))
+
+
+def test_chunked_grant_is_capped_by_max_jobs(eight_cores):
+    gov = Governor(2)
+    with gov.admit(Job("in.mp4", "out.mp4"), normalize_job_options({}), processes=4) as grant:
+        assert grant.slots == 2
+        assert grant.threads == 8
+        assert grant.filter_threads == 2
+
+
+def test_no_room_for_all_slots_of_chunked_job(eight_cores):
+    gov = Governor(4)
+    with gov.admit(Job("a.mp4", "a_out.mp4"), normalize_job_options({}), processes=2):
+        assert not gov._can_admit(0, 3)
@@ -0,0 +1,46 @@
+# tests/test_input_queue.py
+import os
+
+from utils.input_queue import InputQueue, normalize_path
+
+
+def test_keeps_order_and_skips_duplicates(tmp_path):
+    a, b = str(tmp_path / "a.mp4"), str(tmp_path / "b.mp4")
+    queue = InputQueue([a, b])
+    assert queue.extend([b, a, str(tmp_path / "c.mp4")]) == [str(tmp_path / "c.mp4")]
+    assert list(queue) == [a, b, str(tmp_path / "c.mp4")]
+
+
+def test_duplicate_by_normalized_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    queue = InputQueue(["a.mp4"])
+    assert not queue.add(os.path.join(str(tmp_path), "sub", "..", "a.mp4"))
+    assert str(tmp_path / "a.mp4") in queue
+    assert normalize_path("a.mp4") == os.path.normcase(str(tmp_path / "a.mp4"))
+
+
+def test_remove_by_any_spelling_of_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    queue = InputQueue(["a.mp4", "b.mp4", "c.mp4"])
+    queue.remove(str(tmp_path / "b.mp4"))
+    queue.remove("missing.mp4")
+    assert list(queue) == ["a.mp4", "c.mp4"]
+    queue.remove_many(["a.mp4", "c.mp4"])
+    assert len(queue) == 0
+
+
+def test_removed_file_can_be_added_again(tmp_path):
+    path = str(tmp_path / "a.mp4")
+    queue = InputQueue([path])
+    queue.remove(path)
+    assert queue.add(path)
+    queue.clear()
+    assert path not in queue
+
+
+def test_iteration_survives_removal(tmp_path):
+    paths = [str(tmp_path / f"{i}.mp4") for i in range(3)]
+    queue = InputQueue(paths)
+    for path in queue:
+        queue.remove(path)
+    assert len(queue) == 0
@@ -0,0 +1,98 @@
+# tests/test_jobs.py
+import hashlib
+import os
+
+import pytest
+
+import utils.jobs as jobs
+from utils.jobs import Job, job_cache_key, job_seed, normalize_job_options
+from utils.journal import partial_path
+from utils.probe import MediaInfo, file_hash
+
+
+@pytest.fixture(autouse=True)
+def hash_without_ffprobe(monkeypatch):
+    # content_hash берёт хэш из кэша ffprobe; здесь считаем его напрямую
+    monkeypatch.setattr(jobs, "content_hash", file_hash)
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "in.mp4"
+    path.write_bytes(b"a" * 5000)
+    return str(path)
+
+
+def test_file_hash_covers_whole_file(tmp_path):
+    data = bytes(range(256)) * 40
+    path = tmp_path / "f.bin"
+    path.write_bytes(data)
+    assert file_hash(str(path), block=1000) == hashlib.sha256(data).hexdigest()
+
+
+def test_file_hash_differs_for_same_size_files(tmp_path):
+    first, second = tmp_path / "a.bin", tmp_path / "b.bin"
+    first.write_bytes(b"x" * 3000 + b"1" + b"x" * 3000)
+    second.write_bytes(b"x" * 3000 + b"2" + b"x" * 3000)
+    assert file_hash(str(first)) != file_hash(str(second))
+
+
+def test_media_info_ignores_unknown_cached_fields():
+    info = MediaInfo.from_dict({"path": "in.mp4", "content_hash": "old", "file_hash": "new"})
+    assert info.file_hash == "new"
+
+
+def test_seed_depends_on_content_segment_and_seed(video, tmp_path):
+    options = normalize_job_options({})
+    seed = job_seed(Job(video, "out.mp4"), options)
+    assert seed == job_seed(Job(video, "other.mp4"), options)
+    assert seed != job_seed(Job(video, "out.mp4", start=10.0, duration=5.0), options)
+    assert seed != job_seed(Job(video, "out.mp4"), normalize_job_options({"seed": 7}))
+    changed = tmp_path / "changed.mp4"
+    changed.write_bytes(b"b" * 5000)
+    assert seed != job_seed(Job(str(changed), "out.mp4"), options)
+
+
+def test_cache_key_depends_on_options_and_overlay(video, tmp_path):
+    job = Job(video, "out.mp4")
+    options = normalize_job_options({})
+    key = job_cache_key(job, options, 1)
+    assert key == job_cache_key(job, normalize_job_options({}), 1)
+    assert key != job_cache_key(job, options, 2)
+    assert key != job_cache_key(job, normalize_job_options({"mute_audio": True}), 1)
+
+    overlay = tmp_path / "logo.png"
+    overlay.write_bytes(b"logo")
+    with_overlay = normalize_job_options({"overlay_file": str(overlay)})
+    before = job_cache_key(job, with_overlay, 1)
+    overlay.write_bytes(b"LOGO")
+    assert before != job_cache_key(job, with_overlay, 1)
+
+
+def test_partial_names_differ_per_lease(tmp_path):
+    out_path = str(tmp_path / "out.mp4")
+    names = {partial_path(out_path), partial_path(out_path, "lease1"), partial_path(out_path, "lease2")}
+    assert len(names) == 3
+    assert all(os.path.dirname(name) == str(tmp_path) and name.endswith(".mp4") for name in names)
+
+
+def test_fixed_seed_does_not_hash_input(video, monkeypatch):
+    def no_hashing(path):
+        raise AssertionError("input must not be hashed")
+
+    monkeypatch.setattr(jobs, "content_hash", no_hashing)
+    options = normalize_job_options({"seed": 7})
+    assert job_seed(Job(video, "out.mp4"), options) == job_seed(Job(video, "other.mp4"), options)
+    assert job_seed(Job(video, "out.mp4"), options) != job_seed(Job(video, "out.mp4", start=5.0), options)
+
+
+def test_segments_cover_whole_input():
+    info = MediaInfo(path="in.mp4", duration=25.0)
+    assert list(jobs.plan_segments("in.mp4", 10.0, info)) == [(0.0, 10.0), (10.0, 10.0), (20.0, 5.0)]
+
+
+def test_short_remainder_joins_previous_segment():
+    info = MediaInfo(path="in.mp4", duration=20.3)
+    segments = list(jobs.plan_segments("in.mp4", 10.0, info))
+    assert len(segments) == 2
+    assert segments[-1] == (10.0, pytest.approx(10.3))
@@ -0,0 +1,59 @@
+# tests/test_preview.py
+import os
+import platform
+import threading
+import time
+
+import pytest
+
+import utils.preview as preview
+from utils.cancellation import Cancelled
+from utils.preview import PreviewCancel
+
+pytestmark = pytest.mark.skipif(platform.system() == "Windows", reason="ffmpeg подменяется sh-скриптом")
+
+
+@pytest.fixture
+def slow_ffmpeg(tmp_path, monkeypatch):
+    script = tmp_path / "ffmpeg"
+    script.write_text("#!/bin/sh\nsleep 5\n")
+    os.chmod(script, 0o755)
+    monkeypatch.setattr(preview, "FFMPEG_PATH_EFFECTIVE", str(script))
+
+
+def run_in_thread(cancel):
+    outcome = []
+
+    def target():
+        try:
+            preview._ffmpeg([], "in.mp4", cancel)
+            outcome.append("done")
+        except Cancelled:
+            outcome.append("cancelled")
+
+    thread = threading.Thread(target=target)
+    thread.start()
+    return thread, outcome
+
+
+def test_cancel_stops_only_its_own_render(slow_ffmpeg):
+    old, new = PreviewCancel(), PreviewCancel()
+    old_thread, old_outcome = run_in_thread(old)
+    new_thread, new_outcome = run_in_thread(new)
+    time.sleep(0.3)
+    started = time.monotonic()
+    old.cancel()
+    old_thread.join(2.0)
+    assert old_outcome == ["cancelled"]
+    assert time.monotonic() - started < 2.0
+    assert new_thread.is_alive()
+    new.cancel()
+    new_thread.join(2.0)
+    assert new_outcome == ["cancelled"]
+
+
+def test_cancelled_token_does_not_start_ffmpeg(slow_ffmpeg):
+    cancel = PreviewCancel()
+    cancel.cancel()
+    with pytest.raises(Cancelled):
+        preview._ffmpeg([], "in.mp4", cancel)
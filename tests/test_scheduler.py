@@ -0,0 +1,50 @@
+# tests/test_scheduler.py
+import pytest
+
+from utils.jobs import Job, normalize_job_options
+from utils.probe import MediaInfo
+from utils.scheduler import order_jobs, plan_costs
+
+
+def make_job(name: str, duration: float, width: int = 1920, height: int = 1080) -> Job:
+    info = MediaInfo(path=f"{name}.mp4", width=width, height=height, duration=duration)
+    return Job(f"{name}.mp4", f"out/{name}.mp4", info=info)
+
+
+@pytest.fixture
+def options():
+    return normalize_job_options({"filters": ["Черно-белое"]})
+
+
+def test_cost_grows_with_length_and_frame_size(options):
+    short, long_, small = make_job("short", 10.0), make_job("long", 60.0), make_job("small", 60.0, 640, 360)
+    costs = plan_costs([short, long_, small], options)
+    assert costs["out/long.mp4"] == pytest.approx(costs["out/short.mp4"] * 6)
+    assert costs["out/small.mp4"] < costs["out/long.mp4"]
+
+
+def test_unknown_jobs_get_mean_of_known(options):
+    known = [make_job("a", 10.0), make_job("b", 30.0)]
+    unknown = Job("c.mp4", "out/c.mp4")
+    costs = plan_costs(known + [unknown], options)
+    assert costs["out/c.mp4"] == pytest.approx((costs["out/a.mp4"] + costs["out/b.mp4"]) / 2)
+
+
+def test_all_unknown_jobs_cost_the_same(options):
+    costs = plan_costs([Job("a.mp4", "out/a.mp4"), Job("b.mp4", "out/b.mp4")], options)
+    assert costs == {"out/a.mp4": 1.0, "out/b.mp4": 1.0}
+
+
+def test_order_policies(options):
+    jobs = [make_job("mid", 30.0), make_job("long", 60.0), make_job("short", 10.0)]
+    costs = plan_costs(jobs, options)
+    assert [j.out_path for j in order_jobs(jobs, costs, "longest")] == ["out/long.mp4", "out/mid.mp4", "out/short.mp4"]
+    assert [j.out_path for j in order_jobs(jobs, costs, "shortest")] == ["out/short.mp4", "out/mid.mp4", "out/long.mp4"]
+    assert order_jobs(jobs, costs, "fifo") == jobs
+
+
+def test_order_is_stable_for_equal_costs():
+    jobs = [Job("a.mp4", "a"), Job("b.mp4", "b"), Job("c.mp4", "c")]
+    costs = {"a": 1.0, "b": 1.0, "c": 1.0}
+    assert order_jobs(jobs, costs, "longest") == jobs
+    assert order_jobs(jobs, costs, "shortest") == jobs
@@ -0,0 +1,27 @@
+# tests/test_smart_cut.py
+from utils.smart_cut import CutPlan, plan_smart_cut
+
+KEYFRAMES = [0.0, 2.0, 4.0, 6.0, 8.0]
+
+
+def test_copies_whole_gops_inside_segment():
+    assert plan_smart_cut(KEYFRAMES, 1.0, 7.5) == CutPlan(1.0, 2.0, 6.0, 7.5)
+
+
+def test_segment_on_keyframes_is_copied_without_edges():
+    assert plan_smart_cut(KEYFRAMES, 2.0, 6.0) == CutPlan(2.0, 2.0, 6.0, 6.0)
+
+
+def test_keyframe_timestamps_within_rounding_count_as_on_the_edge():
+    assert plan_smart_cut(KEYFRAMES, 2.0002, 7.0) == CutPlan(2.0002, 2.0002, 6.0, 7.0)
+
+
+def test_segment_to_end_of_file_copies_through_the_end():
+    assert plan_smart_cut(KEYFRAMES, 1.0, 9.0, total=9.0) == CutPlan(1.0, 2.0, 9.0, 9.0)
+
+
+def test_nothing_to_copy():
+    assert plan_smart_cut([0.0, 10.0], 1.0, 5.0) is None
+    assert plan_smart_cut(KEYFRAMES, 3.0, 5.5) is None
+    assert plan_smart_cut(KEYFRAMES, 1.0, 7.5, min_copy=5.0) is None
+    assert plan_smart_cut([], 1.0, 7.5) is None
@@ -4,8 +4,8 @@ import sys
 import random
 import tempfile
 from typing import List
-from PyQt5.QtCore import Qt, QPoint, pyqtSignal
-from PyQt5.QtGui import QFontMetrics, QIcon
+from PyQt5.QtCore import Qt, QPoint, QTimer, pyqtSignal
+from PyQt5.QtGui import QFontMetrics, QIcon, QPixmap
 from PyQt5.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QLabel,
     QPushButton, QListWidget, QAbstractItemView, QFileDialog, QSpinBox,
@@ -13,8 +13,16 @@ from PyQt5.QtWidgets import (
     QGroupBox, QRadioButton, QButtonGroup, QCheckBox, QListWidgetItem, QMenu
 )
 from workers.worker import Worker
-from utils.file_utils import is_video_file, find_videos_in_folder
-from utils.constants import FILTERS, OVERLAY_POSITIONS, REELS_FORMAT_NAME
+from workers.folder_scanner import FolderScanner
+from workers.preview import PreviewRenderer
+from utils.file_utils import is_video_file
+from utils.input_queue import InputQueue
+from utils.jobs import normalize_job_options
+from utils.constants import (
+    FILTERS, OVERLAY_POSITIONS, REELS_FORMAT_NAME, DEFAULT_PARALLEL_JOBS, MAX_PARALLEL_JOBS,
+    BLUR_QUALITY_LEVELS, DEFAULT_BLUR_QUALITY, BLUR_REUSE_MAX_FRAMES, GIF_DEFAULT_LOOPS, GIF_MAX_DURATION,
+    CANCEL_GRACE_SECONDS, SCHEDULE_POLICIES, PREVIEW_FPS, PREVIEW_DEBOUNCE_MS
+)
 
 OUTPUT_FORMATS = [
     "Оригинальный",
@@ -39,7 +47,8 @@ OUTPUT_FORMATS = [
 
 
 class DropListWidget(QListWidget):
-    files_dropped = pyqtSignal()
+    # Число файлов в списке и идёт ли ещё поиск по папкам
+    count_changed = pyqtSignal(int, bool)
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -47,6 +56,10 @@ class DropListWidget(QListWidget):
         self.setDragEnabled(False)
         self.setSelectionMode(QAbstractItemView.ExtendedSelection)
         self.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.queue = InputQueue()
+        self.scanners = []
+        # Пачки от сканеров, запущенных до очистки списка, отбрасываются
+        self.scan_generation = 0
 
     def dragEnterEvent(self, event):
         if event.mimeData().hasUrls():
@@ -63,29 +76,83 @@ class DropListWidget(QListWidget):
     def dropEvent(self, event):
         if event.mimeData().hasUrls():
             event.acceptProposedAction()
-            added = False
+            folders, files = [], []
             for url in event.mimeData().urls():
                 fp = url.toLocalFile()
                 if os.path.isdir(fp):
-                    for v in find_videos_in_folder(fp):
-                        if is_video_file(v) and not self.is_already_added(v):
-                            it = QListWidgetItem(v)
-                            it.setData(Qt.UserRole, v)
-                            self.addItem(it)
-                            added = True
-                else:
-                    if (is_video_file(fp) or fp.lower().endswith('.gif')) and not self.is_already_added(fp):
-                        it = QListWidgetItem(fp)
-                        it.setData(Qt.UserRole, fp)
-                        self.addItem(it)
-                        added = True
-            if added:
-                self.files_dropped.emit()
+                    folders.append(fp)
+                elif (is_video_file(fp) or fp.lower().endswith('.gif')) and not self.is_already_added(fp):
+                    files.append(fp)
+            self.add_paths(files)
+            if folders:
+                self.scan_folders(folders)
         else:
             event.ignore()
 
     def is_already_added(self, file_path):
-        return any(self.item(i).data(Qt.UserRole) == file_path for i in range(self.count()))
+        return file_path in self.queue
+
+    def is_scanning(self):
+        return bool(self.scanners)
+
+    def add_paths(self, paths):
+        """Добавляет в конец списка новые файлы; уже добавленные пропускаются. Возвращает число добавленных."""
+        new = self.queue.extend(paths)
+        if not new:
+            return 0
+        start = self.count()
+        self.setUpdatesEnabled(False)
+        for i, f in enumerate(new, start + 1):
+            it = QListWidgetItem(f"{i}. {os.path.basename(f)}")
+            it.setData(Qt.UserRole, f)
+            self.addItem(it)
+        self.setUpdatesEnabled(True)
+        self.count_changed.emit(len(self.queue), self.is_scanning())
+        return len(new)
+
+    def scan_folders(self, folders, include_gifs=False):
+        scanner = FolderScanner(folders, include_gifs=include_gifs)
+        generation = self.scan_generation
+        scanner.batch_found.connect(
+            lambda batch: self.add_paths(batch) if generation == self.scan_generation else None
+        )
+        scanner.scan_finished.connect(lambda _found: self.on_scan_finished(scanner))
+        self.scanners.append(scanner)
+        scanner.start()
+        self.count_changed.emit(len(self.queue), True)
+
+    def on_scan_finished(self, scanner):
+        if scanner in self.scanners:
+            self.scanners.remove(scanner)
+        self.count_changed.emit(len(self.queue), self.is_scanning())
+
+    def stop_scanning(self, wait_ms=0):
+        self.scan_generation += 1
+        for scanner in self.scanners:
+            scanner.stop()
+            if wait_ms:
+                scanner.wait(wait_ms)
+
+    def remove_selected(self):
+        # Номера строк берутся из индексов выделения: row(item) для каждого элемента — линейный поиск
+        rows = sorted({index.row() for index in self.selectedIndexes()}, reverse=True)
+        if not rows:
+            return
+        self.queue.remove_many(self.item(row).data(Qt.UserRole) for row in rows)
+        self.setUpdatesEnabled(False)
+        for row in rows:
+            self.takeItem(row)
+        self.setUpdatesEnabled(True)
+        self.count_changed.emit(len(self.queue), self.is_scanning())
+
+    def clear_all(self):
+        self.stop_scanning()
+        self.clear()
+        self.queue.clear()
+        self.count_changed.emit(0, self.is_scanning())
+
+    def files(self) -> List[str]:
+        return list(self.queue)
 
 
 class MainProcessingWidget(QWidget):
@@ -115,11 +182,31 @@ class MainProcessingWidget(QWidget):
         self.video_list_widget.customContextMenuRequested.connect(self.on_list_menu)
         self.left_panel.addWidget(self.video_list_widget)
 
+        self.list_count_label = QLabel("Файлов: 0")
+        self.left_panel.addWidget(self.list_count_label)
+
         dnd_label = QLabel("Перетащите файлы или папки сюда")
         dnd_label.setAlignment(Qt.AlignCenter)
         dnd_label.setStyleSheet("color: gray; font-style: italic;")
         self.left_panel.addWidget(dnd_label)
 
+        self.preview_group = QGroupBox("Предпросмотр")
+        self.preview_group.setCheckable(True)
+        self.preview_group.setToolTip(
+            "Несколько секунд выбранного файла с текущими настройками в уменьшенном размере.\n"
+            "Случайные zoom, скорость и фильтры те же, что получит файл при обработке.")
+        pv = QVBoxLayout()
+        self.preview_group.setLayout(pv)
+        self.preview_label = QLabel()
+        self.preview_label.setAlignment(Qt.AlignCenter)
+        self.preview_label.setMinimumHeight(220)
+        pv.addWidget(self.preview_label)
+        self.preview_status = QLabel("Выберите файл в списке")
+        self.preview_status.setStyleSheet("color: gray;")
+        self.preview_status.setWordWrap(True)
+        pv.addWidget(self.preview_status)
+        self.left_panel.addWidget(self.preview_group)
+
         self.ly.addLayout(self.left_panel, 3)
 
         self.right_panel = QVBoxLayout()
@@ -143,6 +230,75 @@ class MainProcessingWidget(QWidget):
         split_layout.addWidget(self.split_duration_spin)
         cl.addLayout(split_layout)
 
+        parallel_layout = QHBoxLayout()
+        parallel_layout.addWidget(QLabel("Параллельно файлов:"))
+        self.parallel_jobs_spin = QSpinBox()
+        self.parallel_jobs_spin.setRange(1, MAX_PARALLEL_JOBS)
+        self.parallel_jobs_spin.setValue(DEFAULT_PARALLEL_JOBS)
+        self.parallel_jobs_spin.setFixedWidth(80)
+        self.parallel_jobs_spin.setToolTip("Сколько файлов обрабатывать одновременно. Ядра процессора делятся между ними поровну.")
+        parallel_layout.addWidget(self.parallel_jobs_spin)
+        parallel_layout.addStretch()
+        parallel_layout.addWidget(QLabel("Вариантов на файл:"))
+        self.variants_spin = QSpinBox()
+        self.variants_spin.setRange(1, 50)
+        self.variants_spin.setValue(1)
+        self.variants_spin.setFixedWidth(80)
+        self.variants_spin.setToolTip(
+            "Сколько разных копий сделать из каждого файла. Все копии кодируются за одно "
+            "декодирование исходника, у каждой свои zoom, скорость и случайные фильтры.")
+        parallel_layout.addWidget(self.variants_spin)
+        cl.addLayout(parallel_layout)
+
+        schedule_layout = QHBoxLayout()
+        schedule_layout.addWidget(QLabel("Порядок обработки:"))
+        self.schedule_combo = QComboBox()
+        self.schedule_combo.addItems(SCHEDULE_POLICIES.keys())
+        self.schedule_combo.setToolTip(
+            "Порядок по оценке времени обработки (длительность, разрешение, выбранные эффекты).\n"
+            "Сначала длинные — весь пакет заканчивается раньше, без долгого файла в конце.\n"
+            "Сначала короткие — первые готовые файлы появляются быстрее.")
+        schedule_layout.addWidget(self.schedule_combo)
+        schedule_layout.addStretch()
+        self.governor_checkbox = QCheckBox("Следить за нагрузкой")
+        self.governor_checkbox.setChecked(True)
+        self.governor_checkbox.setToolTip(
+            "Новый файл запускается, только когда для него есть свободные ядра и память.\n"
+            "Каждому ffmpeg выделяются свои ядра (одно остаётся интерфейсу) и пониженный приоритет.")
+        schedule_layout.addWidget(self.governor_checkbox)
+        cl.addLayout(schedule_layout)
+
+        self.chunk_parallel_checkbox = QCheckBox("Кодировать длинные видео кусками параллельно")
+        self.chunk_parallel_checkbox.setToolTip(
+            "Длинное видео делится по ключевым кадрам на куски, которые кодируются одновременно "
+            "и склеиваются без перекодирования.")
+        cl.addWidget(self.chunk_parallel_checkbox)
+
+        self.resume_checkbox = QCheckBox("Продолжить прерванную обработку")
+        self.resume_checkbox.setToolTip(
+            "Пропустить файлы, уже готовые в выходной папке после прошлого запуска "
+            "(по журналу обработки), и удалить недописанные результаты.")
+        cl.addWidget(self.resume_checkbox)
+
+        cache_layout = QHBoxLayout()
+        self.output_cache_checkbox = QCheckBox("Брать готовые результаты из кэша")
+        self.output_cache_checkbox.setChecked(True)
+        self.output_cache_checkbox.setToolTip(
+            "Если тот же файл уже обрабатывался с теми же настройками, результат берётся "
+            "из кэша (папка cache/outputs) без повторного кодирования.")
+        cache_layout.addWidget(self.output_cache_checkbox)
+        cache_layout.addStretch()
+        cache_layout.addWidget(QLabel("Seed:"))
+        self.seed_spin = QSpinBox()
+        self.seed_spin.setRange(0, 999999)
+        self.seed_spin.setSpecialValueText("авто")
+        self.seed_spin.setFixedWidth(80)
+        self.seed_spin.setToolTip(
+            "Случайные zoom, скорость и фильтры выбираются по содержимому файла и seed. "
+            "Смените seed, чтобы получить другие варианты тех же файлов.")
+        cache_layout.addWidget(self.seed_spin)
+        cl.addLayout(cache_layout)
+
         self.strip_meta_checkbox = QCheckBox("Очистить метаданные")
         self.strip_meta_checkbox.setChecked(True)
         sm_layout.addWidget(self.strip_meta_checkbox)
@@ -167,7 +323,27 @@ class MainProcessingWidget(QWidget):
         self.blur_background_checkbox = QCheckBox("Размыть фон")
         self.blur_background_checkbox.setToolTip("Заполняет черные полосы размытой версией видео (только для Reels)")
         self.blur_background_checkbox.setEnabled(False)
+        self.blur_background_checkbox.toggled.connect(self.on_blur_background_toggled)
         fmt_layout.addWidget(self.blur_background_checkbox)
+        blur_layout = QHBoxLayout()
+        blur_layout.addWidget(QLabel("Качество фона:"))
+        self.blur_quality_combo = QComboBox()
+        self.blur_quality_combo.addItems(list(BLUR_QUALITY_LEVELS))
+        self.blur_quality_combo.setCurrentText(DEFAULT_BLUR_QUALITY)
+        self.blur_quality_combo.setToolTip(
+            "Фон размывается на уменьшенной копии кадра и растягивается обратно. "
+            "Чем быстрее режим, тем меньше копия; на сильном размытии разница почти не видна.")
+        blur_layout.addWidget(self.blur_quality_combo)
+        blur_layout.addWidget(QLabel("Обновлять раз в кадров:"))
+        self.blur_reuse_spin = QSpinBox()
+        self.blur_reuse_spin.setRange(1, BLUR_REUSE_MAX_FRAMES)
+        self.blur_reuse_spin.setValue(1)
+        self.blur_reuse_spin.setFixedWidth(60)
+        self.blur_reuse_spin.setToolTip(
+            "Один размытый фон на несколько кадров подряд. Подходит для статичных сцен, "
+            "на динамичных фон может заметно запаздывать.")
+        blur_layout.addWidget(self.blur_reuse_spin)
+        fmt_layout.addLayout(blur_layout)
         self.right_panel.addWidget(fmt_group)
 
         filter_group = QGroupBox("Фильтры")
@@ -296,6 +472,30 @@ class MainProcessingWidget(QWidget):
         og.addLayout(row_pos)
         self.right_panel.addWidget(overlay_group)
 
+        gif_group = QGroupBox("GIF")
+        gl = QVBoxLayout()
+        gif_group.setLayout(gl)
+        gif_row = QHBoxLayout()
+        gif_row.addWidget(QLabel("Повторов:"))
+        self.gif_loops_spin = QSpinBox()
+        self.gif_loops_spin.setRange(1, 100)
+        self.gif_loops_spin.setValue(GIF_DEFAULT_LOOPS)
+        self.gif_loops_spin.setFixedWidth(60)
+        gif_row.addWidget(self.gif_loops_spin)
+        gif_row.addWidget(QLabel("или длительность (сек):"))
+        self.gif_duration_spin = QSpinBox()
+        self.gif_duration_spin.setRange(0, int(GIF_MAX_DURATION))
+        self.gif_duration_spin.setSpecialValueText("нет")
+        self.gif_duration_spin.setFixedWidth(70)
+        self.gif_duration_spin.setToolTip("Если задана, GIF повторяется до этой длительности вместо числа повторов.")
+        gif_row.addWidget(self.gif_duration_spin)
+        gif_row.addStretch()
+        gl.addLayout(gif_row)
+        self.gif_silent_audio_checkbox = QCheckBox("Добавлять тихую звуковую дорожку")
+        self.gif_silent_audio_checkbox.setToolTip("Для площадок, которые не принимают видео без звука.")
+        gl.addWidget(self.gif_silent_audio_checkbox)
+        self.right_panel.addWidget(gif_group)
+
         mute_group = QGroupBox("Аудио")
         mg = QVBoxLayout()
         mute_group.setLayout(mg)
@@ -307,6 +507,17 @@ class MainProcessingWidget(QWidget):
         self.process_button.setFixedHeight(40)
         self.right_panel.addWidget(self.process_button)
 
+        cancel_row = QHBoxLayout()
+        self.cancel_button = QPushButton("Отменить всё")
+        self.cancel_button.setToolTip("Остановить пакет: запущенные ffmpeg завершаются, недописанные файлы удаляются.")
+        self.cancel_job_button = QPushButton("Отменить файл...")
+        self.cancel_job_button.setToolTip("Остановить одно из выполняющихся заданий, остальные продолжат работу.")
+        self.cancel_button.setEnabled(False)
+        self.cancel_job_button.setEnabled(False)
+        cancel_row.addWidget(self.cancel_button)
+        cancel_row.addWidget(self.cancel_job_button)
+        self.right_panel.addLayout(cancel_row)
+
         self.progress_label = QLabel("")
         self.progress_bar = QProgressBar()
         self.progress_bar.setValue(0)
@@ -331,13 +542,19 @@ class MainProcessingWidget(QWidget):
         self.on_output_format_changed(self.output_format_combo.currentText())
         self.on_zoom_mode_changed()
         self.on_speed_mode_changed()
-        self.video_list_widget.files_dropped.connect(self.refresh_video_list_display)
+        self.video_list_widget.count_changed.connect(self.on_list_count_changed)
+        self.init_preview()
 
     def on_output_format_changed(self, format_text):
         is_reels = (format_text == REELS_FORMAT_NAME)
         self.blur_background_checkbox.setEnabled(is_reels)
         if not is_reels:
             self.blur_background_checkbox.setChecked(False)
+        self.on_blur_background_toggled(self.blur_background_checkbox.isChecked())
+
+    def on_blur_background_toggled(self, checked):
+        self.blur_quality_combo.setEnabled(checked)
+        self.blur_reuse_spin.setEnabled(checked)
 
     def on_list_menu(self, pos: QPoint):
         menu = QMenu()
@@ -345,15 +562,19 @@ class MainProcessingWidget(QWidget):
         act_clear = menu.addAction("Очистить список")
         chosen = menu.exec_(self.video_list_widget.viewport().mapToGlobal(pos))
         if chosen == act_del:
-            for it in reversed(self.video_list_widget.selectedItems()):
-                self.video_list_widget.takeItem(self.video_list_widget.row(it))
+            self.video_list_widget.remove_selected()
             self.refresh_video_list_display()
         elif chosen == act_clear:
             self.on_clear_list()
 
     def on_clear_list(self):
-        self.video_list_widget.clear()
-        self.refresh_video_list_display()
+        self.video_list_widget.clear_all()
+
+    def on_list_count_changed(self, count, scanning):
+        text = f"Файлов: {count}"
+        if scanning:
+            text += " (идёт поиск...)"
+        self.list_count_label.setText(text)
 
     def on_select_overlay(self):
         fs, _ = QFileDialog.getOpenFileNames(
@@ -370,30 +591,15 @@ class MainProcessingWidget(QWidget):
         )
         if not fs:
             return
-        added = False
-        for f in fs:
-            if (is_video_file(f) or f.lower().endswith('.gif')) and not self.video_list_widget.is_already_added(f):
-                it = QListWidgetItem(f)
-                it.setData(Qt.UserRole, f)
-                self.video_list_widget.addItem(it)
-                added = True
-        if added:
-            self.refresh_video_list_display()
+        self.video_list_widget.add_paths(
+            [f for f in fs if is_video_file(f) or f.lower().endswith('.gif')]
+        )
 
     def on_add_folder(self):
         fol = QFileDialog.getExistingDirectory(self, "Выберите папку", "")
         if not fol:
             return
-        vs = find_videos_in_folder(fol, include_gifs=True)
-        added = False
-        for v in vs:
-            if not self.video_list_widget.is_already_added(v):
-                it = QListWidgetItem(v)
-                it.setData(Qt.UserRole, v)
-                self.video_list_widget.addItem(it)
-                added = True
-        if added:
-            self.refresh_video_list_display()
+        self.video_list_widget.scan_folders([fol], include_gifs=True)
 
     def refresh_video_list_display(self):
         for i in range(self.video_list_widget.count()):
@@ -418,6 +624,140 @@ class MainProcessingWidget(QWidget):
         else:
             print("Warning: Cannot apply style, parent window not found.")
 
+    def init_preview(self):
+        self.preview_thread = None
+        self.preview_pending = False
+        self.preview_frames = []
+        self.preview_index = 0
+        # Перерисовка запускается после паузы в изменениях, а не на каждый шаг спинбокса
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(PREVIEW_DEBOUNCE_MS)
+        self.preview_timer.timeout.connect(self.start_preview)
+        self.preview_play_timer = QTimer(self)
+        self.preview_play_timer.setInterval(1000 // PREVIEW_FPS)
+        self.preview_play_timer.timeout.connect(self.on_preview_tick)
+
+        schedule = self.schedule_preview
+        self.preview_group.toggled.connect(schedule)
+        self.video_list_widget.currentItemChanged.connect(schedule)
+        # Поиск по папкам меняет число файлов часто, а показываемый файл — только в пустом списке
+        self.video_list_widget.count_changed.connect(
+            lambda count, _scanning: schedule() if not count or not self.preview_frames else None)
+        self.filter_list.itemSelectionChanged.connect(schedule)
+        self.output_format_combo.currentTextChanged.connect(schedule)
+        self.blur_background_checkbox.toggled.connect(schedule)
+        self.blur_quality_combo.currentTextChanged.connect(schedule)
+        self.overlay_path.textChanged.connect(schedule)
+        self.overlay_pos_combo.currentTextChanged.connect(schedule)
+        for radio in (self.zoom_static_radio, self.zoom_dynamic_radio,
+                      self.speed_static_radio, self.speed_dynamic_radio):
+            radio.toggled.connect(schedule)
+        for spin in (self.zoom_static_spin, self.zoom_min_spin, self.zoom_max_spin,
+                     self.speed_static_spin, self.speed_min_spin, self.speed_max_spin,
+                     self.blur_reuse_spin, self.seed_spin, self.variants_spin):
+            spin.valueChanged.connect(schedule)
+
+    def preview_file(self):
+        item = self.video_list_widget.currentItem()
+        if item is not None:
+            return item.data(Qt.UserRole)
+        return next(iter(self.video_list_widget.queue), None)
+
+    def preview_options(self):
+        """Параметры обработки, влияющие на картинку, — те же, что получит Worker."""
+        zoom_dynamic = self.zoom_dynamic_radio.isChecked()
+        speed_dynamic = self.speed_dynamic_radio.isChecked()
+        overlay_file = self.overlay_path.text().strip() or None
+        return normalize_job_options({
+            "filters": [item.text() for item in self.filter_list.selectedItems()],
+            "zoom_mode": "dynamic" if zoom_dynamic else "static",
+            "zoom_min": self.zoom_min_spin.value() if zoom_dynamic else self.zoom_static_spin.value(),
+            "zoom_max": self.zoom_max_spin.value() if zoom_dynamic else self.zoom_static_spin.value(),
+            "speed_mode": "dynamic" if speed_dynamic else "static",
+            "speed_min": self.speed_min_spin.value() if speed_dynamic else self.speed_static_spin.value(),
+            "speed_max": self.speed_max_spin.value() if speed_dynamic else self.speed_static_spin.value(),
+            "overlay_file": overlay_file if overlay_file and os.path.exists(overlay_file) else None,
+            "overlay_pos": self.overlay_pos_combo.currentText(),
+            "output_format": self.output_format_combo.currentText(),
+            "blur_background": self.blur_background_checkbox.isChecked(),
+            "blur_quality": self.blur_quality_combo.currentText(),
+            "blur_reuse_frames": self.blur_reuse_spin.value(),
+            "seed": self.seed_spin.value() or None,
+        })
+
+    def schedule_preview(self, *_):
+        if self.preview_group.isChecked():
+            self.preview_timer.start()
+        else:
+            self.preview_timer.stop()
+            self.show_preview_frames([])
+            self.preview_status.setText("Предпросмотр выключен")
+
+    def start_preview(self):
+        # Одновременно рисуется один предпросмотр: устаревший останавливается, новый — после него
+        if self.preview_thread is not None and self.preview_thread.isRunning():
+            self.preview_pending = True
+            self.preview_thread.stop()
+            return
+        self.preview_pending = False
+        in_path = self.preview_file()
+        if not in_path or not self.preview_group.isChecked():
+            self.show_preview_frames([])
+            self.preview_status.setText("Выберите файл в списке")
+            return
+        try:
+            options = self.preview_options()
+        except ValueError as e:
+            self.preview_status.setText(str(e))
+            return
+        self.preview_status.setText(f"Рисуется: {os.path.basename(in_path)}...")
+        self.preview_thread = PreviewRenderer(in_path, options, self.variants_spin.value())
+        self.preview_thread.rendered.connect(self.on_preview_rendered)
+        self.preview_thread.failed.connect(self.on_preview_failed)
+        self.preview_thread.finished.connect(self.on_preview_finished)
+        self.preview_thread.start()
+
+    def on_preview_rendered(self, frames):
+        self.show_preview_frames(frames)
+        self.preview_status.setText(os.path.basename(self.preview_thread.in_path))
+
+    def on_preview_failed(self, msg):
+        self.show_preview_frames([])
+        self.preview_status.setText(f"Не удалось показать: {msg}")
+
+    def on_preview_finished(self):
+        if self.preview_pending:
+            self.start_preview()
+
+    def show_preview_frames(self, frames):
+        self.preview_frames = frames
+        self.preview_index = 0
+        self.preview_label.clear()
+        if len(frames) > 1:
+            self.preview_play_timer.start()
+        else:
+            self.preview_play_timer.stop()
+        if frames:
+            self.on_preview_tick()
+
+    def on_preview_tick(self):
+        if not self.preview_frames:
+            return
+        frame = self.preview_frames[self.preview_index % len(self.preview_frames)]
+        self.preview_index += 1
+        self.preview_label.setPixmap(QPixmap.fromImage(frame).scaled(
+            self.preview_label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
+
+    def stop_preview(self, wait_ms=0):
+        self.preview_timer.stop()
+        self.preview_play_timer.stop()
+        self.preview_pending = False
+        if self.preview_thread is not None:
+            self.preview_thread.stop()
+            if wait_ms:
+                self.preview_thread.wait(wait_ms)
+
 
 class VideoUnicApp(QMainWindow):
     def __init__(self):
@@ -434,6 +774,8 @@ class VideoUnicApp(QMainWindow):
         self.setCentralWidget(self.main_widget)
         self.apply_stylesheet("light")
         self.main_widget.process_button.clicked.connect(self.start_processing)
+        self.main_widget.cancel_button.clicked.connect(self.on_cancel_batch)
+        self.main_widget.cancel_job_button.clicked.connect(self.on_cancel_job)
         self.thread = None
 
     def apply_stylesheet(self, mode):
@@ -460,37 +802,17 @@ class VideoUnicApp(QMainWindow):
         if not out_dir:
             return
 
-        video_files = [self.main_widget.video_list_widget.item(i).data(Qt.UserRole)
-                       for i in range(self.main_widget.video_list_widget.count())]
+        if self.main_widget.video_list_widget.is_scanning():
+            QMessageBox.warning(self, "Идёт поиск", "Дождитесь окончания поиска файлов в папках.")
+            return
+        video_files = self.main_widget.video_list_widget.files()
         if not video_files:
             QMessageBox.warning(self, "Нет файлов", "Добавьте хотя бы один видео или GIF файл.")
             return
 
-        # --- Нарезка видео перед обработкой ---
-        temp_split_dir = None
-        if self.main_widget.split_checkbox.isChecked():
-            from utils.ffmpeg_utils import split_video
-
-            # Создаём временную папку внутри выбранного каталога
-            temp_split_dir = os.path.join(out_dir, "temp")
-            os.makedirs(temp_split_dir, exist_ok=True)
-
-            duration = self.main_widget.split_duration_spin.value()
-            split_files = []
-
-            for original_path in video_files:
-                try:
-                    # Имя шаблона для выходных частей — случайное
-                    split_files = split_video(original_path, temp_split_dir, duration)
-
-                except Exception as e:
-                    print(self, "Ошибка нарезки", f"Не удалось нарезать {original_path}:\n{e}")
-
-            if not split_files:
-                QMessageBox.warning(self, "Ошибка", "Не удалось нарезать видео. Обработка отменена.")
-                return
-
-            video_files = split_files  # заменяем исходный список на нарезанные части
+        # Нарезка выполняется в Worker: части кодируются напрямую из исходника
+        split_duration = (self.main_widget.split_duration_spin.value()
+                          if self.main_widget.split_checkbox.isChecked() else None)
 
         strip_metadata = self.main_widget.strip_meta_checkbox.isChecked()
         output_format = self.main_widget.output_format_combo.currentText()
@@ -517,6 +839,19 @@ class VideoUnicApp(QMainWindow):
 
         overlay_pos = self.main_widget.overlay_pos_combo.currentText()
         mute_audio = self.main_widget.mute_checkbox.isChecked()
+        parallel_jobs = self.main_widget.parallel_jobs_spin.value()
+        chunk_parallel = self.main_widget.chunk_parallel_checkbox.isChecked()
+        variants_per_input = self.main_widget.variants_spin.value()
+        blur_quality = self.main_widget.blur_quality_combo.currentText()
+        blur_reuse_frames = self.main_widget.blur_reuse_spin.value()
+        resume = self.main_widget.resume_checkbox.isChecked()
+        use_output_cache = self.main_widget.output_cache_checkbox.isChecked()
+        seed = self.main_widget.seed_spin.value() or None
+        gif_loops = self.main_widget.gif_loops_spin.value()
+        gif_duration = self.main_widget.gif_duration_spin.value() or None
+        gif_silent_audio = self.main_widget.gif_silent_audio_checkbox.isChecked()
+        schedule = SCHEDULE_POLICIES[self.main_widget.schedule_combo.currentText()]
+        use_governor = self.main_widget.governor_checkbox.isChecked()
 
         if zoom_mode == "dynamic" and zoom_min > zoom_max:
             QMessageBox.warning(self, "Ошибка Zoom", "Минимальный Zoom не может быть больше максимального.")
@@ -533,25 +868,54 @@ class VideoUnicApp(QMainWindow):
             overlay_file=overlay_file, overlay_pos=overlay_pos,
             out_dir=out_dir, mute_audio=mute_audio,
             output_format=output_format, blur_background=blur_background,
-            strip_metadata=strip_metadata
+            strip_metadata=strip_metadata,
+            parallel_jobs=parallel_jobs,
+            split_duration=split_duration,
+            chunk_parallel=chunk_parallel,
+            variants_per_input=variants_per_input,
+            blur_quality=blur_quality,
+            blur_reuse_frames=blur_reuse_frames,
+            resume=resume,
+            seed=seed,
+            use_output_cache=use_output_cache,
+            gif_loops=gif_loops,
+            gif_duration=gif_duration,
+            gif_silent_audio=gif_silent_audio,
+            schedule=schedule,
+            use_governor=use_governor
         )
 
         self.thread.progress.connect(self.on_prog)
         self.thread.file_processing.connect(self.on_file_processing)
+        self.thread.file_progress.connect(self.on_file_progress)
         self.thread.finished.connect(self.on_done)
         self.thread.error.connect(self.on_err)
+        self.thread.file_rejected.connect(self.on_file_rejected)
+        self.thread.job_cancelled.connect(self.on_job_cancelled)
+        self.thread.cancelled.connect(self.on_cancelled)
+        self.rejected_files = []
 
         self.main_widget.progress_bar.setValue(0)
         self.main_widget.progress_label.setText(f"0 / {len(video_files)}")
         self.main_widget.status_label.setText("Подготовка...")
         self.main_widget.process_button.setEnabled(False)
+        self.set_cancel_enabled(True)
 
         self.thread.start()
 
-    def on_prog(self, done, total):
+    @staticmethod
+    def format_eta(seconds):
+        if seconds is None or seconds < 0:
+            return ""
+        minutes, sec = divmod(int(round(seconds)), 60)
+        hours, minutes = divmod(minutes, 60)
+        return f"{hours}:{minutes:02d}:{sec:02d}" if hours else f"{minutes}:{sec:02d}"
+
+    def on_prog(self, done, total, eta):
         prc = int(done * 100 / total) if total else 0
-        self.main_widget.progress_bar.setValue(prc)
-        self.main_widget.progress_label.setText(f"{done} / {total}")
+        self.main_widget.progress_bar.setValue(max(prc, self.main_widget.progress_bar.value()))
+        eta_text = self.format_eta(eta)
+        self.main_widget.progress_label.setText(f"{done} / {total}" + (f"  ~{eta_text}" if eta_text else ""))
         self.main_widget.progress_bar.setFormat(f"%p% ({done}/{total})")
 
     def on_file_processing(self, fname):
@@ -563,15 +927,74 @@ class VideoUnicApp(QMainWindow):
         except Exception:
             self.main_widget.status_label.setText(f"Обрабатываю: ...{fname[-30:]}")
 
-    def on_done(self):
+    def on_file_progress(self, name, stats):
+        if stats.get("batch_percent") is not None:
+            self.main_widget.progress_bar.setValue(int(stats["batch_percent"]))
+        eta_text = self.format_eta(stats.get("eta"))
+        if eta_text:
+            self.main_widget.progress_bar.setFormat(f"%p% · осталось ~{eta_text}")
+        parts = [f"{stats['percent']:.0f}%" if stats.get("percent") is not None else None,
+                 f"{stats['fps']:.0f} к/с" if stats.get("fps") else None,
+                 f"{stats['speed']:.2f}x" if stats.get("speed") else None,
+                 f"{stats['total_size'] / 1048576:.1f} МБ" if stats.get("total_size") else None]
+        details = " · ".join(p for p in parts if p)
         try:
-            temp_split_dir = os.path.join(self.thread.out_dir, "temp")
-            if os.path.exists(temp_split_dir):
-                import shutil
-                shutil.rmtree(temp_split_dir)
-        except Exception as e:
-            print(f"[WARN] Не удалось удалить временные файлы: {e}")
-        QMessageBox.information(self, "Готово", "Обработка успешно завершена!")
+            fm = QFontMetrics(self.main_widget.status_label.font())
+            el = fm.elidedText(f"Обрабатываю: {name}", Qt.ElideMiddle,
+                               self.main_widget.status_label.width() - fm.width(details) - 40)
+            self.main_widget.status_label.setText(f"{el}  {details}")
+        except Exception:
+            self.main_widget.status_label.setText(f"Обрабатываю: ...{name[-30:]}  {details}")
+
+    def set_cancel_enabled(self, enabled):
+        self.main_widget.cancel_button.setEnabled(enabled)
+        self.main_widget.cancel_job_button.setEnabled(enabled)
+
+    def on_cancel_batch(self):
+        if not (self.thread and self.thread.isRunning()):
+            return
+        self.set_cancel_enabled(False)
+        self.main_widget.status_label.setText("Отмена...")
+        self.thread.stop()
+
+    def on_cancel_job(self):
+        if not (self.thread and self.thread.isRunning()):
+            return
+        jobs = self.thread.running_jobs()
+        if not jobs:
+            self.main_widget.status_label.setText("Сейчас ничего не кодируется")
+            return
+        menu = QMenu(self)
+        actions = {menu.addAction(name): key for key, name in jobs}
+        button = self.main_widget.cancel_job_button
+        chosen = menu.exec_(button.mapToGlobal(QPoint(0, button.height())))
+        if chosen in actions and self.thread.isRunning():
+            self.thread.cancel_job(actions[chosen])
+
+    def on_job_cancelled(self, name):
+        self.main_widget.status_label.setText(f"Отменено: {name}")
+
+    def on_cancelled(self):
+        self.set_cancel_enabled(False)
+        self.main_widget.progress_label.setText("Отменено")
+        self.main_widget.status_label.setText("Обработка отменена, недописанные файлы удалены")
+        self.main_widget.process_button.setEnabled(True)
+
+    def on_file_rejected(self, path, reason):
+        self.rejected_files.append((path, reason))
+        self.main_widget.status_label.setText(f"Пропущено файлов: {len(self.rejected_files)}")
+
+    def on_done(self):
+        self.set_cancel_enabled(False)
+        if self.rejected_files:
+            lines = [f"{os.path.basename(p)}: {r}" for p, r in self.rejected_files[:20]]
+            if len(self.rejected_files) > 20:
+                lines.append(f"... и ещё {len(self.rejected_files) - 20}")
+            QMessageBox.warning(self, "Готово",
+                                "Обработка завершена. Пропущены файлы, не прошедшие проверку:\n\n"
+                                + "\n".join(lines))
+        else:
+            QMessageBox.information(self, "Готово", "Обработка успешно завершена!")
         self.main_widget.progress_label.setText("Готово")
         self.main_widget.progress_bar.setValue(100)
         self.main_widget.progress_bar.setFormat("100%")
@@ -597,9 +1020,11 @@ class VideoUnicApp(QMainWindow):
                 QMessageBox.Yes | QMessageBox.No, QMessageBox.No
             )
             if reply == QMessageBox.Yes:
+                self.stop_background()
                 try:
-                    self.thread.quit()
-                    self.thread.wait(1000)
+                    # Сначала останавливаются сами ffmpeg, иначе они переживут окно
+                    self.thread.stop(wait=True)
+                    self.thread.wait(int((CANCEL_GRACE_SECONDS + 2) * 1000))
                     if self.thread.isRunning():
                         self.thread.terminate()
                         self.thread.wait(500)
@@ -610,4 +1035,10 @@ class VideoUnicApp(QMainWindow):
             else:
                 event.ignore()
         else:
+            self.stop_background()
             event.accept()
+
+    def stop_background(self):
+        """Останавливает поиск по папкам и предпросмотр — только когда окно действительно закрывается."""
+        self.main_widget.video_list_widget.stop_scanning(wait_ms=1000)
+        self.main_widget.stop_preview(wait_ms=1000)
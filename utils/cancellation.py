@@ -0,0 +1,194 @@
+# utils/cancellation.py
+import os
+import time
+import signal
+import platform
+import threading
+import subprocess
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Set
+from .constants import CANCEL_GRACE_SECONDS
+
+
+class Cancelled(Exception):
+    """Задание (или весь пакет) отменено пользователем."""
+
+
+_local = threading.local()
+
+
+def current_scope() -> Optional[str]:
+    """Ключ задания, которое выполняется в этом потоке (или None)."""
+    return getattr(_local, "scope", None)
+
+
+@contextmanager
+def job_scope(key: Optional[str]):
+    """Процессы ffmpeg, запущенные внутри блока, отменяются вместе с заданием key."""
+    previous = current_scope()
+    _local.scope = key
+    try:
+        yield
+    finally:
+        _local.scope = previous
+
+
+def bound(fn: Callable) -> Callable:
+    """Оборачивает функцию для пула потоков так, чтобы её процессы относились к вызывающему заданию."""
+    key = current_scope()
+    if key is None:
+        return fn
+
+    def wrapper(*args, **kwargs):
+        with job_scope(key):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def popen_group_kwargs() -> Dict[str, object]:
+    """
+    Аргументы Popen, запускающие процесс в отдельной группе: сигнал отмены
+    получает ffmpeg со всеми своими потомками, а не наше приложение.
+    """
+    if platform.system() == "Windows":
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+
+def _interrupt(process: subprocess.Popen):
+    """Мягкая остановка: ffmpeg по SIGINT (CTRL_BREAK на Windows) дописывает файл и выходит."""
+    if platform.system() == "Windows":
+        process.send_signal(signal.CTRL_BREAK_EVENT)
+    else:
+        os.killpg(process.pid, signal.SIGINT)
+
+
+def kill_process(process: subprocess.Popen):
+    """Принудительно завершает группу процесса, запущенного с popen_group_kwargs."""
+    if platform.system() == "Windows":
+        process.kill()
+    else:
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+def stop_process(process: subprocess.Popen, timeout: float = CANCEL_GRACE_SECONDS):
+    """Останавливает группу процесса: сначала мягко, через timeout секунд — принудительно."""
+    try:
+        _interrupt(process)
+    except (OSError, ValueError):
+        pass
+    try:
+        # Ждём, не забирая код выхода: его заберёт поток, запустивший процесс
+        if not _wait_exit(process, timeout):
+            print(f"Warning: ffmpeg (pid {process.pid}) did not stop in {timeout:g}s, killing it.")
+            kill_process(process)
+    except (OSError, ValueError):
+        pass
+
+
+def _wait_exit(process: subprocess.Popen, timeout: float) -> bool:
+    step = 0.05
+    waited = 0.0
+    while waited < timeout:
+        if process.returncode is not None or not _alive(process):
+            return True
+        time.sleep(step)
+        waited += step
+    return False
+
+
+def _alive(process: subprocess.Popen) -> bool:
+    if platform.system() == "Windows":
+        return process.poll() is None
+    try:
+        # Сигнал 0 только проверяет, что группа ещё существует
+        os.killpg(process.pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+
+
+class ProcessRegistry:
+    """
+    Реестр запущенных ffmpeg-процессов по заданиям. Отмена задания (или всех
+    сразу) останавливает его живые процессы, а новые процессы отменённого
+    задания не запускаются: run_ffmpeg сразу выбрасывает Cancelled.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._processes: Dict[Optional[str], Set[subprocess.Popen]] = {}
+        self._cancelled: Set[str] = set()
+        self._all_cancelled = False
+
+    def register(self, process: subprocess.Popen, key: Optional[str]):
+        with self._lock:
+            self._processes.setdefault(key, set()).add(process)
+            cancelled = self._is_cancelled(key)
+        if cancelled:
+            # Отмена пришла, пока процесс запускался
+            threading.Thread(target=stop_process, args=(process,), daemon=True).start()
+
+    def unregister(self, process: subprocess.Popen, key: Optional[str]):
+        with self._lock:
+            processes = self._processes.get(key)
+            if processes is not None:
+                processes.discard(process)
+                if not processes:
+                    del self._processes[key]
+
+    def _is_cancelled(self, key: Optional[str]) -> bool:
+        return self._all_cancelled or (key is not None and key in self._cancelled)
+
+    def is_cancelled(self, key: Optional[str]) -> bool:
+        with self._lock:
+            return self._is_cancelled(key)
+
+    def cancel(self, key: Optional[str] = None, wait: bool = False, timeout: float = CANCEL_GRACE_SECONDS):
+        """
+        Отменяет задание key (None — все задания) и останавливает его процессы.
+        По умолчанию не блокирует: остановка идёт в фоновых потоках; wait=True ждёт её.
+        """
+        with self._lock:
+            if key is None:
+                self._all_cancelled = True
+                targets = [p for processes in self._processes.values() for p in processes]
+            else:
+                self._cancelled.add(key)
+                targets = list(self._processes.get(key, ()))
+        threads: List[threading.Thread] = []
+        for process in targets:
+            thread = threading.Thread(target=stop_process, args=(process, timeout), daemon=True)
+            thread.start()
+            threads.append(thread)
+        if wait:
+            for thread in threads:
+                thread.join(timeout + 1.0)
+
+    def uncancel(self, key: str):
+        """Снимает отметку отмены одного задания (после того как его процессы остановлены)."""
+        with self._lock:
+            self._cancelled.discard(key)
+
+    def reset(self):
+        """Снимает отметки отмены перед новым пакетом."""
+        with self._lock:
+            self._cancelled.clear()
+            self._all_cancelled = False
+
+
+registry = ProcessRegistry()
+
+
+def check_cancelled():
+    """Выбрасывает Cancelled, если задание текущего потока отменено."""
+    if registry.is_cancelled(current_scope()):
+        raise Cancelled("Задание отменено")
+
+
+def cancel_job(key: str, wait: bool = False):
+    registry.cancel(key, wait=wait)
+
+
+def cancel_all(wait: bool = False):
+    registry.cancel(None, wait=wait)
@@ -0,0 +1,217 @@
+# utils/chunked.py
+import os
+import shutil
+import bisect
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+from .constants import CHUNK_MIN_LENGTH, CHUNK_DIR_PREFIX, DEFAULT_BLUR_QUALITY, MP4_COPY_AUDIO_CODECS
+from .ffmpeg_utils import (
+    FFMPEG_PATH_EFFECTIVE, ProgressCallback, run_ffmpeg, process_single,
+    resolve_color_filters, build_atempo_chain
+)
+from .probe import probe_media, keyframe_index, KEYFRAME_EDGE
+from .metrics import bound as bind_metrics
+from .cancellation import Cancelled, registry, current_scope, cancel_job, bound as bind_cancellation
+from .governor import bound as bind_grant
+
+
+def pick_cut_points(keyframes: List[float], start: float, end: float, chunks: int) -> List[float]:
+    """
+    Выбирает границы кусков на ключевых кадрах, ближайших к равномерному делению
+    отрезка [start, end]. Возвращает список границ, включая start и end.
+    """
+    bounds = [start]
+    for i in range(1, chunks):
+        ideal = start + (end - start) * i / chunks
+        pos = bisect.bisect_left(keyframes, ideal)
+        candidates = [k for k in keyframes[max(0, pos - 1):pos + 1] if start < k < end]
+        if not candidates:
+            continue
+        cut = min(candidates, key=lambda k: abs(k - ideal))
+        if cut - bounds[-1] >= CHUNK_MIN_LENGTH and end - cut >= CHUNK_MIN_LENGTH:
+            bounds.append(cut)
+    bounds.append(end)
+    return bounds
+
+
+def encode_audio(in_path: str, out_path: str, speed_p: int,
+                 start: Optional[float] = None, duration: Optional[float] = None, copy: bool = False):
+    """
+    Кодирует звуковую дорожку целиком (с изменением скорости) одним процессом.
+    copy=True — скорость не меняется и кодек подходит для MP4: дорожка копируется.
+    """
+    cmd = [FFMPEG_PATH_EFFECTIVE, "-y"]
+    if start:
+        cmd.extend(["-ss", f"{start:.6f}"])
+    if duration:
+        cmd.extend(["-t", f"{duration:.6f}"])
+    cmd.extend(["-i", in_path, "-vn", "-map", "0:a:0"])
+    tempo = build_atempo_chain(speed_p / 100.0)
+    if copy and not tempo:
+        cmd.extend(["-c:a", "copy", out_path])
+    else:
+        if tempo:
+            cmd.extend(["-af", ",".join(tempo)])
+        cmd.extend(["-c:a", "aac", "-b:a", "128k", out_path])
+    run_ffmpeg(cmd, input_file_for_log=in_path)
+
+
+def _in_job(fn):
+    """Куски кодируются в своих потоках, но относятся к метрикам, отмене и ядрам вызывающего задания."""
+    return bind_metrics(bind_cancellation(bind_grant(fn)))
+
+
+class ChunkProgress:
+    """Сводит прогресс нескольких одновременно кодируемых кусков в один поток обновлений."""
+
+    def __init__(self, callback: ProgressCallback, expected_duration: float):
+        self.callback = callback
+        self.expected_duration = expected_duration
+        self._chunks: Dict[int, Dict[str, object]] = {}
+        self._lock = threading.Lock()
+
+    def for_chunk(self, index: int) -> ProgressCallback:
+        def update(stats: Dict[str, object]):
+            with self._lock:
+                self._chunks[index] = stats
+                running = [c for c in self._chunks.values() if not c["done"]]
+                out_time = sum(c["out_time"] for c in self._chunks.values())
+                combined = {
+                    "out_time": out_time,
+                    "frame": sum(c["frame"] for c in self._chunks.values()),
+                    "fps": sum(c["fps"] for c in running),
+                    "speed": sum(c["speed"] for c in running),
+                    "total_size": sum(c["total_size"] for c in self._chunks.values()),
+                    "percent": (min(99.9, out_time * 100.0 / self.expected_duration)
+                                if self.expected_duration > 0 else None),
+                    "done": False,
+                }
+            self.callback(combined)
+        return update
+
+
+def _concat_list_line(path: str) -> str:
+    escaped = os.path.abspath(path).replace("'", "'\\''")
+    return f"file '{escaped}'\n"
+
+
+def process_chunked(
+        in_path: str,
+        out_path: str,
+        filters: List[str],
+        zoom_p: int,
+        speed_p: int,
+        overlay_file: Optional[str],
+        overlay_pos: str,
+        output_format: str,
+        blur_background: bool,
+        mute_audio: bool = False,
+        strip_metadata: bool = False,
+        threads: Optional[int] = None,
+        start: Optional[float] = None,
+        duration: Optional[float] = None,
+        chunks: int = 2,
+        color_filters: Optional[List[str]] = None,
+        progress_callback: Optional[ProgressCallback] = None,
+        blur_quality: str = DEFAULT_BLUR_QUALITY,
+        blur_reuse_frames: int = 1
+):
+    """
+    Кодирует длинный файл параллельно кусками, разрезанными по ключевым кадрам.
+
+    Все куски получают один и тот же граф фильтров (случайные параметры
+    выбираются один раз), кодируются без звука и склеиваются concat-демультиплексором
+    без перекодирования. Звук кодируется одним отдельным процессом по всей длине,
+    поэтому на стыках кусков он не смещается и не прерывается.
+    Наложенный GIF в каждом куске начинается заново.
+    threads — потоки ffmpeg каждого куска (вызывающий делит на них потоки задания).
+    """
+    info = probe_media(in_path)
+    seg_start = start or 0.0
+    seg_end = seg_start + duration if duration else info.duration
+    bounds = pick_cut_points(keyframe_index(in_path), seg_start, seg_end, chunks)
+    if color_filters is None:
+        color_filters = resolve_color_filters(filters)
+
+    common = dict(
+        filters=filters, zoom_p=zoom_p, speed_p=speed_p,
+        overlay_file=overlay_file, overlay_pos=overlay_pos,
+        output_format=output_format, blur_background=blur_background,
+        strip_metadata=strip_metadata, threads=threads, color_filters=color_filters,
+        blur_quality=blur_quality, blur_reuse_frames=blur_reuse_frames,
+    )
+    if len(bounds) < 3:
+        print(f"Info: '{os.path.basename(in_path)}' has too few keyframes for chunking, encoding as one piece.")
+        process_single(in_path, out_path, mute_audio=mute_audio, start=start, duration=duration,
+                       progress_callback=progress_callback, **common)
+        return
+
+    out_dir = os.path.dirname(os.path.abspath(out_path))
+    work_dir = tempfile.mkdtemp(prefix=CHUNK_DIR_PREFIX, dir=out_dir)
+    try:
+        chunk_paths = [os.path.join(work_dir, f"chunk_{i:04d}.mp4") for i in range(len(bounds) - 1)]
+        audio_path = None
+        if not mute_audio and info.has_audio:
+            audio_path = os.path.join(work_dir, "audio.m4a")
+
+        tracker = None
+        if progress_callback is not None:
+            tracker = ChunkProgress(progress_callback, (seg_end - seg_start) / (speed_p / 100.0))
+
+        # Кусок начинается чуть раньше своего ключевого кадра (время в индексе округлено),
+        # а -t обрывает его до ключевого кадра следующего: кадры на стыках не теряются и не повторяются
+        starts = [seg_start] + [a - KEYFRAME_EDGE for a in bounds[1:-1]]
+        ends = [b - KEYFRAME_EDGE for b in bounds[1:-1]] + [seg_end]
+        key = current_scope()
+        error = None
+        stopped_siblings = False
+        with ThreadPoolExecutor(max_workers=len(chunk_paths) + 1) as pool:
+            futures = [
+                pool.submit(_in_job(process_single), in_path, chunk_path, mute_audio=True,
+                            start=a, duration=b - a,
+                            progress_callback=tracker.for_chunk(i) if tracker else None, **common)
+                for i, (chunk_path, a, b) in enumerate(zip(chunk_paths, starts, ends))
+            ]
+            if audio_path:
+                futures.append(pool.submit(_in_job(encode_audio), in_path, audio_path, speed_p,
+                                           seg_start, seg_end - seg_start,
+                                           info.audio_codec in MP4_COPY_AUDIO_CODECS))
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    if error is not None:
+                        continue
+                    error = e
+                    # Без одного куска результата не будет: остальные останавливаются сразу
+                    if key is not None and not isinstance(e, Cancelled) and not registry.is_cancelled(key):
+                        cancel_job(key)
+                        stopped_siblings = True
+        if stopped_siblings:
+            # Задание остановлено изнутри, а не пользователем: отметка отмены ему больше не нужна
+            registry.uncancel(key)
+        if error is not None:
+            raise error
+
+        list_path = os.path.join(work_dir, "chunks.txt")
+        with open(list_path, "w", encoding="utf-8") as f:
+            f.writelines(_concat_list_line(p) for p in chunk_paths)
+
+        cmd = [FFMPEG_PATH_EFFECTIVE, "-y", "-f", "concat", "-safe", "0", "-i", list_path]
+        maps = ["-map", "0:v"]
+        if audio_path:
+            cmd.extend(["-i", audio_path])
+            maps.extend(["-map", "1:a"])
+        if strip_metadata:
+            maps.extend(["-map_metadata", "-1", "-map_chapters", "-1"])
+        else:
+            cmd.extend(["-i", in_path])
+            maps.extend(["-map_metadata", str(cmd.count("-i") - 1)])
+        cmd.extend(maps)
+        cmd.extend(["-c", "copy"])
+        cmd.append(out_path)
+        run_ffmpeg(cmd, input_file_for_log=in_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
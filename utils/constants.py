@@ -5,6 +5,119 @@ _base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 FFMPEG_PATH = os.path.join(_base_dir, "ffmpeg", "bin", "ffmpeg.exe")
 DEFAULT_OUTPUT_DIR = os.path.join(_base_dir, "output")
 RESOURCES_DIR = os.path.join(_base_dir, "resources")
+CACHE_DIR = os.path.join(_base_dir, "cache")
+
+# Кэш ffprobe: ключ (путь, размер, mtime), вытеснение по LRU
+PROBE_CACHE_PATH = os.path.join(CACHE_DIR, "probe_cache.sqlite")
+PROBE_CACHE_MAX_ENTRIES = 50000
+PROBE_KEYFRAME_WINDOW = 10  # секунд от начала файла для оценки интервала ключевых кадров
+CONTENT_HASH_BLOCK = 1 << 20  # байт за одно чтение при хэшировании содержимого
+
+# Наложение, заранее декодированное в RGBA (один раз на пакет)
+OVERLAY_CACHE_DIR = os.path.join(CACHE_DIR, "overlays")
+OVERLAY_PREPARED_MAX_BYTES = 512 * 1024 ** 2  # больше — наложение используется как есть
+
+# Кэш готовых результатов: ключ — хэш входа, seed и все параметры обработки
+OUTPUT_CACHE_DIR = os.path.join(CACHE_DIR, "outputs")
+OUTPUT_CACHE_MAX_BYTES = 20 * 1024 ** 3
+
+# Предпросмотр: несколько секунд входа, декодированные в уменьшенные кадры один раз на файл
+PREVIEW_CACHE_DIR = os.path.join(CACHE_DIR, "previews")
+PREVIEW_CACHE_MAX_FILES = 200
+PREVIEW_SECONDS = 3.0
+PREVIEW_FPS = 5
+PREVIEW_HEIGHT = 360
+PREVIEW_DEBOUNCE_MS = 250  # пауза после изменения настроек перед перерисовкой
+
+# Метрики заданий: JSONL по каждому заданию и сводка пакета для textfile-коллектора node_exporter
+METRICS_DIR = os.path.join(_base_dir, "metrics")
+METRICS_JSONL_PATH = os.path.join(METRICS_DIR, "jobs.jsonl")
+METRICS_TEXTFILE_PATH = os.path.join(os.environ.get("UNIQUEIZER_TEXTFILE_DIR") or METRICS_DIR, "uniqueizer.prom")
+# Разбивка заданий по этапам (probe/spawn/encode/finalize) в записях метрик
+METRICS_PROFILE = os.environ.get("UNIQUEIZER_PROFILE", "") not in ("", "0")
+
+# Параллельная обработка: сколько ffmpeg-процессов запускать одновременно
+CPU_COUNT = os.cpu_count() or 1
+DEFAULT_PARALLEL_JOBS = max(1, CPU_COUNT // 4)
+MAX_PARALLEL_JOBS = CPU_COUNT
+# Контроль нагрузки: новое задание запускается, только если хватает простаивающих ядер и свободной памяти
+GOVERNOR_RESERVED_CORES = 1 if CPU_COUNT > 2 else 0  # ядра, которые не отдаются ffmpeg (интерфейс, система)
+GOVERNOR_IDLE_SHARE = 0.5          # доля потоков задания, которая должна простаивать для его запуска
+GOVERNOR_MEMORY_RESERVE = 512 * 1024 * 1024  # байт свободной памяти, которые всегда остаются системе
+GOVERNOR_RAMP_SECONDS = 10.0       # столько секунд ядра и память нового задания считаются занятыми заранее
+GOVERNOR_POLL_SECONDS = 0.5        # как часто ожидающее задание перепроверяет нагрузку
+GOVERNOR_CPU_SAMPLE_SECONDS = 0.5  # минимальный интервал замера загрузки CPU
+GOVERNOR_NICE = 10                 # приоритет ffmpeg (nice; на Windows — BELOW_NORMAL)
+GOVERNOR_PIN_CORES = True          # закреплять процессы задания за выделенными ему ядрами
+# Оценка памяти одного ffmpeg: база + кадры в очередях декодера, фильтров и lookahead кодировщика
+GOVERNOR_BASE_MEMORY = 150 * 1024 * 1024
+GOVERNOR_FRAMES_IN_FLIGHT = 48
+GOVERNOR_BLUR_MEMORY_FACTOR = 0.5  # размытый фон — ещё полкадра выхода на каждый кадр в очереди
+# Проверка входов перед пакетом: ffprobe ждёт диска, а не процессора, поэтому потоков больше
+PREFLIGHT_WORKERS = min(16, CPU_COUNT * 2)
+
+# Порядок заданий в пакете: «длинные первыми» сокращает общее время, «короткие первыми» быстрее даёт первые результаты
+SCHEDULE_POLICIES = {
+    "Сначала длинные": "longest",
+    "Сначала короткие": "shortest",
+    "По порядку списка": "fifo",
+}
+DEFAULT_SCHEDULE = "longest"
+# Оценка стоимости задания: секунды результата на пиксели кадра (относительно 1080p) на множитель опций
+COST_REFERENCE_PIXELS = 1920 * 1080
+COST_WEIGHTS = {
+    "decode": 0.3,    # декодирование входа
+    "encode": 1.0,    # кодирование выхода без фильтров
+    "filter": 0.1,    # каждый цветовой фильтр
+    "zoom": 0.2,      # масштабирование/обрезка
+    "overlay": 0.15,  # наложение картинки/GIF
+    "blur": 1.5,      # размытый фон при полном качестве (делится на степень уменьшения и повтор кадров)
+    "copy": 0.02,     # поток копируется без перекодирования
+}
+
+# Распределённая обработка: координатор раздаёт задания узлам в аренду
+DISTRIBUTED_PORT = 8765
+DISTRIBUTED_LEASE_SECONDS = 60.0   # без heartbeat дольше этого задание возвращается в очередь
+DISTRIBUTED_MAX_ATTEMPTS = 3       # после стольких неудачных аренд задание считается проваленным
+DISTRIBUTED_POLL_SECONDS = 2.0     # пауза узла, когда свободных заданий нет
+
+# Отмена: сколько секунд ffmpeg даётся на корректное завершение, прежде чем он будет убит
+CANCEL_GRACE_SECONDS = 3.0
+
+# Нарезка: хвост короче этого (сек) не превращается в отдельную часть
+MIN_SEGMENT_DURATION = 0.5
+# Точная нарезка без полного перекодирования: целые GOP копируются, неполные на границах перекодируются
+# Только H.264: склейка с другими SPS/PPS на границах пишется в MP4 как avc3 (параметры внутри потока)
+SMART_CUT_ENCODERS = {"h264": "libx264"}
+SMART_CUT_CRF = 18          # границы перекодируются почти без потерь, чтобы не отличаться от копии
+SMART_CUT_MIN_COPY = 2.0    # сек: если целых GOP в части меньше, она перекодируется целиком
+
+# Журнал пакета и недописанные результаты в выходной папке
+JOURNAL_FILE_NAME = ".uniqueizer_journal.sqlite"
+PARTIAL_OUTPUT_PREFIX = ".partial_"  # результат пишется под этим префиксом и переименовывается по готовности
+CHUNK_DIR_PREFIX = ".chunks_"
+
+# Параллельное кодирование одного длинного файла кусками (по границам GOP)
+CHUNK_MIN_DURATION = 180  # файлы короче (сек) кодируются целиком
+CHUNK_MIN_LENGTH = 10  # кусок не короче (сек)
+
+# Входные GIF: длина результата задаётся числом повторов или длительностью
+GIF_DEFAULT_LOOPS = 1
+GIF_FALLBACK_DURATION = 10.0  # сек, если длительность GIF не удалось определить
+GIF_MAX_DURATION = 600.0  # верхняя граница результата из GIF (сек)
+
+# Кодеки, которые можно копировать в MP4 без перекодирования
+MP4_COPY_VIDEO_CODECS = {"h264", "hevc", "mpeg4", "av1", "vp9"}
+MP4_COPY_AUDIO_CODECS = {"aac", "mp3", "ac3", "eac3", "opus", "alac"}
+
+# Размытый фон: во сколько раз уменьшать кадр перед размытием (1 — полное разрешение)
+BLUR_QUALITY_LEVELS = {
+    "Полное": 1,
+    "Сбалансированное": 4,
+    "Быстрое": 8,
+}
+DEFAULT_BLUR_QUALITY = "Сбалансированное"
+BLUR_REUSE_MAX_FRAMES = 12  # один размытый фон максимум на столько кадров
 
 REELS_WIDTH = 1080
 REELS_HEIGHT = 1920
@@ -79,6 +192,18 @@ OUTPUT_FORMATS = [
     REELS_FORMAT_NAME,
 ]
 
+# Профили кодирования по формату выхода (площадке): CRF с потолком битрейта (VBV maxrate/bufsize, кбит/с),
+# бюджет размера файла (байт) и предельная длительность (сек). Бюджет пересчитывается в потолок битрейта
+# по max_duration, поэтому любой результат не длиннее предела в него укладывается. Длиннее — не обрезается,
+# а отмечается предупреждением и полем over_max_duration в результате задания.
+# Значения — отправная точка: подбираются по метрикам заданий (output_bytes, output_kbps).
+# Профиль есть только у форматов, размер кадра которых знает output_target.
+ENCODING_AUDIO_KBPS = 128
+DEFAULT_ENCODING_PROFILE = {"crf": 24, "preset": "veryfast", "maxrate": None, "max_bytes": None, "max_duration": None}
+ENCODING_PROFILES = {
+    REELS_FORMAT_NAME: {"crf": 24, "maxrate": 6000, "max_bytes": 287 * 1024 * 1024, "max_duration": 600},
+}
+
 FILTERS = {
     "Нет фильтра": "",
     "Случ. цвет (яркость/контраст/...)": "eq=brightness={br}:contrast={ct}:saturation={sat},hue=h={hue}",
@@ -0,0 +1,473 @@
+# utils/distributed.py
+"""
+Распределённая обработка по локальной сети. Координатор держит очередь заданий
+пакета и раздаёт их узлам в аренду по HTTP (JSON). Узел берёт задание, кодирует
+его через run_job прямо в общую папку результатов, шлёт heartbeat с прогрессом
+и сообщает результат. Аренда без heartbeat дольше lease_seconds истекает,
+и задание снова попадает в очередь: упавший узел не теряет работу.
+"""
+import os
+import hmac
+import json
+import time
+import ipaddress
+import uuid
+import socket
+import threading
+import urllib.error
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .constants import DISTRIBUTED_LEASE_SECONDS, DISTRIBUTED_MAX_ATTEMPTS, DISTRIBUTED_POLL_SECONDS
+from .jobs import Job, normalize_job_options, run_job
+from .journal import JobJournal
+from .cancellation import Cancelled, cancel_job, registry
+
+TOKEN_HEADER = "X-Uniqueizer-Token"
+
+# Вызывается координатором на каждое окончательное событие задания (ok/error)
+EventCallback = Callable[[Dict[str, Any]], None]
+
+
+def job_to_dict(job: Job) -> Dict[str, Any]:
+    return {"in_path": job.in_path, "out_path": job.out_path, "start": job.start,
+            "duration": job.duration, "part": job.part, "variant_paths": job.variant_paths}
+
+
+def job_from_dict(data: Dict[str, Any]) -> Job:
+    return Job(data["in_path"], data["out_path"], start=data.get("start"), duration=data.get("duration"),
+               part=data.get("part"), variant_paths=list(data.get("variant_paths") or []))
+
+
+class PathMap:
+    """
+    Перевод путей общей папки между координатором и узлом, если она смонтирована
+    по-разному: пары (префикс у координатора, префикс на узле).
+    """
+
+    def __init__(self, pairs: Optional[List[Tuple[str, str]]] = None):
+        self.pairs = list(pairs or [])
+
+    @staticmethod
+    def _swap(path: str, pairs) -> str:
+        for src, dst in pairs:
+            if path.startswith(src):
+                return dst + path[len(src):]
+        return path
+
+    def to_node(self, path: str) -> str:
+        return self._swap(path, self.pairs)
+
+    def job_to_node(self, job: Job) -> Job:
+        return Job(self.to_node(job.in_path), self.to_node(job.out_path), start=job.start, duration=job.duration,
+                   part=job.part, variant_paths=[self.to_node(p) for p in job.variant_paths])
+
+    @property
+    def node_prefixes(self) -> List[str]:
+        return [dst for _, dst in self.pairs]
+
+
+def _normalized(path: str) -> str:
+    return os.path.normcase(os.path.realpath(path))
+
+
+def outside_roots(job: Job, roots: List[str]) -> Optional[str]:
+    """
+    Первый выход задания, который лежит вне разрешённых папок roots (или None).
+    Узел пишет только в общую папку результатов: пути от координатора не
+    должны указывать куда-то ещё на машине узла.
+    """
+    allowed = [_normalized(root) for root in roots]
+    for path in job.outputs:
+        target = _normalized(path)
+        if not any(os.path.commonpath([root, target]) == root for root in allowed
+                   if os.path.splitdrive(root)[0] == os.path.splitdrive(target)[0]):
+            return path
+    return None
+
+
+def is_loopback(host: str) -> bool:
+    """Адрес доступен только с этой машины (127.0.0.0/8, ::1, localhost)."""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class Coordinator:
+    """
+    Очередь заданий пакета с арендой. Состояния задания: queued → leased →
+    done/failed. Истёкшая аренда (узел пропал) или ошибка на узле возвращают
+    задание в начало очереди, пока не исчерпано max_attempts попыток.
+    Если передан journal, в нём отмечаются начало и итог каждого задания.
+    """
+
+    def __init__(self, jobs: List[Job], options: Dict[str, Any],
+                 lease_seconds: float = DISTRIBUTED_LEASE_SECONDS, max_attempts: int = DISTRIBUTED_MAX_ATTEMPTS,
+                 journal: Optional[JobJournal] = None, on_event: Optional[EventCallback] = None):
+        self.options = options
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.journal = journal
+        self.on_event = on_event
+        self._entries: Dict[str, Dict[str, Any]] = {
+            job.out_path: {"job": job, "state": "queued", "attempts": 0, "lease": None, "node": None,
+                           "expires": 0.0, "progress": None, "result": None, "error": None}
+            for job in jobs
+        }
+        self._queue = deque(job.out_path for job in jobs)
+        self._leases: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.all_done = threading.Event()
+        if not jobs:
+            self.all_done.set()
+
+    def _expire(self, now: float):
+        for lease_id, key in list(self._leases.items()):
+            entry = self._entries[key]
+            if entry["expires"] < now:
+                print(f"Coordinator: lease of '{entry['job'].name}' on {entry['node']} expired.")
+                self._release(lease_id, "lease expired", count_attempt=True)
+
+    def _release(self, lease_id: str, error: str, count_attempt: bool):
+        """Снимает аренду и возвращает задание в очередь (или проваливает его). Под self._lock."""
+        key = self._leases.pop(lease_id)
+        entry = self._entries[key]
+        entry.update(lease=None, node=None, progress=None, error=error)
+        if not count_attempt:
+            entry["attempts"] = max(0, entry["attempts"] - 1)
+        if entry["attempts"] >= self.max_attempts:
+            entry["state"] = "failed"
+            if self.journal is not None:
+                self.journal.fail(entry["job"], error)
+            self._event({"status": "error", "input": entry["job"].in_path, "output": key, "error": error})
+        else:
+            entry["state"] = "queued"
+            # В начало очереди: порядок планировщика (длинные первыми) сохраняется
+            self._queue.appendleft(key)
+        self._check_done()
+
+    def _check_done(self):
+        if all(e["state"] in ("done", "failed") for e in self._entries.values()):
+            self.all_done.set()
+
+    def _event(self, record: Dict[str, Any]):
+        if self.on_event is not None:
+            self.on_event(record)
+
+    def lease(self, node: str) -> Dict[str, Any]:
+        """Выдаёт следующее задание узлу node. job=None — свободных нет (finished — и не будет)."""
+        with self._lock:
+            self._expire(time.monotonic())
+            while self._queue:
+                key = self._queue.popleft()
+                entry = self._entries[key]
+                if entry["state"] != "queued":
+                    continue
+                lease_id = uuid.uuid4().hex
+                entry.update(state="leased", lease=lease_id, node=node, attempts=entry["attempts"] + 1,
+                             expires=time.monotonic() + self.lease_seconds)
+                self._leases[lease_id] = key
+                if self.journal is not None:
+                    self.journal.start(entry["job"], self.options)
+                print(f"Coordinator: '{entry['job'].name}' leased to {node} (attempt {entry['attempts']}).")
+                return {"job": job_to_dict(entry["job"]), "lease": lease_id, "options": self.options,
+                        "lease_seconds": self.lease_seconds}
+            return {"job": None, "finished": self.all_done.is_set()}
+
+    def heartbeat(self, lease_id: str, progress: Optional[Dict[str, Any]] = None) -> bool:
+        """Продлевает аренду. False — аренда уже потеряна, узлу нужно бросить задание."""
+        with self._lock:
+            self._expire(time.monotonic())
+            key = self._leases.get(lease_id)
+            if key is None:
+                return False
+            entry = self._entries[key]
+            entry["expires"] = time.monotonic() + self.lease_seconds
+            if progress is not None:
+                entry["progress"] = progress
+            return True
+
+    def complete(self, lease_id: str, result: Dict[str, Any]) -> bool:
+        with self._lock:
+            key = self._leases.pop(lease_id, None)
+            if key is None:
+                return False
+            entry = self._entries[key]
+            entry.update(state="done", lease=None, result=result, error=None)
+            job, node = entry["job"], entry["node"]
+        # Контрольные суммы выходов считаются вне блокировки: остальные узлы не ждут
+        if self.journal is not None:
+            try:
+                self.journal.finish(job, result)
+            except OSError as e:
+                print(f"Warning: Cannot record '{job.name}' in journal: {e}")
+        self._event({"status": "ok", **result, "input": job.in_path, "output": job.out_path, "node": node})
+        with self._lock:
+            self._check_done()
+        return True
+
+    def fail(self, lease_id: str, error: str, requeue: bool = False) -> bool:
+        """Ошибка на узле. requeue=True — узел остановлен, попытка не засчитывается."""
+        with self._lock:
+            if lease_id not in self._leases:
+                return False
+            print(f"Coordinator: '{self._entries[self._leases[lease_id]]['job'].name}' failed: {error}")
+            self._release(lease_id, error, count_attempt=not requeue)
+            return True
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            self._expire(time.monotonic())
+            counts: Dict[str, int] = {}
+            running = []
+            for key, entry in self._entries.items():
+                counts[entry["state"]] = counts.get(entry["state"], 0) + 1
+                if entry["state"] == "leased":
+                    running.append({"job": entry["job"].name, "node": entry["node"], "progress": entry["progress"]})
+            return {"counts": counts, "running": running, "finished": self.all_done.is_set()}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "UniqueizerCoordinator/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, code: int, payload: Dict[str, Any]):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self) -> bool:
+        token = self.server.token
+        if not token:
+            return True
+        if hmac.compare_digest(self.headers.get(TOKEN_HEADER, ""), token):
+            return True
+        self._reply(403, {"error": "bad token"})
+        return False
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        if self.path == "/status":
+            self._reply(200, self.server.coordinator.status())
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            data = json.loads(self.rfile.read(length) or b"{}")
+        except (ValueError, OSError):
+            self._reply(400, {"error": "bad request"})
+            return
+        coordinator: Coordinator = self.server.coordinator
+        if self.path == "/lease":
+            self._reply(200, coordinator.lease(str(data.get("node") or self.client_address[0])))
+        elif self.path == "/heartbeat":
+            ok = coordinator.heartbeat(data.get("lease", ""), data.get("progress"))
+            self._reply(200 if ok else 410, {"ok": ok})
+        elif self.path == "/complete":
+            ok = coordinator.complete(data.get("lease", ""), data.get("result") or {})
+            self._reply(200 if ok else 410, {"ok": ok})
+        elif self.path == "/fail":
+            ok = coordinator.fail(data.get("lease", ""), str(data.get("error") or "unknown error"),
+                                  bool(data.get("requeue")))
+            self._reply(200 if ok else 410, {"ok": ok})
+        else:
+            self._reply(404, {"error": "not found"})
+
+
+def serve(coordinator: Coordinator, host: str, port: int, token: Optional[str] = None) -> ThreadingHTTPServer:
+    """
+    Запускает HTTP-сервер координатора в фоновом потоке и возвращает его
+    (port=0 — свободный порт, см. server.server_address; удобно для проверок на localhost).
+    Остановка — server.shutdown(). Без token сервер слушает только loopback-адрес:
+    задания раскрывают пути и параметры, а узлы пишут туда, куда скажет координатор.
+    """
+    if not token and not is_loopback(host):
+        raise ValueError(f"Координатор на {host} без токена доступен всей сети: задайте --token")
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.coordinator = coordinator
+    server.token = token
+    threading.Thread(target=server.serve_forever, name="coordinator-http", daemon=True).start()
+    return server
+
+
+class LeaseLost(Exception):
+    """Координатор больше не считает задание арендованным этим узлом."""
+
+
+class CoordinatorClient:
+    """Клиент протокола координатора (HTTP + JSON)."""
+
+    def __init__(self, url: str, token: Optional[str] = None, timeout: float = 30.0):
+        self.url = url.rstrip("/")
+        self.token = token
+        self.timeout = timeout
+
+    def _post(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        request = urllib.request.Request(
+            self.url + path, data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+            headers={"Content-Type": "application/json", **({TOKEN_HEADER: self.token} if self.token else {})},
+            method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read() or b"{}")
+        except urllib.error.HTTPError as e:
+            if e.code == 410:
+                raise LeaseLost(path)
+            raise
+
+    def lease(self, node: str) -> Dict[str, Any]:
+        return self._post("/lease", {"node": node})
+
+    def heartbeat(self, lease: str, progress: Optional[Dict[str, Any]] = None):
+        self._post("/heartbeat", {"lease": lease, "progress": progress})
+
+    def complete(self, lease: str, result: Dict[str, Any]):
+        self._post("/complete", {"lease": lease, "result": result})
+
+    def fail(self, lease: str, error: str, requeue: bool = False):
+        self._post("/fail", {"lease": lease, "error": error, "requeue": requeue})
+
+
+class _Heartbeat:
+    """
+    Фоновый heartbeat задания на узле: раз в треть срока аренды отправляет последний
+    прогресс. Если аренда потеряна, задание отменяется (его уже делает другой узел).
+    """
+
+    def __init__(self, client: CoordinatorClient, lease: str, job: Job, interval: float):
+        self.client = client
+        self.lease = lease
+        self.job = job
+        self.interval = interval
+        self.progress: Optional[Dict[str, Any]] = None
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def update(self, stats: Dict[str, Any]):
+        self.progress = {k: stats.get(k) for k in ("percent", "out_time", "fps", "speed")}
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.client.heartbeat(self.lease, self.progress)
+            except LeaseLost:
+                print(f"Node: lease of '{self.job.name}' lost, dropping the job.")
+                self.lost = True
+                cancel_job(self.job.out_path)
+                return
+            except (OSError, ValueError) as e:
+                # Координатор временно недоступен: пробуем дальше, аренда ещё может быть жива
+                print(f"Warning: Heartbeat failed: {e}")
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(self.interval + 1.0)
+
+
+def run_node(client: CoordinatorClient, slots: int = 1, threads: Optional[int] = None,
+             node_name: Optional[str] = None, path_map: Optional[PathMap] = None,
+             output_cache=None, metrics=None, stop_event: Optional[threading.Event] = None,
+             governor=None, output_roots: Optional[List[str]] = None) -> Dict[str, int]:
+    """
+    Цикл узла: slots потоков берут задания у координатора и выполняют их через run_job
+    (результаты пишутся в общую папку под временным именем и переименовываются по готовности).
+    Возвращает счётчики ok/failed/lost (lost — аренда истекла, задание отдано другому узлу). Завершается, когда координатор сообщает, что заданий
+    больше не будет, или по stop_event. С governor задания узла запускаются по нагрузке машины.
+    output_roots — папки, в которые узлу разрешено писать (по умолчанию префиксы узла из path_map);
+    задание с выходом вне них не выполняется и сообщается координатору как ошибка.
+    """
+    node_name = node_name or f"{socket.gethostname()}-{uuid.uuid4().hex[:6]}"
+    path_map = path_map or PathMap()
+    output_roots = list(output_roots or path_map.node_prefixes)
+    if not output_roots:
+        raise ValueError("Не задана общая папка результатов узла (output_roots или path_map)")
+    stop_event = stop_event or threading.Event()
+    counts = {"ok": 0, "failed": 0, "lost": 0}
+    counts_lock = threading.Lock()
+
+    def slot_loop(slot: int):
+        name = f"{node_name}/{slot}"
+        while not stop_event.is_set():
+            try:
+                reply = client.lease(name)
+            except (OSError, ValueError) as e:
+                print(f"Warning: Coordinator unavailable: {e}")
+                stop_event.wait(DISTRIBUTED_POLL_SECONDS)
+                continue
+            if reply.get("job") is None:
+                if reply.get("finished"):
+                    return
+                stop_event.wait(DISTRIBUTED_POLL_SECONDS)
+                continue
+            lease = reply["lease"]
+            job = path_map.job_to_node(job_from_dict(reply["job"]))
+            rejected_path = outside_roots(job, output_roots)
+            if rejected_path is not None:
+                print(f"Node: refusing '{job.name}', output is outside the shared folder: {rejected_path}")
+                _report_failure(client, lease, f"Выход вне общей папки узла: {rejected_path}")
+                with counts_lock:
+                    counts["failed"] += 1
+                continue
+            options = normalize_job_options(reply["options"])
+            heartbeat = _Heartbeat(client, lease, job, max(1.0, reply["lease_seconds"] / 3))
+            status = "failed"
+            try:
+                # Временный файл свой у каждой аренды: после истечения аренды тот же выход
+                # может писать другой узел, и отмена здесь не должна удалить его файл
+                result = run_job(job, options, threads=threads, progress_callback=heartbeat.update,
+                                 output_cache=output_cache, metrics=metrics, governor=governor,
+                                 partial_tag=lease[:12])
+                heartbeat.stop()
+                client.complete(lease, result)
+                status = "ok"
+            except LeaseLost:
+                print(f"Node: result of '{job.name}' was not accepted, the lease has expired.")
+                status = "lost"
+            except Cancelled as e:
+                status = "lost"
+                if not heartbeat.lost:
+                    # Задание прервано на узле: без штрафа возвращается в очередь
+                    _report_failure(client, lease, f"{type(e).__name__}: {e}", requeue=True)
+                if stop_event.is_set():
+                    return
+            except Exception as e:
+                print(f"Node: '{job.name}' failed: {type(e).__name__}: {e}")
+                _report_failure(client, lease, f"{type(e).__name__}: {e}")
+            finally:
+                heartbeat.stop()
+                if heartbeat.lost:
+                    # Отмена относилась к потерянной аренде: то же задание может снова прийти сюда
+                    registry.uncancel(job.out_path)
+            with counts_lock:
+                counts[status] += 1
+
+    workers = [threading.Thread(target=slot_loop, args=(i,), name=f"node-slot-{i}") for i in range(max(1, slots))]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return counts
+
+
+def _report_failure(client: CoordinatorClient, lease: str, error: str, requeue: bool = False):
+    try:
+        client.fail(lease, error, requeue)
+    except (LeaseLost, OSError, ValueError) as e:
+        print(f"Warning: Cannot report failure to coordinator: {e}")
@@ -5,13 +5,24 @@ import random
 import platform
 import shlex
 import uuid
+import math
 import shutil
-import ffmpeg
-from typing import List, Optional, Tuple
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
 from .constants import (
     FFMPEG_PATH, FILTERS, OVERLAY_POSITIONS,
-    REELS_WIDTH, REELS_HEIGHT, REELS_FORMAT_NAME
+    REELS_WIDTH, REELS_HEIGHT, REELS_FORMAT_NAME, CPU_COUNT,
+    BLUR_QUALITY_LEVELS, DEFAULT_BLUR_QUALITY, MP4_COPY_VIDEO_CODECS, MP4_COPY_AUDIO_CODECS,
+    GIF_DEFAULT_LOOPS, GIF_FALLBACK_DURATION, GIF_MAX_DURATION,
+    ENCODING_PROFILES, DEFAULT_ENCODING_PROFILE, ENCODING_AUDIO_KBPS
 )
+from .probe import MediaInfo, probe_media
+from .filter_graph import VideoGraphBuilder, Branch, ColorChain
+from .overlay import prepare_overlay, prepare_gif, fit_filter as fit_overlay
+from .metrics import current_job, wait_process
+from .cancellation import Cancelled, registry, current_scope, popen_group_kwargs, stop_process
+from .governor import current_grant, apply_grant, priority_creationflags
 
 FFMPEG_PATH_EFFECTIVE = FFMPEG_PATH
 if not os.path.exists(FFMPEG_PATH_EFFECTIVE):
@@ -24,19 +35,68 @@ if not os.path.exists(FFMPEG_PATH_EFFECTIVE):
         print(
             f"Warning: FFmpeg not found in system PATH either. Processing might fail if '{FFMPEG_PATH}' is incorrect.")
 
+def threads_per_job(parallel_jobs: int) -> int:
+    """Делит ядра процессора между одновременно запущенными ffmpeg-процессами."""
+    return max(1, CPU_COUNT // max(1, parallel_jobs))
+
 def has_audio_stream(video_path: str) -> bool:
     try:
-        probe = ffmpeg.probe(video_path)
-        for stream in probe['streams']:
-            if stream['codec_type'] == 'audio':
-                return True
+        return probe_media(video_path).has_audio
     except Exception:
-            pass
-    return False
+        return False
+
+# Ключи машиночитаемого вывода ffmpeg -progress
+PROGRESS_KEYS = {
+    "frame", "fps", "bitrate", "total_size", "out_time_us", "out_time_ms", "out_time",
+    "dup_frames", "drop_frames", "speed", "progress",
+}
+
+ProgressCallback = Callable[[Dict[str, object]], None]
+
+
+def parse_progress_block(values: Dict[str, str], expected_duration: Optional[float] = None) -> Dict[str, object]:
+    """
+    Превращает блок ключей -progress (до строки progress=...) в словарь:
+    out_time (сек), frame, fps, speed (во сколько раз быстрее реального времени),
+    total_size (байт), percent (если известна ожидаемая длительность), done.
+    """
+    def number(key, cast=float):
+        try:
+            return cast(values.get(key, "").rstrip("x"))
+        except ValueError:
+            return cast(0)
+
+    out_time_us = number("out_time_us", int) or number("out_time_ms", int)
+    out_time = max(0.0, out_time_us / 1_000_000)
+    done = values.get("progress") == "end"
+    percent = None
+    if expected_duration and expected_duration > 0:
+        percent = 100.0 if done else min(99.9, out_time * 100.0 / expected_duration)
+    return {
+        "out_time": out_time,
+        "frame": number("frame", int),
+        "fps": number("fps"),
+        "speed": number("speed"),
+        "total_size": number("total_size", int),
+        "percent": percent,
+        "done": done,
+    }
 
-def run_ffmpeg(cmd: List[str], input_file_for_log: str = "input"):
+
+def run_ffmpeg(cmd: List[str], input_file_for_log: str = "input",
+               progress_callback: Optional[ProgressCallback] = None,
+               expected_duration: Optional[float] = None):
     """
     Запускает FFmpeg с заданной командой и обрабатывает вывод.
+    Если передан progress_callback, ffmpeg пишет машиночитаемый прогресс (-progress),
+    и для каждого обновления вызывается progress_callback(parse_progress_block(...)).
+    expected_duration — ожидаемая длительность результата (сек) для расчёта процента.
+    Если в потоке выполняется задание с метриками, расход процесса (CPU, пиковая
+    память из rusage при выходе) и его последний блок прогресса пишутся в них.
+    Процесс запускается в своей группе и регистрируется под ключом задания потока:
+    при отмене задания он останавливается, а run_ffmpeg выбрасывает Cancelled.
+    Если задание допущено через utils.governor, ffmpeg получает его число потоков
+    фильтров, закрепляется за его ядрами и запускается с пониженным приоритетом.
     """
     if not os.path.exists(FFMPEG_PATH_EFFECTIVE) and not shutil.which("ffmpeg"):
         raise FileNotFoundError(
@@ -53,25 +113,65 @@ def run_ffmpeg(cmd: List[str], input_file_for_log: str = "input"):
         final_cmd.append("-hide_banner")
     if "-loglevel" not in cmd:
         final_cmd.extend(["-loglevel", "warning"])
+    job_metrics = current_job()
+    read_progress = progress_callback is not None or job_metrics is not None
+    if read_progress:
+        final_cmd.extend(["-progress", "pipe:1", "-nostats"])
+    grant = current_grant()
+    if grant is not None and "-filter_complex_threads" not in cmd:
+        final_cmd.extend(["-filter_complex_threads", str(grant.filter_threads)])
     args_to_add = cmd[1:] if cmd and (cmd[0] in (FFMPEG_PATH, FFMPEG_PATH_EFFECTIVE)) else cmd
     final_cmd.extend(args_to_add)
+    scope = current_scope()
+    if registry.is_cancelled(scope):
+        raise Cancelled("Задание отменено")
+    group = popen_group_kwargs()
+    creationflags |= group.pop("creationflags", 0) | priority_creationflags()
     print(f"Running FFmpeg command: {' '.join(shlex.quote(str(c)) for c in final_cmd)}")
     try:
+        spawn_started = time.monotonic()
         process = subprocess.Popen(
             final_cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
             text=True, encoding='utf-8', errors='replace',
-            creationflags=creationflags, startupinfo=startupinfo
+            creationflags=creationflags, startupinfo=startupinfo, **group
         )
+        apply_grant(process.pid)
+        registry.register(process, scope)
+        spawned = time.monotonic()
         output_lines = []
-        while True:
-            line = process.stdout.readline()
-            if not line: break
-            line = line.strip()
-            if line:
-                print(f"FFmpeg: {line}")
-                output_lines.append(line)
-        process.stdout.close()
-        return_code = process.wait()
+        progress_values = {}
+        last_progress = None
+        try:
+            while True:
+                line = process.stdout.readline()
+                if not line: break
+                line = line.strip()
+                if read_progress:
+                    key, sep, value = line.partition("=")
+                    if sep and (key in PROGRESS_KEYS or key.startswith("stream_")):
+                        progress_values[key] = value.strip()
+                        if key == "progress":
+                            last_progress = parse_progress_block(progress_values, expected_duration)
+                            if progress_callback is not None:
+                                progress_callback(last_progress)
+                            progress_values = {}
+                        continue
+                if line:
+                    print(f"FFmpeg: {line}")
+                    output_lines.append(line)
+            process.stdout.close()
+            return_code, usage = wait_process(process)
+        finally:
+            registry.unregister(process, scope)
+            if process.returncode is None:
+                # Ошибка при чтении вывода: процесс не должен пережить вызов
+                stop_process(process, timeout=0)
+                process.wait()
+        if job_metrics is not None:
+            job_metrics.add_process(spawned - spawn_started, time.monotonic() - spawned, usage,
+                                    final_cmd[-1], last_progress)
+        if registry.is_cancelled(scope):
+            raise Cancelled(f"Обработка '{os.path.basename(input_file_for_log)}' отменена")
         if return_code != 0:
             error_message = (
                     f"FFmpeg failed with exit code {return_code} for file '{os.path.basename(input_file_for_log)}'.\n"
@@ -82,6 +182,8 @@ def run_ffmpeg(cmd: List[str], input_file_for_log: str = "input"):
                                                 output="\n".join(output_lines),
                                                 stderr="\n".join(output_lines))
         print(f"FFmpeg successfully processed '{os.path.basename(input_file_for_log)}'")
+    except Cancelled:
+        raise
     except FileNotFoundError:
         raise FileNotFoundError(
             f"FFmpeg executable not found at '{FFMPEG_PATH_EFFECTIVE}'. Please ensure FFmpeg is installed and accessible.")
@@ -91,250 +193,410 @@ def run_ffmpeg(cmd: List[str], input_file_for_log: str = "input"):
 
 
 def get_video_dimensions(path: str) -> Tuple[int, int]:
-    """Получает ширину и высоту видео с помощью ffprobe."""
-    ffprobe_path_effective = FFMPEG_PATH_EFFECTIVE.replace("ffmpeg.exe", "ffprobe.exe").replace("ffmpeg", "ffprobe")
-    if not os.path.exists(ffprobe_path_effective):
-        print(f"Info: ffprobe not found near '{FFMPEG_PATH_EFFECTIVE}'. Trying system PATH...")
-        ffprobe_cmd_in_path = shutil.which("ffprobe")
-        if ffprobe_cmd_in_path:
-            ffprobe_path_effective = ffprobe_cmd_in_path
-            print(f"Info: Using ffprobe found in system PATH: {ffprobe_path_effective}")
-        else:
-            print(f"Warning: ffprobe not found in system PATH either. Cannot get video dimensions.")
-            return 0, 0
-    cmd = [
-        ffprobe_path_effective, "-v", "error", "-select_streams", "v:0",
-        "-show_entries", "stream=width,height", "-of", "csv=s=x:p=0","-c:a", "copy", path
-    ]
+    """Получает ширину и высоту видео (из общего кэша ffprobe)."""
     try:
-        creationflags = 0
-        startupinfo = None
-        if platform.system() == "Windows":
-            creationflags = subprocess.CREATE_NO_WINDOW
-            startupinfo = subprocess.STARTUPINFO()
-            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            startupinfo.wShowWindow = subprocess.SW_HIDE
-        result = subprocess.run(
-            cmd, capture_output=True, text=True, check=True,
-            encoding='utf-8', errors='replace',
-            creationflags=creationflags, startupinfo=startupinfo
-        )
-        dims = result.stdout.strip().split('x')
-        if len(dims) == 2:
-            return int(dims[0]), int(dims[1])
-        print(f"Warning: Could not parse dimensions from ffprobe output: '{result.stdout.strip()}'")
-        return 0, 0
-    except subprocess.CalledProcessError as e:
-        print(f"Error running ffprobe for '{os.path.basename(path)}': {e.stderr.strip()}")
-        return 0, 0
-    except FileNotFoundError:
-        print(f"Error: ffprobe executable not found at '{ffprobe_path_effective}'.")
-        return 0, 0
+        info = probe_media(path)
+        return info.width, info.height
     except Exception as e:
-        print(f"Unexpected error getting dimensions for '{os.path.basename(path)}': {e}")
+        print(f"Error getting dimensions for '{os.path.basename(path)}': {e}")
         return 0, 0
 
-def split_video(input_path: str, output_dir: str, chunk_duration: int):
+def resolve_color_filters(filters: List[str], rng: Optional[random.Random] = None) -> List[str]:
     """
-    Разбивает видео на части по chunk_duration секунд.
-    Возвращает список путей к нарезанным файлам.
+    Превращает выбранные в UI фильтры в готовые выражения ffmpeg,
+    подставляя случайные значения (случайный фильтр, случайный цвет).
+    rng — генератор случайных чисел задания (для воспроизводимости), по умолчанию модуль random.
     """
-    os.makedirs(output_dir, exist_ok=True)
-    name = os.path.splitext(os.path.basename(input_path))[0]
-
-    output_pattern = os.path.join(output_dir, f"{name}_part_%03d.mp4")
-
-    cmd = [
-        FFMPEG_PATH,
-        "-hide_banner",
-        "-loglevel", "error",
-        "-i", input_path,
-        "-c", "copy",
-        "-f", "segment",
-        "-segment_time", str(chunk_duration),
-        "-reset_timestamps", "1",
-        output_pattern
-    ]
+    rng = rng or random
+    applied_color_filters = []
+    for f_name in filters:
+        f_template = FILTERS.get(f_name)
+        if not f_template or f_name == "Нет фильтра":
+            continue
+        if f_name == "Случайный фильтр":
+            possible_filters = [
+                k for k, v in FILTERS.items()
+                if v and k not in ("Нет фильтра", "Случайный фильтр", "Случ. цвет (яркость/контраст/...)")
+            ]
+            if possible_filters:
+                chosen = rng.choice(possible_filters)
+                tmpl = FILTERS[chosen]
+                if tmpl.startswith("eq=brightness="):
+                    br = rng.uniform(-0.15, 0.15)
+                    ct = rng.uniform(0.8, 1.2)
+                    sat = rng.uniform(0.8, 1.3)
+                    hue = rng.uniform(-5, 5)
+                    applied_color_filters.append(tmpl.format(br=br, ct=ct, sat=sat, hue=hue))
+                else:
+                    applied_color_filters.append(tmpl)
+        elif f_name == "Случ. цвет (яркость/контраст/...)":
+            br = rng.uniform(-0.15, 0.15)
+            ct = rng.uniform(0.8, 1.2)
+            sat = rng.uniform(0.8, 1.3)
+            hue = rng.uniform(-5, 5)
+            applied_color_filters.append(f_template.format(br=br, ct=ct, sat=sat, hue=hue))
+        else:
+            applied_color_filters.append(f_template)
+    return applied_color_filters
 
-    subprocess.run(cmd, check=True)
+def build_atempo_chain(speed_factor: float) -> List[str]:
+    """Цепочка atempo для изменения скорости звука (каждый atempo в пределах 0.5..2.0)."""
+    tempo = []
+    cur = speed_factor
+    while cur > 2.0:
+        tempo.append("atempo=2.0")
+        cur /= 2.0
+    min_tempo = 0.5
+    while cur < min_tempo:
+        tempo.append(f"atempo={min_tempo}")
+        cur /= min_tempo
+    if abs(cur - 1.0) > 1e-5 and min_tempo <= cur <= 2.0:
+        tempo.append(f"atempo={cur}")
+    return tempo
 
-    # Соберём список частей
-    parts = sorted([
-        os.path.join(output_dir, f)
-        for f in os.listdir(output_dir)
-        if f.startswith(name + "_part_")
-    ])
-    return parts
+def output_target(output_format: str) -> Optional[Tuple[int, int]]:
+    """Размер кадра (W, H) целевого формата или None для «Оригинального»."""
+    if output_format == REELS_FORMAT_NAME:
+        return REELS_WIDTH, REELS_HEIGHT
+    return None
 
-def process_single(
+
+def encoding_profile(output_format: str) -> Dict[str, object]:
+    """Профиль кодирования формата (ENCODING_PROFILES) поверх профиля по умолчанию."""
+    return {**DEFAULT_ENCODING_PROFILE, **ENCODING_PROFILES.get(output_format, {})}
+
+
+def video_bitrate_cap(profile: Dict[str, object]) -> Optional[int]:
+    """
+    Потолок битрейта видео (кбит/с): меньшее из maxrate профиля и бюджета размера,
+    поделённого на предельную длительность (за вычетом звука). None — без потолка.
+    """
+    caps = []
+    if profile["maxrate"]:
+        caps.append(int(profile["maxrate"]))
+    if profile["max_bytes"] and profile["max_duration"]:
+        budget = int(profile["max_bytes"] * 8 / 1000 / profile["max_duration"]) - ENCODING_AUDIO_KBPS
+        caps.append(max(1, budget))
+    return min(caps) if caps else None
+
+
+def video_encoder_args(profile: Dict[str, object], threads: Optional[int] = None) -> List[str]:
+    """Аргументы libx264 по профилю: CRF, а при потолке битрейта — VBV maxrate/bufsize (capped CRF)."""
+    args = ["-c:v", "libx264", "-preset", str(profile["preset"]), "-crf", str(profile["crf"])]
+    cap = video_bitrate_cap(profile)
+    if cap:
+        args.extend(["-maxrate", f"{cap}k", "-bufsize", f"{cap * 2}k"])
+    if threads:
+        args.extend(["-threads", str(threads)])
+    return args
+
+
+def encoding_summary(output_format: str) -> Dict[str, object]:
+    """Профиль формата в виде, удобном для метрик: CRF, потолок битрейта и предельная длительность."""
+    profile = encoding_profile(output_format)
+    return {"format": output_format, "crf": profile["crf"], "maxrate": video_bitrate_cap(profile),
+            "max_duration": profile["max_duration"]}
+
+
+def _video_kbps(info: MediaInfo) -> Optional[float]:
+    """Битрейт видеопотока входа (кбит/с) по данным ffprobe или None, если он неизвестен."""
+    video = next((s for s in info.streams if s.get("codec_type") == "video"), {})
+    try:
+        return float(video["bit_rate"]) / 1000
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+@dataclass
+class GifInput:
+    """Как подать входной GIF: источник кадров, число доп. повторов (-stream_loop) и длина (сек)."""
+    source: str
+    stream_loop: int
+    length: float
+
+
+def plan_gif_input(gif_path: str, loops: int = GIF_DEFAULT_LOOPS,
+                   target_duration: Optional[float] = None) -> GifInput:
+    """
+    Считает конечную длину результата из GIF: target_duration секунд, если задано,
+    иначе loops полных повторов. Длина всегда ограничена (-t), поэтому кодирование
+    не может идти бесконечно. При нескольких повторах кадры берутся из заранее
+    декодированного цикла (prepare_gif), а не декодируются из палитры заново.
+    """
+    try:
+        one_loop = probe_media(gif_path).duration
+    except Exception as e:
+        print(f"Warning: Cannot probe GIF '{os.path.basename(gif_path)}': {e}")
+        one_loop = 0.0
+    if target_duration:
+        length = target_duration
+    elif one_loop > 0:
+        length = one_loop * max(1, loops)
+    else:
+        length = GIF_FALLBACK_DURATION
+    length = min(length, GIF_MAX_DURATION)
+    stream_loop = math.ceil(length / one_loop) - 1 if one_loop > 0 else -1
+    source = prepare_gif(gif_path).path if stream_loop != 0 else gif_path
+    return GifInput(source, stream_loop, length)
+
+
+@dataclass
+class StreamPlan:
+    """Какие потоки одного выхода можно скопировать без перекодирования."""
+    copy_video: bool = False
+    copy_audio: bool = False
+
+
+def plan_stream_copy(info: Optional[MediaInfo], target: Optional[Tuple[int, int]], zoom_p: int, speed_p: int,
+                     color_filters: List[str], has_overlay: bool, mute_audio: bool,
+                     start: Optional[float] = None, max_kbps: Optional[int] = None) -> StreamPlan:
+    """
+    Определяет, какие потоки выход реально меняет. Видео копируется, если кадр не
+    трогают ни формат, ни zoom, ни скорость, ни фильтры, ни наложение; звук —
+    если не меняется скорость. Кодек должен помещаться в MP4.
+    max_kbps — потолок битрейта профиля: видео выше него (или с неизвестным битрейтом)
+    перекодируется, чтобы результат уложился в бюджет площадки.
+    info=None (GIF или файл не удалось разобрать) — всё перекодируется.
+    """
+    plan = StreamPlan()
+    if info is None:
+        return plan
+    plan.copy_video = (
+        info.has_video and info.video_codec in MP4_COPY_VIDEO_CODECS
+        and target is None and zoom_p == 100 and speed_p == 100
+        and not has_overlay and not ColorChain.from_exprs(color_filters).filters
+        # Копия видео может начинаться только с ключевого кадра: отрезок со сдвигом перекодируется
+        # (отдельное задание-отрезок режет utils.smart_cut, перекодируя только границы)
+        and not start
+        and (max_kbps is None or (_video_kbps(info) or math.inf) <= max_kbps)
+    )
+    plan.copy_audio = (
+        info.has_audio and not mute_audio and speed_p == 100
+        and info.audio_codec in MP4_COPY_AUDIO_CODECS
+    )
+    return plan
+
+
+def _split_labels(src: str, count: int, name: str, audio: bool = False) -> Tuple[List[str], List[str]]:
+    """Размножает поток на count веток (split/asplit). При count <= 1 ветвление не нужно."""
+    if count <= 1:
+        return [], [src] * count
+    labels = [f"[{name}{i}]" for i in range(count)]
+    kind = "asplit" if audio else "split"
+    return [f"{src}{kind}={count}{''.join(labels)}"], labels
+
+
+def process_variants(
         in_path: str,
-        out_path: str,
+        out_paths: List[str],
         filters: List[str],
-        zoom_p: int,
-        speed_p: int,
+        zoom_values: List[int],
+        speed_values: List[int],
         overlay_file: Optional[str],
         overlay_pos: str,
         output_format: str,
         blur_background: bool,
         mute_audio: bool = False,
         strip_metadata: bool = False,
-        hardware: str = "cpu"
+        threads: Optional[int] = None,
+        start: Optional[float] = None,
+        duration: Optional[float] = None,
+        color_filters: Optional[List[List[str]]] = None,
+        progress_callback: Optional[ProgressCallback] = None,
+        blur_quality: str = DEFAULT_BLUR_QUALITY,
+        blur_reuse_frames: int = 1,
+        gif_loops: int = GIF_DEFAULT_LOOPS,
+        gif_duration: Optional[float] = None,
+        gif_silent_audio: bool = False
 ):
+    """
+    Делает несколько уникальных вариантов одного файла за один запуск ffmpeg.
+    Исходник декодируется один раз, размытый фон считается один раз, затем граф
+    делится на ветки, у каждой свои zoom, скорость и случайные фильтры
+    (граф собирает и оптимизирует utils.filter_graph.VideoGraphBuilder).
+    Потоки, которые вариант не меняет, копируются без перекодирования (plan_stream_copy).
+    out_paths, zoom_values, speed_values (и color_filters, если переданы) — по одному на вариант.
+    Входной GIF кодируется на конечную длину (plan_gif_input); тихая звуковая дорожка
+    к нему добавляется только при gif_silent_audio.
+    Видео кодируется по профилю формата (encoding_profile): CRF с потолком битрейта.
+    Результат длиннее предела площадки не обрезается (его отмечает run_job).
+    """
+    count = len(out_paths)
+    if not (len(zoom_values) == len(speed_values) == count) or (color_filters and len(color_filters) != count):
+        raise ValueError("Количество путей, значений zoom/скорости и наборов фильтров должно совпадать")
+    if color_filters is None:
+        color_filters = [resolve_color_filters(filters) for _ in range(count)]
+
     is_gif_input = in_path.lower().endswith('.gif')
-    is_gif_overlay = overlay_file and overlay_file.lower().endswith('.gif')
     cmd = [FFMPEG_PATH_EFFECTIVE, "-y"]
-    input_streams = []
 
+    gif = None
     if is_gif_input:
-        cmd.extend(["-stream_loop", "-1", "-i", in_path])
-        cmd.extend(["-f", "lavfi", "-i", "anullsrc=channel_layout=stereo:sample_rate=44100"])
+        gif = plan_gif_input(in_path, gif_loops, gif_duration)
+        cmd.extend(["-stream_loop", str(gif.stream_loop), "-t", f"{gif.length:.3f}", "-i", gif.source])
         main_video_stream_label = "[0:v]"
-        main_audio_stream_label = "[1:a]"
-        has_real_audio = False
+        main_audio_stream_label = None
+        if gif_silent_audio and not mute_audio:
+            # MP4 не требует звука; тишина нужна только площадкам, которые не принимают видео без дорожки
+            cmd.extend(["-f", "lavfi", "-t", f"{gif.length:.3f}",
+                        "-i", "anullsrc=channel_layout=stereo:sample_rate=44100"])
+            main_audio_stream_label = "[1:a]"
     else:
+        # Виртуальный сегмент: поиск по входу вместо нарезки во временные файлы
+        if start:
+            cmd.extend(["-ss", f"{start:.6f}"])
+        if duration:
+            cmd.extend(["-t", f"{duration:.6f}"])
         cmd.extend(["-i", in_path])
         main_video_stream_label = "[0:v]"
         main_audio_stream_label = "[0:a]"
-        has_real_audio = has_audio_stream(in_path)
 
+    info = None
+    if not is_gif_input:
+        try:
+            info = probe_media(in_path)
+        except Exception as e:
+            print(f"Warning: Cannot probe '{os.path.basename(in_path)}', all streams will be re-encoded: {e}")
+    has_real_audio = bool(info and info.has_audio)
+
+    target = output_target(output_format)
     overlay_stream_label = None
+    overlay = None
     if overlay_file and os.path.exists(overlay_file):
-        if is_gif_overlay:
-            cmd.extend(["-stream_loop", "-1", "-i", overlay_file])
+        # Наложение готовится один раз на пакет (RGBA, вписанное в кадр формата), см. utils.overlay
+        overlay = prepare_overlay(overlay_file, target)
+        if overlay.animated:
+            cmd.extend(["-stream_loop", "-1", "-i", overlay.path])
         else:
-            cmd.extend(["-i", overlay_file])
-        overlay_stream_label = f"[{len(cmd) // 2 - 1}:v]"
+            cmd.extend(["-i", overlay.path])
+        overlay_stream_label = f"[{cmd.count('-i') - 1}:v]"
 
-    target_w, target_h = REELS_WIDTH, REELS_HEIGHT
-    is_reels_format = (output_format == REELS_FORMAT_NAME)
+    profile = encoding_profile(output_format)
+    src_w, src_h = get_video_dimensions(in_path)
     filter_complex_parts = []
-    last_video_node = main_video_stream_label
-
-    if is_reels_format:
-        if blur_background:
-            filter_complex_parts.append(
-                f"{main_video_stream_label}split[original][original_copy];"
-                f"[original_copy]scale={target_w}:{target_h}:force_original_aspect_ratio=increase,"
-                f"crop={target_w}:{target_h}:(in_w-{target_w})/2:(in_h-{target_h})/2,"
-                f"gblur=sigma=25[bg];"
-                f"[original]scale={target_w}:{target_h}:force_original_aspect_ratio=decrease[fg];"
-                f"[bg][fg]overlay=x=(W-w)/2:y=(H-h)/2:shortest=1[formatted]"
-            )
-        else:
-            filter_complex_parts.append(
-                f"{main_video_stream_label}scale={target_w}:{target_h}:force_original_aspect_ratio=decrease,"
-                f"pad={target_w}:{target_h}:(ow-iw)/2:(oh-ih)/2:color=black[formatted]"
-            )
-        last_video_node = "[formatted]"
 
-    # Цветовые фильтры
-    applied_color_filters = []
-    for f_name in filters:
-        f_template = FILTERS.get(f_name)
-        if not f_template or f_name == "Нет фильтра":
-            continue
-        if f_name == "Случайный фильтр":
-            possible_filters = [
-                k for k, v in FILTERS.items()
-                if v and k not in ("Нет фильтра", "Случайный фильтр", "Случ. цвет (яркость/контраст/...)")
-            ]
-            if possible_filters:
-                chosen = random.choice(possible_filters)
-                tmpl = FILTERS[chosen]
-                if tmpl.startswith("eq=brightness="):
-                    br = random.uniform(-0.15, 0.15)
-                    ct = random.uniform(0.8, 1.2)
-                    sat = random.uniform(0.8, 1.3)
-                    hue = random.uniform(-5, 5)
-                    applied_color_filters.append(tmpl.format(br=br, ct=ct, sat=sat, hue=hue))
-                else:
-                    applied_color_filters.append(tmpl)
-        elif f_name == "Случ. цвет (яркость/контраст/...)":
-            br = random.uniform(-0.15, 0.15)
-            ct = random.uniform(0.8, 1.2)
-            sat = random.uniform(0.8, 1.3)
-            hue = random.uniform(-5, 5)
-            applied_color_filters.append(f_template.format(br=br, ct=ct, sat=sat, hue=hue))
-        else:
-            applied_color_filters.append(f_template)
+    # Что выход не меняет, то копируется; через граф идут только изменяемые потоки
+    plans = [
+        plan_stream_copy(info, target, zoom_values[i], speed_values[i], color_filters[i],
+                         overlay_stream_label is not None, mute_audio, start, video_bitrate_cap(profile))
+        for i in range(count)
+    ]
+    encode_video = [i for i in range(count) if not plans[i].copy_video]
+    encode_audio = [i for i in range(count) if not plans[i].copy_audio]
 
-    if applied_color_filters:
-        chain = ",".join(applied_color_filters)
-        filter_complex_parts.append(f"{last_video_node}{chain}[filtered]")
-        last_video_node = "[filtered]"
-
-    # Zoom
-    zoom_factor = zoom_p / 100.0
-    if abs(zoom_factor - 1.0) > 1e-5:
-        zm = []
-        zm.append(f"scale=iw*{zoom_factor}:ih*{zoom_factor}:flags=bicubic")
-        if is_reels_format:
-            zm.append(f"crop={target_w}:{target_h}:(in_w-{target_w})/2:(in_h-{target_h})/2")
+    overlay_sources = [None] * len(encode_video)
+    if overlay_stream_label and encode_video:
+        if not overlay.rgba:
+            # Подготовить не удалось: преобразование (и вписывание в кадр) идёт на каждом кадре
+            fit = None if overlay.scaled else fit_overlay(target)
+            chain = f"{fit},format=rgba" if fit else "format=rgba"
+            filter_complex_parts.append(f"{overlay_stream_label}{chain}[ovl_alpha]")
+            overlay_stream_label = "[ovl_alpha]"
+        split_parts, overlay_sources = _split_labels(overlay_stream_label, len(encode_video), "ovl")
+        filter_complex_parts.extend(split_parts)
+
+    # Звук: без звуковой дорожки или при отключении звука выход без аудио
+    audio_sources = {}
+    if main_audio_stream_label and not mute_audio and (has_real_audio or is_gif_input):
+        split_parts, labels = _split_labels(main_audio_stream_label, len(encode_audio), "asrc", audio=True)
+        filter_complex_parts.extend(split_parts)
+        audio_sources = dict(zip(encode_audio, labels))
+
+    # Видео: один граф на все ветки, приведение к формату и zoom слиты в одно масштабирование
+    src_fps = 0.0
+    if blur_background and blur_reuse_frames > 1:
+        try:
+            src_fps = probe_media(in_path).fps
+        except Exception as e:
+            print(f"Warning: Cannot get frame rate for '{os.path.basename(in_path)}', background reuse disabled: {e}")
+    builder = VideoGraphBuilder(main_video_stream_label, src_w, src_h, target, blur_background,
+                                blur_downscale=BLUR_QUALITY_LEVELS.get(blur_quality, 1),
+                                blur_reuse_frames=blur_reuse_frames, src_fps=src_fps)
+    branches = [
+        Branch(ColorChain.from_exprs(color_filters[i]), zoom_values[i] / 100.0, speed_values[i] / 100.0,
+               overlay_sources[n], overlay_pos)
+        for n, i in enumerate(encode_video)
+    ]
+    video_outputs = {}
+    if branches:
+        video_parts, labels = builder.build(branches)
+        filter_complex_parts = video_parts + filter_complex_parts
+        video_outputs = dict(zip(encode_video, labels))
+
+    output_args = []
+    for i, out_path in enumerate(out_paths):
+        tag = str(i) if count > 1 else ""
+        if plans[i].copy_video:
+            output_args.extend(["-map", "0:v:0", "-c:v", "copy"])
+            if info.video_codec == "hevc":
+                output_args.extend(["-tag:v", "hvc1"])
         else:
-            zm.append(f"pad={target_w}:{target_h}:(ow-iw)/2:(oh-ih)/2:color=black")
-        filter_complex_parts.append(f"{last_video_node}{','.join(zm)}[zoomed]")
-        last_video_node = "[zoomed]"
-
-    # Скорость
-    speed_factor = speed_p / 100.0
-    last_audio_node = main_audio_stream_label
-    audio_speed_applied = False
-    if abs(speed_factor - 1.0) > 1e-5:
-        filter_complex_parts.append(f"{last_video_node}setpts=PTS/{speed_factor}[speed_v]")
-        last_video_node = "[speed_v]"
-        if has_real_audio:
-            tempo = []
-            cur = speed_factor
-            while cur > 2.0:
-                tempo.append("atempo=2.0")
-                cur /= 2.0
-            min_tempo = 0.5
-            while cur < min_tempo:
-                tempo.append(f"atempo={min_tempo}")
-                cur /= min_tempo
-            if abs(cur - 1.0) > 1e-5 and min_tempo <= cur <= 2.0:
-                tempo.append(f"atempo={cur}")
-            if tempo:
-                af = ",".join(tempo)
-                filter_complex_parts.append(f"{main_audio_stream_label}{af}[speed_a]")
-                last_audio_node = "[speed_a]"
-                audio_speed_applied = True
-
-    # Обработка аудио (условная)
-    if not mute_audio:
-        if audio_speed_applied:
-            filter_complex_parts.append(f"{last_audio_node}anull[audio_final]")
-            last_audio_node = "[audio_final]"
+            output_args.extend(["-map", video_outputs[i]])
+            output_args.extend(video_encoder_args(profile, threads))
+
+        if plans[i].copy_audio:
+            output_args.extend(["-map", "0:a:0", "-c:a", "copy"])
+        elif i in audio_sources:
+            tempo = build_atempo_chain(speed_values[i] / 100.0) if has_real_audio else []
+            af = ",".join(tempo) if tempo else "anull"
+            filter_complex_parts.append(f"{audio_sources[i]}{af}[audio_final{tag}]")
+            output_args.extend(["-map", f"[audio_final{tag}]", "-c:a", "aac", "-b:a", "128k"])
         else:
-            filter_complex_parts.append(f"{main_audio_stream_label}anull[audio_final]")
-            last_audio_node = "[audio_final]"
-    else:
-        last_audio_node = None  # звука нет или отключён
-
-    # Наложение
-    if overlay_stream_label:
-        pos = OVERLAY_POSITIONS.get(overlay_pos, "x=(W-w)/2:y=(H-h)/2")
-        filter_complex_parts.append(f"{overlay_stream_label}format=rgba[ovl_alpha]")
-        filter_complex_parts.append(f"{last_video_node}[ovl_alpha]overlay={pos}:shortest=1[overlayed]")
-        last_video_node = "[overlayed]"
-
-    filter_complex_parts.append(f"{last_video_node}format=pix_fmts=yuv420p[vout]")
-    fc_string = ";".join(filter_complex_parts)
-    cmd.extend(["-filter_complex", fc_string])
-    cmd.extend(["-map", "[vout]"])
-
-    if last_audio_node:
-        cmd.extend(["-map", last_audio_node, "-c:a", "aac", "-b:a", "128k"])
-    else:
-        cmd.append("-an")
+            output_args.append("-an")
 
-    cmd.extend(["-c:v", "libx264", "-preset", "veryfast", "-crf", "24"])
+        if strip_metadata:
+            output_args.extend(["-map_metadata", "-1", "-map_chapters", "-1"])
+        output_args.append("-shortest")
+        output_args.append(out_path)
 
-    if strip_metadata:
-        cmd.extend(["-map_metadata", "-1", "-map_chapters", "-1"])
+    if filter_complex_parts:
+        cmd.extend(["-filter_complex", ";".join(filter_complex_parts)])
+    cmd.extend(output_args)
+
+    expected_duration = None
+    if progress_callback is not None:
+        try:
+            source_duration = gif.length if gif else duration or probe_media(in_path).duration - (start or 0.0)
+            expected_duration = source_duration / (min(speed_values) / 100.0)
+        except Exception:
+            expected_duration = None
+    run_ffmpeg(cmd, input_file_for_log=in_path,
+               progress_callback=progress_callback, expected_duration=expected_duration)
 
-    if not is_gif_input:
-        cmd.append("-shortest")
 
-    cmd.append(out_path)
-    run_ffmpeg(cmd, input_file_for_log=in_path)
+def process_single(
+        in_path: str,
+        out_path: str,
+        filters: List[str],
+        zoom_p: int,
+        speed_p: int,
+        overlay_file: Optional[str],
+        overlay_pos: str,
+        output_format: str,
+        blur_background: bool,
+        mute_audio: bool = False,
+        strip_metadata: bool = False,
+        hardware: str = "cpu",
+        threads: Optional[int] = None,
+        start: Optional[float] = None,
+        duration: Optional[float] = None,
+        color_filters: Optional[List[str]] = None,
+        progress_callback: Optional[ProgressCallback] = None,
+        blur_quality: str = DEFAULT_BLUR_QUALITY,
+        blur_reuse_frames: int = 1,
+        gif_loops: int = GIF_DEFAULT_LOOPS,
+        gif_duration: Optional[float] = None,
+        gif_silent_audio: bool = False
+):
+    """Обрабатывает один файл (один вариант) — частный случай process_variants."""
+    process_variants(
+        in_path, [out_path], filters, [zoom_p], [speed_p],
+        overlay_file=overlay_file, overlay_pos=overlay_pos,
+        output_format=output_format, blur_background=blur_background,
+        mute_audio=mute_audio, strip_metadata=strip_metadata, threads=threads,
+        start=start, duration=duration,
+        color_filters=[color_filters] if color_filters is not None else None,
+        progress_callback=progress_callback,
+        blur_quality=blur_quality, blur_reuse_frames=blur_reuse_frames,
+        gif_loops=gif_loops, gif_duration=gif_duration, gif_silent_audio=gif_silent_audio,
+    )
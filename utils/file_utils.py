@@ -2,7 +2,7 @@
 import os
 import mimetypes
 import logging
-from typing import List
+from typing import Iterator, List
 from .constants import VIDEO_EXTENSIONS, GIF_EXTENSIONS, VALID_INPUT_EXTENSIONS
 
 mimetypes.init()
@@ -38,33 +38,45 @@ def is_gif_file(path: str) -> bool:
     return result
 
 
+def iter_video_batches(folder: str, include_gifs: bool = False, batch_size: int = 500) -> Iterator[List[str]]:
+    """
+    Обходит папку и подпапки через os.scandir и выдаёт найденные видео (и GIF)
+    пачками по batch_size. Файлы отбираются по расширению из записи каталога,
+    без лишних системных вызовов на каждый файл.
+    """
+    valid_extensions = VIDEO_EXTENSIONS.union(GIF_EXTENSIONS) if include_gifs else VIDEO_EXTENSIONS
+    batch = []
+    stack = [folder]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                subdirs = []
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif os.path.splitext(entry.name)[1].lower() in valid_extensions and entry.is_file():
+                            batch.append(entry.path)
+                    except OSError as e:
+                        logging.warning(f"Не удалось получить доступ к {entry.path}: {e}")
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
+        except OSError as e:
+            logging.warning(f"Ошибка при обходе папки {current}: {e}")
+            continue
+        # Порядок как у os.walk: подпапки по алфавиту, сверху вниз
+        stack.extend(sorted(subdirs, reverse=True))
+    if batch:
+        yield batch
+
+
 def find_videos_in_folder(folder: str, include_gifs: bool = False) -> List[str]:
     """Находит видео (и опционально GIF) файлы в папке и подпапках."""
-    found = []
-    valid_extensions = VIDEO_EXTENSIONS
-    if include_gifs:
-        valid_extensions = valid_extensions.union(GIF_EXTENSIONS)
-
     if not os.path.isdir(folder):
         logging.error(f"Папка не найдена: {folder}")
-        return found
-
-    try:
-        for root, dirs, files in os.walk(folder):
-            for name in files:
-                fp = os.path.join(root, name)
-                ext = os.path.splitext(name)[1].lower()
-                if ext in valid_extensions:
-                    try:
-                        if os.access(fp, os.R_OK):
-                            found.append(fp)
-                            logging.debug(f"Найден видеофайл: {fp}")
-                        else:
-                            logging.warning(f"Нет доступа для чтения файла: {fp}")
-                    except Exception as e:
-                        logging.warning(f"Не удалось получить доступ к файлу {fp}: {e}")
-    except Exception as e:
-        logging.error(f"Ошибка при обходе папки {folder}: {e}")
-
+        return []
+    found = [path for batch in iter_video_batches(folder, include_gifs) for path in batch]
     logging.info(f"Найдено {len(found)} видеофайлов в папке {folder}")
     return found
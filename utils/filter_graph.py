@@ -0,0 +1,368 @@
+# utils/filter_graph.py
+"""
+Построение и оптимизация графа видеофильтров для process_variants.
+
+Вместо фиксированной последовательности «привести к формату → цвет → zoom»
+граф описывается структурно и собирается в минимальный эквивалент:
+- приведение к формату и zoom сливаются в одно масштабирование + crop/pad;
+- поточечные цветовые фильтры выполняются там, где меньше пикселей
+  (на исходнике или после обрезки, до добавления полей);
+- фильтры, зависящие от разрешения (пикселизация, шум, VHS), остаются
+  на исходном месте, чтобы результат выглядел так же.
+"""
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+from .constants import OVERLAY_POSITIONS
+
+# Фильтры, не зависящие от разрешения кадра: их можно переносить через масштабирование
+MOVABLE_FILTERS = {"eq", "hue", "colorchannelmixer", "negate", "curves", "hflip", "vflip", "gblur"}
+# Фильтры, которые оставляют чёрные поля чёрными: их можно выполнять до добавления полей
+BLACK_PRESERVING_FILTERS = {"hue", "colorchannelmixer", "curves", "hflip", "vflip", "gblur"}
+
+BLUR_BACKGROUND_SIGMA = 25
+
+_LEADING_LABELS = re.compile(r"^((?:\[[^\]]+\])+)")
+_TRAILING_LABELS = re.compile(r"((?:\[[^\]]+\])+)$")
+# Отступы наложения в пикселях (x=20, W-w-10, +270), но не делители вида /2
+_PIXEL_OFFSETS = re.compile(r"(?<=[=+-])(\d+)")
+
+
+def split_filter_chain(chain: str) -> List[str]:
+    """Делит цепочку 'a=1,b=2' на отдельные фильтры (запятые в кавычках не учитываются)."""
+    items, current, quoted = [], [], False
+    for ch in chain:
+        if ch == "'":
+            quoted = not quoted
+        if ch == "," and not quoted:
+            items.append("".join(current))
+            current = []
+        else:
+            current.append(ch)
+    if current:
+        items.append("".join(current))
+    return [item.strip() for item in items if item.strip()]
+
+
+def _leading_labels(part: str) -> str:
+    match = _LEADING_LABELS.match(part)
+    return match.group(1) if match else ""
+
+
+def merge_linear_chains(parts: List[str]) -> List[str]:
+    """
+    Склеивает цепочки вида '[a]f1[b]' + '[b]f2[c]' в '[a]f1,f2[c]', если метка [b]
+    больше нигде не используется. Граф получается короче, без лишних промежуточных узлов.
+    """
+    parts = list(parts)
+    merged = True
+    while merged:
+        merged = False
+        consumers = Counter(label for part in parts for label in re.findall(r"\[[^\]]+\]", _leading_labels(part)))
+        for i, part in enumerate(parts):
+            tail = _TRAILING_LABELS.search(part)
+            label = tail.group(1) if tail else ""
+            if label.count("[") != 1 or consumers[label] != 1:
+                continue
+            j = next((j for j, other in enumerate(parts) if j != i and _leading_labels(other) == label), None)
+            if j is None:
+                continue
+            parts[i] = part[:-len(label)] + "," + parts[j][len(label):]
+            del parts[j]
+            merged = True
+            break
+    return parts
+
+
+def _filter_name(expr: str) -> str:
+    return expr.split("=", 1)[0].strip()
+
+
+def _even(value: float) -> int:
+    return max(2, int(round(value / 2.0)) * 2)
+
+
+@dataclass
+class ColorChain:
+    """Цветовые фильтры одной ветки."""
+    filters: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_exprs(cls, exprs: List[str]) -> "ColorChain":
+        filters = []
+        for expr in exprs:
+            filters.extend(split_filter_chain(expr))
+        return cls(filters)
+
+    @property
+    def movable(self) -> bool:
+        return all(_filter_name(f) in MOVABLE_FILTERS for f in self.filters)
+
+    @property
+    def preserves_black(self) -> bool:
+        return all(_filter_name(f) in BLACK_PRESERVING_FILTERS for f in self.filters)
+
+    def render(self, scale: float = 1.0) -> List[str]:
+        """
+        Фильтры для выполнения на кадре, масштаб которого отличается от исходного
+        места применения в scale раз (радиус размытия пересчитывается).
+        """
+        rendered = []
+        for f in self.filters:
+            if _filter_name(f) == "gblur" and abs(scale - 1.0) > 1e-3:
+                f = re.sub(r"sigma=([0-9.]+)", lambda m: f"sigma={float(m.group(1)) * scale:.3g}", f)
+            rendered.append(f)
+        return rendered
+
+
+@dataclass
+class Geometry:
+    """Одно масштабирование исходника с последующими crop и pad."""
+    scale_w: int
+    scale_h: int
+    crop_w: int
+    crop_h: int
+    pad_w: int
+    pad_h: int
+
+    @property
+    def needs_pad(self) -> bool:
+        return self.crop_w < self.pad_w or self.crop_h < self.pad_h
+
+    def scale_filters(self, src_w: int, src_h: int) -> List[str]:
+        if (self.scale_w, self.scale_h) == (src_w, src_h):
+            return []
+        return [f"scale={self.scale_w}:{self.scale_h}:flags=bicubic"]
+
+    def crop_filters(self) -> List[str]:
+        if (self.crop_w, self.crop_h) == (self.scale_w, self.scale_h):
+            return []
+        return [f"crop={self.crop_w}:{self.crop_h}:(in_w-{self.crop_w})/2:(in_h-{self.crop_h})/2"]
+
+    def pad_filters(self) -> List[str]:
+        if not self.needs_pad:
+            return []
+        return [f"pad={self.pad_w}:{self.pad_h}:(ow-iw)/2:(oh-ih)/2:color=black"]
+
+
+def plan_geometry(src_w: int, src_h: int, target: Optional[Tuple[int, int]], zoom: float,
+                  cover: bool = False) -> Tuple[Geometry, float]:
+    """
+    Считает одно масштабирование, эквивалентное «вписать в target, затем zoom».
+    target=None — размер кадра остаётся исходным. cover=True — заполнить кадр целиком.
+    Возвращает геометрию и коэффициент масштаба исходника.
+    """
+    if target is None:
+        # Исходный размер, но чётный: yuv420p не допускает нечётных сторон (часто у GIF)
+        out_w, out_h, fit = src_w - src_w % 2, src_h - src_h % 2, 1.0
+    else:
+        out_w, out_h = target
+        fit = (max if cover else min)(out_w / src_w, out_h / src_h)
+    factor = fit * zoom
+    if abs(factor - 1.0) < 1e-9:
+        scale_w, scale_h = src_w, src_h
+    else:
+        scale_w, scale_h = _even(src_w * factor), _even(src_h * factor)
+    crop_w, crop_h = min(scale_w, out_w), min(scale_h, out_h)
+    return Geometry(scale_w, scale_h, crop_w, crop_h, out_w, out_h), factor
+
+
+@dataclass
+class Branch:
+    """Один выходной вариант: свои цветовые фильтры, zoom, скорость и наложение."""
+    color: ColorChain
+    zoom: float
+    speed: float
+    overlay: Optional[str] = None
+    overlay_pos: str = ""
+
+
+class VideoGraphBuilder:
+    """
+    Собирает filter_complex для одного входа и нескольких веток.
+    src_w/src_h — размер исходного кадра (0, если неизвестен: тогда граф
+    строится без слияния, по выражениям ffmpeg).
+    target — (W, H) целевого формата или None для «Оригинального».
+    pixel_scale — масштаб кадра относительно настоящего выхода (меньше 1 для
+    предпросмотра): во столько же раз уменьшаются радиус размытия фона и отступы наложения.
+    """
+
+    def __init__(self, src_label: str, src_w: int, src_h: int,
+                 target: Optional[Tuple[int, int]], blur_background: bool = False,
+                 blur_downscale: int = 1, blur_reuse_frames: int = 1, src_fps: float = 0.0,
+                 pixel_scale: float = 1.0):
+        self.src_label = src_label
+        self.src_w = src_w
+        self.src_h = src_h
+        self.target = target
+        self.blur_background = blur_background and target is not None
+        self.blur_downscale = max(1, int(blur_downscale))
+        self.blur_reuse_frames = max(1, int(blur_reuse_frames))
+        self.src_fps = src_fps
+        self.pixel_scale = pixel_scale
+        self.parts: List[str] = []
+
+    def _chain(self, src: str, filters: List[str], out: str) -> str:
+        self.parts.append(f"{src}{','.join(filters) if filters else 'null'}{out}")
+        return out
+
+    def _split(self, src: str, count: int, name: str) -> List[str]:
+        if count == 1:
+            return [src]
+        labels = [f"[{name}{i}]" for i in range(count)]
+        self.parts.append(f"{src}split={count}{''.join(labels)}")
+        return labels
+
+    def build(self, branches: List[Branch]) -> Tuple[List[str], List[str]]:
+        """Возвращает (части filter_complex, метки выходов веток)."""
+        src = self._shared_color(branches)
+        if self.blur_background and not any(self._needs_background(b) for b in branches):
+            # Передний план закрывает весь кадр во всех ветках — фон не виден, не считаем его
+            self.blur_background = False
+        if self.blur_background:
+            # Размытый фон общий для всех веток: он не зависит от zoom и фильтров ветки
+            sources, backgrounds = self._shared_background(src, len(branches))
+        else:
+            sources, backgrounds = self._split(src, len(branches), "vsrc"), [None] * len(branches)
+        outputs = []
+        for i, (branch, src) in enumerate(zip(branches, sources)):
+            tag = str(i) if len(branches) > 1 else ""
+            node = self._geometry(src, branch, tag, backgrounds[i])
+            tail = []
+            if abs(branch.speed - 1.0) > 1e-5:
+                tail.append(f"setpts=PTS/{branch.speed}")
+            if branch.overlay:
+                if tail:
+                    node = self._chain(node, tail, f"[speed_v{tag}]")
+                    tail = []
+                pos = OVERLAY_POSITIONS.get(branch.overlay_pos, "x=(W-w)/2:y=(H-h)/2")
+                if abs(self.pixel_scale - 1.0) > 1e-3:
+                    pos = _PIXEL_OFFSETS.sub(lambda m: str(int(round(int(m.group(1)) * self.pixel_scale))), pos)
+                self.parts.append(f"{node}{branch.overlay}overlay={pos}:shortest=1[overlayed{tag}]")
+                node = f"[overlayed{tag}]"
+            tail.append("format=pix_fmts=yuv420p")
+            outputs.append(self._chain(node, tail, f"[vout{tag}]"))
+        return merge_linear_chains(self.parts), outputs
+
+    def _needs_background(self, branch: Branch) -> bool:
+        if not (self.src_w and self.src_h):
+            return True
+        geometry, _ = plan_geometry(self.src_w, self.src_h, self.target, branch.zoom)
+        return geometry.needs_pad
+
+    def _shared_color(self, branches: List[Branch]) -> str:
+        """
+        С размытым фоном цвет относится ко всему кадру (и к фону). Если ветка одна,
+        исходник меньше целевого кадра и фильтры поточечные — выполняем их до
+        разделения на фон и передний план, один раз и на меньшем кадре.
+        """
+        if not (self.blur_background and len(branches) == 1 and self.src_w and self.src_h):
+            return self.src_label
+        color = branches[0].color
+        target_w, target_h = self.target
+        if not color.filters or not color.movable or self.src_w * self.src_h >= target_w * target_h:
+            return self.src_label
+        fit = min(target_w / self.src_w, target_h / self.src_h)
+        branches[0].color = ColorChain()
+        return self._chain(self.src_label, color.render(1.0 / fit), "[colored]")
+
+    def _shared_background(self, src: str, count: int) -> Tuple[List[str], List[str]]:
+        """
+        Размытый фон считается на уменьшенной в blur_downscale раз копии кадра
+        (радиус размытия уменьшается так же) и затем растягивается до целевого размера.
+        При blur_reuse_frames > 1 фон пересчитывается раз в столько кадров,
+        промежуточные кадры повторяют предыдущий.
+        """
+        target_w, target_h = self.target
+        down = self.blur_downscale
+        proxy = (_even(target_w / down), _even(target_h / down)) if down > 1 else self.target
+        labels = [f"[fgsrc{i}]" for i in range(count)]
+        self.parts.append(f"{src}split={count + 1}[bgsrc]{''.join(labels)}")
+
+        reuse = self.blur_reuse_frames if self.src_fps > 0 else 1
+        bg_filters = [f"fps=fps={self.src_fps / reuse:.6g}"] if reuse > 1 else []
+        if self.src_w and self.src_h:
+            geometry, _ = plan_geometry(self.src_w, self.src_h, proxy, 1.0, cover=True)
+            bg_filters += geometry.scale_filters(self.src_w, self.src_h) + geometry.crop_filters()
+        else:
+            proxy_w, proxy_h = proxy
+            bg_filters += [f"scale={proxy_w}:{proxy_h}:force_original_aspect_ratio=increase",
+                           f"crop={proxy_w}:{proxy_h}:(in_w-{proxy_w})/2:(in_h-{proxy_h})/2"]
+        bg_filters.append(f"gblur=sigma={BLUR_BACKGROUND_SIGMA * self.pixel_scale / down:.3g}")
+        if down > 1:
+            bg_filters.append(f"scale={target_w}:{target_h}:flags=bilinear")
+        if reuse > 1:
+            # Возвращаем исходную частоту и дотягиваем хвост, чтобы shortest не обрезал видео
+            bg_filters += [f"fps=fps={self.src_fps:.6g}", f"tpad=stop_mode=clone:stop={reuse}"]
+        bg = self._chain("[bgsrc]", bg_filters, "[bg]")
+        return labels, self._split(bg, count, "bg")
+
+    def _geometry(self, src: str, branch: Branch, tag: str, background: Optional[str]) -> str:
+        color = branch.color
+        if not (self.src_w and self.src_h):
+            return self._unfused(src, branch, tag, background)
+        if color.filters and not color.movable and abs(branch.zoom - 1.0) > 1e-5:
+            # Фильтры, зависящие от разрешения, должны видеть кадр до zoom — как раньше
+            return self._unfused(src, branch, tag, background)
+
+        geometry, factor = plan_geometry(self.src_w, self.src_h, self.target, branch.zoom)
+        # Исходное место цветовых фильтров — кадр в целевом формате до zoom
+        base_factor = factor / branch.zoom
+        src_pixels = self.src_w * self.src_h
+        content_pixels = geometry.crop_w * geometry.crop_h
+        has_bars = geometry.needs_pad and background is None
+
+        pre, post_crop, post_pad = [], [], []
+        if color.filters:
+            if not color.movable or (has_bars and not color.preserves_black):
+                post_pad = color.render(branch.zoom)
+            elif background is not None:
+                # С размытым фоном цвет применяется ко всему кадру, включая фон
+                post_pad = color.render(branch.zoom)
+            elif src_pixels <= content_pixels:
+                pre = color.render(1.0 / base_factor)
+            else:
+                post_crop = color.render(branch.zoom)
+
+        filters = pre + geometry.scale_filters(self.src_w, self.src_h) + geometry.crop_filters() + post_crop
+        if background is not None:
+            fg = self._chain(src, filters, f"[fg{tag}]")
+            self.parts.append(f"{background}{fg}overlay=x=(W-w)/2:y=(H-h)/2:shortest=1[formatted{tag}]")
+            node = f"[formatted{tag}]"
+            if post_pad:
+                node = self._chain(node, post_pad, f"[filtered{tag}]")
+            return node
+        filters += geometry.pad_filters() + post_pad
+        if not filters:
+            return src
+        return self._chain(src, filters, f"[formatted{tag}]")
+
+    def _unfused(self, src: str, branch: Branch, tag: str, background: Optional[str]) -> str:
+        """Граф без слияния (размер исходника неизвестен или фильтры зависят от разрешения)."""
+        filters = []
+        if self.target:
+            target_w, target_h = self.target
+            filters.append(f"scale={target_w}:{target_h}:force_original_aspect_ratio=decrease")
+            if background is None:
+                filters.append(f"pad={target_w}:{target_h}:(ow-iw)/2:(oh-ih)/2:color=black")
+        node = self._chain(src, filters, f"[fitted{tag}]") if filters else src
+        if background is not None:
+            self.parts.append(f"{background}{node}overlay=x=(W-w)/2:y=(H-h)/2:shortest=1[formatted{tag}]")
+            node = f"[formatted{tag}]"
+        filters = list(branch.color.filters)
+        if abs(branch.zoom - 1.0) > 1e-5:
+            filters.append(f"scale=trunc(iw*{branch.zoom}/2)*2:trunc(ih*{branch.zoom}/2)*2:flags=bicubic")
+            if self.target:
+                target_w, target_h = self.target
+                filters.append(f"crop=min(iw\\,{target_w}):min(ih\\,{target_h})")
+                filters.append(f"pad={target_w}:{target_h}:(ow-iw)/2:(oh-ih)/2:color=black")
+            elif self.src_w and self.src_h:
+                filters.append(f"crop=min(iw\\,{self.src_w}):min(ih\\,{self.src_h})")
+                filters.append(f"pad={self.src_w}:{self.src_h}:(ow-iw)/2:(oh-ih)/2:color=black")
+        if self.target is None and (self.src_w % 2 or self.src_h % 2 or not self.src_w):
+            # yuv420p требует чётных сторон
+            filters.append("crop=trunc(iw/2)*2:trunc(ih/2)*2")
+        if not filters:
+            return node
+        return self._chain(node, filters, f"[zoomed{tag}]")
@@ -0,0 +1,277 @@
+# utils/governor.py
+import os
+import time
+import platform
+import threading
+import subprocess
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .constants import (
+    CPU_COUNT, GOVERNOR_RESERVED_CORES, GOVERNOR_IDLE_SHARE, GOVERNOR_MEMORY_RESERVE,
+    GOVERNOR_RAMP_SECONDS, GOVERNOR_POLL_SECONDS, GOVERNOR_CPU_SAMPLE_SECONDS, GOVERNOR_NICE, GOVERNOR_PIN_CORES,
+    GOVERNOR_BASE_MEMORY, GOVERNOR_FRAMES_IN_FLIGHT, GOVERNOR_BLUR_MEMORY_FACTOR, BLUR_QUALITY_LEVELS
+)
+from .cancellation import Cancelled, registry
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+@dataclass
+class Grant:
+    """
+    Разрешение на запуск задания: сколько потоков дать ffmpeg, к каким ядрам его закрепить и с каким приоритетом.
+    threads — потоки на всё задание (слоты × потоки слота); их делят между собой процессы задания.
+    """
+    threads: int
+    filter_threads: int
+    cores: Optional[Tuple[int, ...]]
+    nice: int
+    memory: int
+    slots: int = 1
+
+
+_local = threading.local()
+
+
+def current_grant() -> Optional[Grant]:
+    """Разрешение задания, которое выполняется в этом потоке (или None)."""
+    return getattr(_local, "grant", None)
+
+
+@contextmanager
+def use_grant(grant: Optional[Grant]):
+    previous = current_grant()
+    _local.grant = grant
+    try:
+        yield grant
+    finally:
+        _local.grant = previous
+
+
+def bound(fn: Callable) -> Callable:
+    """Оборачивает функцию для пула потоков так, чтобы её процессы шли по разрешению вызывающего задания."""
+    grant = current_grant()
+    if grant is None:
+        return fn
+
+    def wrapper(*args, **kwargs):
+        with use_grant(grant):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def priority_creationflags() -> int:
+    """Флаги Popen для Windows: ffmpeg задания запускается с пониженным приоритетом."""
+    grant = current_grant()
+    if grant is None or not grant.nice or platform.system() != "Windows":
+        return 0
+    return subprocess.BELOW_NORMAL_PRIORITY_CLASS
+
+
+def apply_grant(pid: int):
+    """
+    Закрепляет только что запущенный процесс за ядрами задания и понижает его приоритет.
+    Вызывается сразу после Popen: потоки кодировщика ffmpeg создаёт позже и наследует настройки.
+    """
+    grant = current_grant()
+    if grant is None:
+        return
+    try:
+        if grant.cores:
+            if hasattr(os, "sched_setaffinity"):
+                os.sched_setaffinity(pid, grant.cores)
+            elif psutil is not None:
+                psutil.Process(pid).cpu_affinity(list(grant.cores))
+        if grant.nice and hasattr(os, "setpriority"):
+            os.setpriority(os.PRIO_PROCESS, pid, grant.nice)
+    except Exception as e:
+        # Процесс мог уже завершиться (OSError, psutil.NoSuchProcess)
+        print(f"Warning: Cannot apply CPU limits to ffmpeg process {pid}: {e}")
+
+
+def available_memory() -> Optional[int]:
+    """Свободная память (MemAvailable) в байтах или None, если её не узнать."""
+    try:
+        with open("/proc/meminfo", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    if psutil is not None:
+        return psutil.virtual_memory().available
+    return None
+
+
+class CpuSampler:
+    """
+    Сколько ядер простаивало (по /proc/stat, иначе psutil). Замер обновляется не чаще
+    раза в min_interval: на более коротком интервале разница счётчиков нулевая или
+    случайная, и между замерами возвращается последнее известное значение.
+    """
+
+    def __init__(self, min_interval: float = GOVERNOR_CPU_SAMPLE_SECONDS):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._last = self._read()
+        self._last_time = time.monotonic()
+        self._idle: Optional[float] = None
+        if psutil is not None and self._last is None:
+            psutil.cpu_percent(interval=None)
+
+    @staticmethod
+    def _read() -> Optional[Tuple[int, int]]:
+        try:
+            with open("/proc/stat", encoding="ascii") as f:
+                values = [int(v) for v in f.readline().split()[1:]]
+        except (OSError, ValueError):
+            return None
+        # idle + iowait: ядро, ждущее диска, тоже свободно для кодирования
+        return sum(values[:8]), values[3] + (values[4] if len(values) > 4 else 0)
+
+    def _sample(self) -> Optional[float]:
+        if self._last is not None:
+            current = self._read()
+            if current is None:
+                return None
+            total, idle = current[0] - self._last[0], current[1] - self._last[1]
+            if total <= 0:
+                return None
+            self._last = current
+            return CPU_COUNT * idle / total
+        if psutil is not None:
+            return CPU_COUNT * (100.0 - psutil.cpu_percent(interval=None)) / 100.0
+        return None
+
+    def idle_cores(self) -> Optional[float]:
+        """Простаивающие ядра или None, если загрузку узнать нечем."""
+        if self._last is None and psutil is None:
+            return None
+        with self._lock:
+            elapsed = time.monotonic() - self._last_time
+            if self._idle is None and elapsed < self.min_interval:
+                # Первого замера ещё нет: ждём, пока счётчики успеют измениться
+                time.sleep(self.min_interval - elapsed)
+                elapsed = self.min_interval
+            if elapsed >= self.min_interval:
+                idle = self._sample()
+                if idle is not None:
+                    self._idle = idle
+                    self._last_time = time.monotonic()
+            return self._idle
+
+
+def estimate_memory(job, options: Dict[str, Any], processes: int = 1) -> int:
+    """
+    Оценка пиковой памяти задания (байт): на каждый процесс ffmpeg база плюс
+    кадры в очередях (GOVERNOR_FRAMES_IN_FLIGHT) на входе и на каждом выходе.
+    Размытый фон добавляет GOVERNOR_BLUR_MEMORY_FACTOR кадра выхода (меньше при уменьшенном фоне).
+    """
+    from .ffmpeg_utils import output_target
+
+    info = job.info
+    src_frame = (info.width * info.height * 3 // 2) if info else 1920 * 1080 * 3 // 2
+    target = output_target(options["output_format"])
+    out_frame = target[0] * target[1] * 3 // 2 if target else src_frame
+    per_output = out_frame
+    if options["blur_background"]:
+        downscale = BLUR_QUALITY_LEVELS.get(options["blur_quality"], 1)
+        per_output += int(out_frame * GOVERNOR_BLUR_MEMORY_FACTOR / (downscale * downscale))
+    frames = src_frame + per_output * len(job.outputs)
+    return processes * (GOVERNOR_BASE_MEMORY + GOVERNOR_FRAMES_IN_FLIGHT * frames)
+
+
+def _allowed_cores() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(CPU_COUNT))
+
+
+class Governor:
+    """
+    Допуск заданий к запуску по нагрузке системы. Каждое задание получает
+    свою долю ядер (без GOVERNOR_RESERVED_CORES, оставленных интерфейсу),
+    а запускается, только если столько ядер сейчас простаивает и хватает
+    свободной памяти на его оценку. Первое задание допускается всегда —
+    пакет не может встать, даже если машина занята чем-то другим.
+    Задание, которое запускает несколько ffmpeg сразу (кусками), занимает
+    столько же слотов (не больше max_jobs) и получает их ядра.
+    """
+
+    def __init__(self, max_jobs: int, nice: int = GOVERNOR_NICE, pin_cores: bool = GOVERNOR_PIN_CORES):
+        cores = _allowed_cores()
+        reserved = GOVERNOR_RESERVED_CORES if len(cores) > GOVERNOR_RESERVED_CORES + 1 else 0
+        self.cores = cores[reserved:]
+        self.max_jobs = max(1, max_jobs)
+        self.threads = max(1, len(self.cores) // self.max_jobs)
+        self.nice = nice
+        self.pin_cores = pin_cores and len(self.cores) >= self.threads * self.max_jobs
+        self._free = list(self.cores)
+        self._running = 0
+        self._recent: List[Tuple[float, int, int]] = []  # (время допуска, оценка памяти, слоты)
+        self._cond = threading.Condition()
+        self._cpu = CpuSampler()
+
+    def _can_admit(self, memory: int, slots: int) -> bool:
+        if self._running == 0:
+            return True
+        if self._running + slots > self.max_jobs:
+            return False
+        now = time.monotonic()
+        self._recent = [entry for entry in self._recent if now - entry[0] < GOVERNOR_RAMP_SECONDS]
+        idle = self._cpu.idle_cores()
+        # Недавно запущенные задания ещё не успели занять свои ядра: они считаются занятыми заранее
+        ramping_threads = self.threads * sum(s for _, _, s in self._recent)
+        if idle is not None and idle - ramping_threads < self.threads * slots * GOVERNOR_IDLE_SHARE:
+            return False
+        free = available_memory()
+        if free is not None:
+            # Память недавно запущенных заданий ещё не видна в MemAvailable
+            ramping = sum(m for _, m, _ in self._recent)
+            if free - ramping - memory < GOVERNOR_MEMORY_RESERVE:
+                return False
+        return True
+
+    def _acquire(self, key: Optional[str], memory: int, processes: int = 1) -> Grant:
+        slots = min(max(1, processes), self.max_jobs)
+        threads = self.threads * slots
+        with self._cond:
+            while not self._can_admit(memory, slots):
+                if registry.is_cancelled(key):
+                    raise Cancelled("Задание отменено")
+                self._cond.wait(GOVERNOR_POLL_SECONDS)
+            if registry.is_cancelled(key):
+                raise Cancelled("Задание отменено")
+            cores = None
+            if self.pin_cores:
+                cores = tuple(self._free[:threads])
+                del self._free[:threads]
+            self._running += slots
+            self._recent.append((time.monotonic(), memory, slots))
+            return Grant(threads, max(1, threads // max(1, processes)), cores, self.nice, memory, slots)
+
+    def _release(self, grant: Grant):
+        with self._cond:
+            self._running -= grant.slots
+            if grant.cores:
+                self._free.extend(grant.cores)
+                self._free.sort()
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, job, options: Dict[str, Any], processes: int = 1):
+        """
+        Ждёт, пока задание можно запустить, и выполняет блок с его разрешением
+        (см. current_grant). processes — сколько ffmpeg задание запустит одновременно:
+        столько слотов (и их ядер) оно и занимает. Ожидание прерывается отменой задания (Cancelled).
+        """
+        grant = self._acquire(job.out_path, estimate_memory(job, options, processes), processes)
+        try:
+            with use_grant(grant):
+                yield grant
+        finally:
+            self._release(grant)
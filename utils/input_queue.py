@@ -0,0 +1,50 @@
+# utils/input_queue.py
+import os
+from typing import Dict, Iterable, Iterator, List
+
+
+def normalize_path(path: str) -> str:
+    """Ключ для поиска дублей: абсолютный путь в регистре, принятом в ОС."""
+    return os.path.normcase(os.path.abspath(path))
+
+
+class InputQueue:
+    """
+    Упорядоченный список входных файлов с проверкой дублей и удалением за O(1):
+    пути хранятся в словаре по нормализованному пути, он сохраняет порядок добавления.
+    """
+
+    def __init__(self, paths: Iterable[str] = ()):
+        self._paths: Dict[str, str] = {}
+        self.extend(paths)
+
+    def add(self, path: str) -> bool:
+        """Добавляет файл, если его ещё нет. Возвращает True, если добавлен."""
+        key = normalize_path(path)
+        if key in self._paths:
+            return False
+        self._paths[key] = path
+        return True
+
+    def extend(self, paths: Iterable[str]) -> List[str]:
+        """Добавляет файлы и возвращает те, которых ещё не было."""
+        return [path for path in paths if self.add(path)]
+
+    def remove(self, path: str):
+        self._paths.pop(normalize_path(path), None)
+
+    def remove_many(self, paths: Iterable[str]):
+        for path in paths:
+            self.remove(path)
+
+    def clear(self):
+        self._paths.clear()
+
+    def __contains__(self, path: str) -> bool:
+        return normalize_path(path) in self._paths
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._paths.values()))
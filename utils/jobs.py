@@ -0,0 +1,415 @@
+# utils/jobs.py
+import os
+import json
+import math
+import random
+import time
+import hashlib
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from .constants import (
+    REELS_FORMAT_NAME, MIN_SEGMENT_DURATION, CHUNK_MIN_DURATION,
+    BLUR_QUALITY_LEVELS, DEFAULT_BLUR_QUALITY, BLUR_REUSE_MAX_FRAMES, GIF_DEFAULT_LOOPS, GIF_MAX_DURATION
+)
+from .ffmpeg_utils import (
+    ProgressCallback, process_single, process_variants, plan_stream_copy, output_target, resolve_color_filters,
+    encoding_profile, video_bitrate_cap, encoding_summary
+)
+from .chunked import process_chunked
+from .smart_cut import smart_cut
+from .journal import JobJournal, partial_path
+from .output_cache import OutputCache
+from .probe import MediaInfo, probe_media, content_hash
+from .metrics import BatchMetrics, track, phase
+from .cancellation import Cancelled, job_scope, check_cancelled
+from .governor import Governor
+
+# Параметры обработки, которые принимает Worker (и манифест консольного режима)
+JOB_OPTION_DEFAULTS: Dict[str, Any] = {
+    "filters": [],
+    "zoom_mode": "static",
+    "zoom_min": 100,
+    "zoom_max": 100,
+    "speed_mode": "static",
+    "speed_min": 100,
+    "speed_max": 100,
+    "overlay_file": None,
+    "overlay_pos": "Середина-Центр",
+    "mute_audio": False,
+    "output_format": "Оригинальный",
+    "blur_background": False,
+    "blur_quality": DEFAULT_BLUR_QUALITY,
+    "blur_reuse_frames": 1,
+    "strip_metadata": False,
+    "chunk_parallel": False,
+    "seed": None,
+    "gif_loops": GIF_DEFAULT_LOOPS,
+    "gif_duration": None,
+    "gif_silent_audio": False,
+}
+
+
+@dataclass
+class Job:
+    """
+    Одно задание: входной файл (или его отрезок) и путь результата.
+    Если заданы variant_paths, из одного декодирования делается несколько вариантов.
+    info — сведения о входе из предварительной проверки (если она была).
+    """
+    in_path: str
+    out_path: str
+    start: Optional[float] = None
+    duration: Optional[float] = None
+    part: Optional[int] = None
+    variant_paths: List[str] = field(default_factory=list)
+    info: Optional[MediaInfo] = field(default=None, repr=False, compare=False)
+
+    @property
+    def outputs(self) -> List[str]:
+        return self.variant_paths or [self.out_path]
+
+    @property
+    def name(self) -> str:
+        base_name = os.path.basename(self.in_path)
+        if self.part is None:
+            return base_name
+        return f"{base_name} [часть {self.part + 1}]"
+
+
+def normalize_job_options(options: Dict[str, Any]) -> Dict[str, Any]:
+    """Дополняет параметры значениями по умолчанию и проверяет их."""
+    unknown = set(options) - set(JOB_OPTION_DEFAULTS)
+    if unknown:
+        raise ValueError(f"Неизвестные параметры: {', '.join(sorted(unknown))}")
+    result = dict(JOB_OPTION_DEFAULTS)
+    result.update(options)
+    result["filters"] = list(result["filters"] or [])
+    if result["output_format"] != REELS_FORMAT_NAME:
+        result["blur_background"] = False
+    if result["blur_quality"] not in BLUR_QUALITY_LEVELS:
+        raise ValueError(f"blur_quality должен быть одним из: {', '.join(BLUR_QUALITY_LEVELS)}")
+    result["blur_reuse_frames"] = min(max(1, int(result["blur_reuse_frames"])), BLUR_REUSE_MAX_FRAMES)
+    if result["seed"] is not None:
+        result["seed"] = int(result["seed"])
+    result["gif_loops"] = max(1, int(result["gif_loops"]))
+    if result["gif_duration"] is not None:
+        result["gif_duration"] = float(result["gif_duration"])
+        if not 0 < result["gif_duration"] <= GIF_MAX_DURATION:
+            raise ValueError(f"gif_duration должен быть от 0 до {GIF_MAX_DURATION:g} секунд")
+    for kind in ("zoom", "speed"):
+        if result[f"{kind}_mode"] not in ("static", "dynamic"):
+            raise ValueError(f"{kind}_mode должен быть 'static' или 'dynamic'")
+        if result[f"{kind}_mode"] == "static":
+            result[f"{kind}_max"] = result[f"{kind}_min"]
+        elif result[f"{kind}_min"] > result[f"{kind}_max"]:
+            raise ValueError(f"{kind}_min не может быть больше {kind}_max")
+    return result
+
+
+def pick_percent(mode: str, value_min: int, value_max: int, rng: Optional[random.Random] = None) -> int:
+    """Выбирает значение в процентах (zoom/скорость) в зависимости от режима."""
+    if mode == "dynamic" and value_max >= value_min:
+        try:
+            return (rng or random).randint(value_min, value_max)
+        except ValueError:
+            return value_min
+    return value_min
+
+
+def build_out_path(in_file_path: str, out_dir: str, output_format: str,
+                   part: Optional[int] = None, variant: Optional[int] = None) -> str:
+    """Формирует путь к выходному файлу для входного (с номером части и варианта)."""
+    base_name = os.path.basename(in_file_path)
+    name_part, _ = os.path.splitext(base_name)
+    if part is not None:
+        name_part = f"{name_part}_part_{part:03d}"
+    suffix = "_reels" if output_format != "Оригинальный" else "_processed"
+    if variant is not None:
+        suffix = f"{suffix}_v{variant + 1:02d}"
+    out_file_name = f"{name_part}{suffix}.mp4"
+    out_file_path = os.path.join(out_dir, out_file_name)
+
+    if os.path.abspath(in_file_path) == os.path.abspath(out_file_path):
+        alt_out_file_name = f"{name_part}{suffix}_output.mp4"
+        out_file_path = os.path.join(out_dir, alt_out_file_name)
+        print(f"Warning: Output path is same as input. Saving to: {alt_out_file_name}")
+    return out_file_path
+
+
+def plan_segments(in_path: str, split_duration: float, info: Optional[MediaInfo] = None) -> Iterator[tuple]:
+    """
+    Делит файл на виртуальные отрезки (start, duration) по split_duration секунд.
+    Сам файл не нарезается: каждый отрезок кодируется с поиском по входу (-ss/-t).
+    Остаток короче MIN_SEGMENT_DURATION добавляется к предыдущему отрезку.
+    """
+    total = (info or probe_media(in_path)).duration
+    if total <= 0:
+        raise ValueError(f"Не удалось определить длительность файла '{os.path.basename(in_path)}'")
+    segments = []
+    for index in range(math.ceil(total / split_duration)):
+        start = index * split_duration
+        length = min(split_duration, total - start)
+        if length < MIN_SEGMENT_DURATION and segments:
+            prev_start, prev_length = segments[-1]
+            segments[-1] = (prev_start, prev_length + length)
+        else:
+            segments.append((start, length))
+    yield from segments
+
+
+def iter_jobs(files: Iterable[str], out_dir: str, output_format: str,
+              split_duration: Optional[float] = None, variants: int = 1,
+              infos: Optional[Dict[str, MediaInfo]] = None) -> Iterator[Job]:
+    """
+    Планирует задания по списку файлов. Вызывающий собирает их все до запуска
+    (после preflight), чтобы оценить стоимость и выбрать порядок (utils.scheduler).
+    Ошибка планирования одного файла не прерывает остальные: он отдаётся
+    целиком и упадёт уже при обработке с понятным сообщением.
+    При variants > 1 каждое задание даёт столько же уникальных вариантов.
+    infos — результаты preflight: задания получают MediaInfo своего входа.
+    """
+    def make_job(in_path, part=None, start=None, length=None):
+        variant_paths = []
+        if variants > 1:
+            variant_paths = [build_out_path(in_path, out_dir, output_format, part, v) for v in range(variants)]
+        return Job(in_path, build_out_path(in_path, out_dir, output_format, part),
+                   start=start, duration=length, part=part, variant_paths=variant_paths,
+                   info=(infos or {}).get(in_path))
+
+    for in_path in files:
+        if split_duration and not in_path.lower().endswith('.gif'):
+            try:
+                segments = list(plan_segments(in_path, split_duration, (infos or {}).get(in_path)))
+            except Exception as e:
+                print(f"Warning: Cannot split '{os.path.basename(in_path)}': {e}")
+                segments = []
+            if segments:
+                for part, (start, length) in enumerate(segments):
+                    yield make_job(in_path, part, start, length)
+                continue
+        yield make_job(in_path)
+
+
+def job_seed(job: Job, options: Dict[str, Any]) -> int:
+    """
+    Seed случайных параметров задания: зависит от содержимого входа, отрезка и
+    параметра seed. Повторная обработка того же файла даёт тот же результат;
+    чтобы получить другие варианты, достаточно сменить seed. При заданном seed
+    вход различается по имени и размеру: весь файл ради этого не хэшируется.
+    """
+    if options["seed"] is None:
+        source = content_hash(job.in_path)
+    else:
+        source = [os.path.basename(job.in_path), os.path.getsize(job.in_path)]
+    material = json.dumps([source, job.start, job.duration, options["seed"]])
+    return int(hashlib.sha256(material.encode()).hexdigest()[:16], 16)
+
+
+def job_cache_key(job: Job, options: Dict[str, Any], seed: int) -> str:
+    """Ключ кэша результатов: содержимое входа (и наложения), seed и все параметры."""
+    overlay = options["overlay_file"]
+    material = json.dumps({
+        "input": content_hash(job.in_path),
+        "overlay": content_hash(overlay) if overlay and os.path.exists(overlay) else None,
+        "start": job.start, "duration": job.duration, "outputs": len(job.outputs),
+        "seed": seed, "options": options,
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+def _fetch_cached(job: Job, partials: List[str], output_cache: OutputCache, key: str) -> Optional[Dict[str, Any]]:
+    """Берёт все выходы задания из кэша; если хоть одного нет — промах."""
+    meta = None
+    for index, partial in enumerate(partials):
+        entry = output_cache.fetch(f"{key}_{index}", partial)
+        if entry is None:
+            return None
+        meta = meta or entry
+    result = dict(meta, input=job.in_path, output=job.out_path, cached=True, elapsed=0.0)
+    if "variants" in result:
+        result["variants"] = [dict(v, output=path) for v, path in zip(result["variants"], job.outputs)]
+    return result
+
+
+def run_job(job: Job, options: Dict[str, Any], threads: Optional[int] = None,
+            chunk_workers: int = 1, progress_callback: Optional[ProgressCallback] = None,
+            journal: Optional[JobJournal] = None, output_cache: Optional[OutputCache] = None,
+            metrics: Optional[BatchMetrics] = None, governor: Optional[Governor] = None,
+            partial_tag: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Выполняет одно задание: выбирает zoom/скорость и вызывает process_single.
+    Задание с несколькими вариантами выполняется одним запуском process_variants.
+    Длинные файлы при включённом chunk_parallel кодируются кусками
+    параллельно: chunk_workers процессов делят между собой threads потоков задания.
+    Случайные параметры выбираются генератором с seed задания (job_seed), поэтому
+    при переданном output_cache готовый результат с тем же ключом берётся из кэша.
+    Результаты пишутся во временные файлы и переименовываются только после
+    успешного завершения (partial_tag — своё временное имя, см. partial_path);
+    ход задания отмечается в journal, если он передан.
+    В metrics записывается расход ресурсов задания (время, CPU и память ffmpeg, объёмы).
+    Задание отменяется по ключу job.out_path (utils.cancellation); тогда
+    выбрасывается Cancelled, а недописанные результаты удаляются.
+    С governor задание сначала ждёт допуска по нагрузке системы, а число
+    потоков берётся из выданного разрешения вместо threads (кусками — на все слоты, что оно заняло).
+    Возвращает описание результата (для логов и JSON-вывода).
+    """
+    if governor is not None:
+        with governor.admit(job, options, _planned_processes(job, options, chunk_workers)) as grant:
+            return run_job(job, options, grant.threads, chunk_workers, progress_callback,
+                           journal, output_cache, metrics, partial_tag=partial_tag)
+    if journal is not None:
+        journal.start(job, options)
+    partials = [partial_path(path, partial_tag) for path in job.outputs]
+    job_metrics = (metrics.start_job(job, partials, encoding_summary(options["output_format"]))
+                   if metrics is not None else None)
+    try:
+        with track(job_metrics), job_scope(job.out_path):
+            check_cancelled()
+            seed = job_seed(job, options)
+            key = job_cache_key(job, options, seed) if output_cache is not None else None
+            result = _fetch_cached(job, partials, output_cache, key) if key else None
+            if result is None:
+                result = _run_job(job, options, partials, threads, chunk_workers, progress_callback,
+                                  random.Random(seed))
+                result["seed"] = seed
+                if key:
+                    with phase("finalize"):
+                        for index, partial in enumerate(partials):
+                            output_cache.store(f"{key}_{index}", partial, result)
+            with phase("finalize"):
+                for partial, path in zip(partials, job.outputs):
+                    os.replace(partial, path)
+    except BaseException as e:
+        for partial in partials:
+            if os.path.exists(partial):
+                try:
+                    os.remove(partial)
+                except OSError:
+                    pass
+        if journal is not None:
+            journal.fail(job, f"{type(e).__name__}: {e}")
+        if metrics is not None:
+            status = "cancelled" if isinstance(e, Cancelled) else "failed"
+            metrics.record(job_metrics.finish(status, f"{type(e).__name__}: {e}"))
+        raise
+    if journal is not None:
+        with track(job_metrics), phase("finalize"):
+            journal.finish(job, result)
+    if metrics is not None:
+        metrics.record(job_metrics.finish("cached" if result.get("cached") else "ok"))
+    return result
+
+
+def _planned_processes(job: Job, options: Dict[str, Any], chunk_workers: int) -> int:
+    """Сколько ffmpeg задание запустит одновременно: chunk_workers, если его, скорее всего, будут резать на куски."""
+    if not options["chunk_parallel"] or chunk_workers <= 1 or job.in_path.lower().endswith('.gif'):
+        return 1
+    length = job.duration or (job.info.duration if job.info else 0.0)
+    return chunk_workers if not length or length >= CHUNK_MIN_DURATION else 1
+
+
+def _run_job(job: Job, options: Dict[str, Any], outputs: List[str], threads: Optional[int],
+             chunk_workers: int, progress_callback: Optional[ProgressCallback], rng: random.Random) -> Dict[str, Any]:
+    zoom_values = [pick_percent(options["zoom_mode"], options["zoom_min"], options["zoom_max"], rng)
+                   for _ in outputs]
+    speed_values = [pick_percent(options["speed_mode"], options["speed_min"], options["speed_max"], rng)
+                    for _ in outputs]
+    color_filters = [resolve_color_filters(options["filters"], rng) for _ in outputs]
+    kwargs = dict(
+        in_path=job.in_path,
+        filters=options["filters"],
+        overlay_file=options["overlay_file"],
+        overlay_pos=options["overlay_pos"],
+        output_format=options["output_format"],
+        blur_background=options["blur_background"],
+        blur_quality=options["blur_quality"],
+        blur_reuse_frames=options["blur_reuse_frames"],
+        mute_audio=options["mute_audio"],
+        strip_metadata=options["strip_metadata"],
+        threads=threads,
+        start=job.start,
+        duration=job.duration,
+        progress_callback=progress_callback,
+    )
+    if job.in_path.lower().endswith('.gif'):
+        kwargs.update(gif_loops=options["gif_loops"], gif_duration=options["gif_duration"],
+                      gif_silent_audio=options["gif_silent_audio"])
+    started = time.monotonic()
+    chunked = False
+    smart = False
+    if len(outputs) > 1:
+        process_variants(out_paths=outputs, zoom_values=zoom_values, speed_values=speed_values,
+                         color_filters=color_filters, **kwargs)
+    else:
+        single = dict(kwargs, out_path=outputs[0], zoom_p=zoom_values[0], speed_p=speed_values[0],
+                      color_filters=color_filters[0])
+        is_gif = job.in_path.lower().endswith('.gif')
+        if job.duration and not is_gif:
+            # Отрезок без изменений кадра: целые GOP копируются, перекодируются только границы
+            smart = _smart_cut(job, options, single)
+        if not smart and options["chunk_parallel"] and chunk_workers > 1 and not is_gif:
+            info = job.info or probe_media(job.in_path)
+            length = job.duration or info.duration
+            # Видео, которое копируется без перекодирования, резать на куски незачем
+            copy_video = plan_stream_copy(
+                info, output_target(options["output_format"]), zoom_values[0], speed_values[0],
+                color_filters[0], bool(options["overlay_file"]),
+                options["mute_audio"], job.start, video_bitrate_cap(encoding_profile(options["output_format"]))
+            ).copy_video
+            chunked = length >= CHUNK_MIN_DURATION and not copy_video
+        if chunked:
+            # Куски делят потоки задания: иначе каждый из chunk_workers процессов занял бы целую долю CPU
+            chunk_threads = max(1, threads // chunk_workers) if threads else None
+            process_chunked(chunks=chunk_workers, **dict(single, threads=chunk_threads))
+        elif not smart:
+            process_single(**single)
+    result = {
+        "input": job.in_path,
+        "output": job.out_path,
+        "start": job.start,
+        "duration": job.duration,
+        "zoom": zoom_values[0],
+        "speed": speed_values[0],
+        "chunked": chunked,
+        "smart_cut": smart,
+        "elapsed": round(time.monotonic() - started, 3),
+    }
+    max_duration = encoding_profile(options["output_format"])["max_duration"]
+    if max_duration and not job.in_path.lower().endswith('.gif'):
+        # Результат не обрезается до предела площадки: только отмечается
+        length = job.duration or (job.info or probe_media(job.in_path)).duration
+        longest = length / (min(speed_values) / 100.0)
+        if longest > max_duration:
+            result["over_max_duration"] = max_duration
+            print(f"Warning: Output of '{os.path.basename(job.in_path)}' is {longest:.0f}s long, "
+                  f"over the {max_duration}s limit of '{options['output_format']}'.")
+    if len(outputs) > 1:
+        result["variants"] = [
+            {"output": path, "zoom": zoom, "speed": speed}
+            for path, zoom, speed in zip(job.outputs, zoom_values, speed_values)
+        ]
+    return result
+
+
+def _smart_cut(job: Job, options: Dict[str, Any], single: Dict[str, Any]) -> bool:
+    """
+    Точная нарезка отрезка без полного перекодирования (utils.smart_cut), если его
+    кадры ничто не меняет. При ошибке отрезок перекодируется обычным способом.
+    """
+    info = job.info or probe_media(job.in_path)
+    profile = encoding_profile(options["output_format"])
+    plan = plan_stream_copy(info, output_target(options["output_format"]), single["zoom_p"], single["speed_p"],
+                            single["color_filters"], bool(options["overlay_file"]), options["mute_audio"],
+                            max_kbps=video_bitrate_cap(profile))
+    if not plan.copy_video:
+        return False
+    try:
+        return smart_cut(job.in_path, single["out_path"], job.start or 0.0, job.duration, info,
+                         mute_audio=options["mute_audio"], copy_audio=plan.copy_audio,
+                         strip_metadata=options["strip_metadata"], threads=single["threads"],
+                         progress_callback=single["progress_callback"])
+    except Cancelled:
+        raise
+    except Exception as e:
+        print(f"Warning: Smart cut of '{os.path.basename(job.in_path)}' failed, re-encoding the part: {e}")
+        return False
@@ -0,0 +1,146 @@
+# utils/journal.py
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+from .constants import JOURNAL_FILE_NAME, PARTIAL_OUTPUT_PREFIX, CHUNK_DIR_PREFIX
+
+
+def partial_path(out_path: str, tag: Optional[str] = None) -> str:
+    """
+    Временное имя, под которым пишется результат до успешного завершения.
+    tag делает имя уникальным, когда один выход могут писать несколько узлов (аренда задания).
+    """
+    directory, name = os.path.split(out_path)
+    prefix = f"{PARTIAL_OUTPUT_PREFIX}{tag}_" if tag else PARTIAL_OUTPUT_PREFIX
+    return os.path.join(directory, f"{prefix}{name}")
+
+
+def file_checksum(path: str, block_size: int = 1 << 20) -> str:
+    """SHA-256 содержимого файла."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def remove_partials(out_dir: str) -> int:
+    """Удаляет недописанные результаты и временные папки кусков. Возвращает число удалённых."""
+    removed = 0
+    try:
+        entries = list(os.scandir(out_dir))
+    except OSError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.name.startswith(PARTIAL_OUTPUT_PREFIX) and entry.is_file():
+                os.remove(entry.path)
+                removed += 1
+            elif entry.name.startswith(CHUNK_DIR_PREFIX) and entry.is_dir():
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        except OSError as e:
+            print(f"Warning: Cannot remove partial output '{entry.name}': {e}")
+    return removed
+
+
+class JobJournal:
+    """
+    Журнал заданий пакета в SQLite рядом с результатами (out_dir).
+    Для каждого задания хранит входной файл (путь, размер, mtime), параметры,
+    статус (running/done/failed), выбранные zoom/скорость и контрольные суммы выходов.
+    По журналу режим продолжения пропускает уже выполненные задания.
+    """
+
+    def __init__(self, out_dir: str):
+        self.path = os.path.join(out_dir, JOURNAL_FILE_NAME)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "out_path TEXT PRIMARY KEY, in_path TEXT NOT NULL, in_size INTEGER, in_mtime_ns INTEGER, "
+            "params TEXT NOT NULL, status TEXT NOT NULL, result TEXT, outputs TEXT, "
+            "error TEXT, started REAL, finished REAL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _params(job, options: Dict[str, Any]) -> str:
+        return json.dumps({"options": options, "start": job.start, "duration": job.duration,
+                           "outputs": job.outputs}, ensure_ascii=False, sort_keys=True)
+
+    @staticmethod
+    def _input_identity(path: str):
+        try:
+            st = os.stat(path)
+            return st.st_size, st.st_mtime_ns
+        except OSError:
+            return None, None
+
+    def is_done(self, job, options: Dict[str, Any]) -> bool:
+        """
+        Задание выполнено, если в журнале оно завершено с теми же параметрами,
+        входной файл не менялся и все выходы на месте с записанным размером.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT in_size, in_mtime_ns, params, status, outputs FROM jobs WHERE out_path=?",
+                (job.out_path,)
+            ).fetchone()
+        if row is None or row[3] != "done":
+            return False
+        if (row[0], row[1]) != self._input_identity(job.in_path) or row[2] != self._params(job, options):
+            return False
+        for output in json.loads(row[4] or "[]"):
+            try:
+                if os.path.getsize(output["path"]) != output["size"]:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def start(self, job, options: Dict[str, Any]):
+        size, mtime_ns = self._input_identity(job.in_path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (out_path, in_path, in_size, in_mtime_ns, params, status, started) "
+                "VALUES (?, ?, ?, ?, ?, 'running', ?)",
+                (job.out_path, job.in_path, size, mtime_ns, self._params(job, options), time.time())
+            )
+            self._conn.commit()
+
+    def finish(self, job, result: Dict[str, Any]):
+        outputs = [{"path": p, "size": os.path.getsize(p), "sha256": file_checksum(p)} for p in job.outputs]
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status='done', result=?, outputs=?, error=NULL, finished=? WHERE out_path=?",
+                (json.dumps(result, ensure_ascii=False), json.dumps(outputs, ensure_ascii=False),
+                 time.time(), job.out_path)
+            )
+            self._conn.commit()
+
+    def fail(self, job, error: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status='failed', error=?, finished=? WHERE out_path=?",
+                (error, time.time(), job.out_path)
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_journal(out_dir: str) -> Optional[JobJournal]:
+    """Открывает журнал; если это невозможно (папка только для чтения и т.п.), работа идёт без него."""
+    try:
+        return JobJournal(out_dir)
+    except sqlite3.Error as e:
+        print(f"Warning: Job journal disabled, cannot open it in '{out_dir}': {e}")
+        return None
@@ -0,0 +1,259 @@
+# utils/metrics.py
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+from .constants import METRICS_JSONL_PATH, METRICS_TEXTFILE_PATH, METRICS_PROFILE
+
+# ru_maxrss в килобайтах на Linux и в байтах на macOS
+_RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+_local = threading.local()
+
+
+def wait_process(process):
+    """
+    Ждёт завершения процесса и возвращает (код выхода, rusage). rusage берётся
+    из os.wait4 — это расход именно этого процесса; там, где wait4 нет (Windows), — None.
+    """
+    if hasattr(os, "wait4"):
+        try:
+            _, status, usage = os.wait4(process.pid, 0)
+        except ChildProcessError:
+            return process.wait(), None
+        process.returncode = os.waitstatus_to_exitcode(status)
+        return process.returncode, usage
+    return process.wait(), None
+
+
+class JobMetrics:
+    """
+    Расход ресурсов одного задания: сумма по всем его ffmpeg-процессам
+    (включая куски при параллельном кодировании). Этапы (phases) считаются,
+    только если включено профилирование, и суммируются по процессам.
+    encoding — параметры профиля кодирования, с которыми делалось задание (для подбора профилей).
+    """
+
+    def __init__(self, job, outputs: List[str], profile: bool = False,
+                 encoding: Optional[Dict[str, Any]] = None):
+        self.job = job
+        self.encoding = encoding
+        self.outputs = {os.path.abspath(p) for p in outputs}
+        self.started = time.monotonic()
+        self.cpu_user = 0.0
+        self.cpu_sys = 0.0
+        self.peak_rss = 0
+        self.processes = 0
+        self.encode_seconds = 0.0
+        self.output_duration = 0.0
+        self.output_frames = 0
+        self.phases: Optional[Dict[str, float]] = {} if profile else None
+        self._lock = threading.Lock()
+
+    def add_process(self, spawn_seconds: float, run_seconds: float, usage,
+                    output_path: str, progress: Optional[Dict[str, Any]]):
+        with self._lock:
+            self.processes += 1
+            self.encode_seconds += run_seconds
+            if usage is not None:
+                self.cpu_user += usage.ru_utime
+                self.cpu_sys += usage.ru_stime
+                self.peak_rss = max(self.peak_rss, usage.ru_maxrss * _RSS_UNIT)
+            # Длительность и число кадров результата — по процессу, который пишет сам выход
+            if progress and os.path.abspath(output_path) in self.outputs:
+                self.output_duration = max(self.output_duration, progress["out_time"])
+                self.output_frames = max(self.output_frames, progress["frame"])
+        self.add_phase("spawn", spawn_seconds)
+        self.add_phase("encode", run_seconds)
+
+    def add_phase(self, name: str, seconds: float):
+        if self.phases is None:
+            return
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def finish(self, status: str, error: Optional[str] = None) -> Dict[str, Any]:
+        """Запись для JSONL: время, CPU, память, объёмы, битрейт результата и скорость кодирования."""
+        wall = time.monotonic() - self.started
+        job = self.job
+        try:
+            input_bytes = os.path.getsize(job.in_path)
+        except OSError:
+            input_bytes = 0
+        output_bytes = 0
+        if status in ("ok", "cached"):
+            output_bytes = sum(os.path.getsize(p) for p in job.outputs if os.path.exists(p))
+        record = {
+            "time": round(time.time(), 3),
+            "job": job.name,
+            "input": job.in_path,
+            "outputs": job.outputs,
+            "start": job.start,
+            "duration": job.duration,
+            "status": status,
+            "wall": round(wall, 3),
+            "cpu_user": round(self.cpu_user, 3),
+            "cpu_sys": round(self.cpu_sys, 3),
+            "peak_rss": self.peak_rss,
+            "processes": self.processes,
+            "input_bytes": input_bytes,
+            "output_bytes": output_bytes,
+            "output_duration": round(self.output_duration, 3),
+            # Средний битрейт одного выхода (кбит/с)
+            "output_kbps": (round(output_bytes * 8 / 1000 / self.output_duration / len(job.outputs), 1)
+                            if self.output_duration > 0 else 0.0),
+            "encode_seconds": round(self.encode_seconds, 3),
+            "encode_fps": round(self.output_frames / wall, 2) if wall > 0 else 0.0,
+        }
+        if self.encoding is not None:
+            record["encoding"] = self.encoding
+        if error:
+            record["error"] = error
+        if self.phases is not None:
+            record["phases"] = {name: round(seconds, 3) for name, seconds in self.phases.items()}
+        return record
+
+
+def current_job() -> Optional[JobMetrics]:
+    """Метрики задания, которое выполняется в этом потоке (или None)."""
+    return getattr(_local, "job", None)
+
+
+@contextmanager
+def track(job_metrics: Optional[JobMetrics]):
+    """Привязывает метрики задания к текущему потоку: run_ffmpeg запишет в них расход процессов."""
+    previous = current_job()
+    _local.job = job_metrics
+    try:
+        yield job_metrics
+    finally:
+        _local.job = previous
+
+
+def bound(fn: Callable) -> Callable:
+    """Оборачивает функцию для пула потоков так, чтобы она писала в метрики вызывающего задания."""
+    job_metrics = current_job()
+    if job_metrics is None:
+        return fn
+
+    def wrapper(*args, **kwargs):
+        with track(job_metrics):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def phase(name: str):
+    """Профилирование: время блока добавляется к этапу name текущего задания."""
+    job_metrics = current_job()
+    if job_metrics is None or job_metrics.phases is None:
+        yield
+        return
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        job_metrics.add_phase(name, time.monotonic() - started)
+
+
+class BatchMetrics:
+    """
+    Метрики пакета: каждое задание дописывается строкой в JSONL, а сводка пакета
+    (задания по статусам, время, CPU, пиковая память, объёмы) переписывается
+    в textfile для node_exporter после каждого задания.
+    """
+
+    def __init__(self, jsonl_path: str = METRICS_JSONL_PATH, textfile_path: Optional[str] = METRICS_TEXTFILE_PATH,
+                 profile: bool = METRICS_PROFILE):
+        self.jsonl_path = jsonl_path
+        self.textfile_path = textfile_path
+        self.profile = profile
+        self.batch_started = time.time()
+        self.running = True
+        self.jobs: Dict[str, int] = {"ok": 0, "cached": 0, "failed": 0, "cancelled": 0}
+        self.totals = {"wall": 0.0, "cpu_user": 0.0, "cpu_sys": 0.0, "input_bytes": 0,
+                       "output_bytes": 0, "output_duration": 0.0, "encode_seconds": 0.0}
+        self.peak_rss = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(jsonl_path), exist_ok=True)
+        if textfile_path:
+            os.makedirs(os.path.dirname(textfile_path), exist_ok=True)
+        self._file = open(jsonl_path, "a", encoding="utf-8")
+
+    def start_job(self, job, outputs: List[str], encoding: Optional[Dict[str, Any]] = None) -> JobMetrics:
+        return JobMetrics(job, outputs, self.profile, encoding)
+
+    def record(self, record: Dict[str, Any]):
+        with self._lock:
+            try:
+                self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                self._file.flush()
+            except (OSError, ValueError) as e:
+                print(f"Warning: Cannot write job metrics: {e}")
+            self.jobs[record["status"]] = self.jobs.get(record["status"], 0) + 1
+            for key in self.totals:
+                self.totals[key] += record.get(key) or 0
+            self.peak_rss = max(self.peak_rss, record.get("peak_rss") or 0)
+            self._write_textfile()
+
+    def _write_textfile(self):
+        if not self.textfile_path:
+            return
+        metrics = [
+            ("uniqueizer_jobs_total", "counter", "Jobs finished in the current batch by status.",
+             [({"status": status}, count) for status, count in sorted(self.jobs.items())]),
+            ("uniqueizer_job_wall_seconds_total", "counter", "Wall time spent on jobs.",
+             [({}, self.totals["wall"])]),
+            ("uniqueizer_ffmpeg_cpu_seconds_total", "counter", "CPU time of ffmpeg processes.",
+             [({"mode": "user"}, self.totals["cpu_user"]), ({"mode": "system"}, self.totals["cpu_sys"])]),
+            ("uniqueizer_ffmpeg_peak_rss_bytes", "gauge", "Largest peak RSS of a single ffmpeg process.",
+             [({}, self.peak_rss)]),
+            ("uniqueizer_input_bytes_total", "counter", "Bytes of input files.",
+             [({}, self.totals["input_bytes"])]),
+            ("uniqueizer_output_bytes_total", "counter", "Bytes of written outputs.",
+             [({}, self.totals["output_bytes"])]),
+            ("uniqueizer_output_media_seconds_total", "counter", "Duration of encoded outputs.",
+             [({}, self.totals["output_duration"])]),
+            ("uniqueizer_ffmpeg_run_seconds_total", "counter", "Wall time of ffmpeg processes.",
+             [({}, self.totals["encode_seconds"])]),
+            ("uniqueizer_batch_start_time_seconds", "gauge", "Unix time the batch started.",
+             [({}, self.batch_started)]),
+            ("uniqueizer_batch_running", "gauge", "1 while the batch is running.",
+             [({}, int(self.running))]),
+            ("uniqueizer_last_update_time_seconds", "gauge", "Unix time of the last update.",
+             [({}, time.time())]),
+        ]
+        lines = []
+        for name, kind, help_text, samples in metrics:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                value = round(value, 3) if isinstance(value, float) else value
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        # node_exporter может прочитать файл в любой момент, поэтому он подменяется целиком
+        tmp = f"{self.textfile_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            os.replace(tmp, self.textfile_path)
+        except OSError as e:
+            print(f"Warning: Cannot write metrics textfile: {e}")
+
+    def close(self):
+        with self._lock:
+            self.running = False
+            self._write_textfile()
+            self._file.close()
+
+
+def open_metrics(profile: bool = METRICS_PROFILE) -> Optional[BatchMetrics]:
+    """Открывает запись метрик; если это невозможно, работа идёт без них."""
+    try:
+        return BatchMetrics(profile=profile)
+    except OSError as e:
+        print(f"Warning: Job metrics disabled: {e}")
+        return None
@@ -0,0 +1,109 @@
+# utils/output_cache.py
+import os
+import json
+import shutil
+import sqlite3
+import threading
+from typing import Any, Dict, Optional
+from .constants import OUTPUT_CACHE_DIR, OUTPUT_CACHE_MAX_BYTES
+
+
+def _place(src: str, dest: str):
+    """
+    Копия файла. Не жёсткая ссылка: результат у пользователя и запись кэша
+    должны меняться независимо, иначе правка одного портит другой.
+    """
+    if os.path.exists(dest):
+        os.remove(dest)
+    shutil.copyfile(src, dest)
+
+
+class OutputCache:
+    """
+    Кэш готовых результатов, адресуемый по содержимому: ключ задаёт вход (хэш
+    содержимого), seed и все параметры обработки. Файлы лежат в cache/outputs,
+    индекс — в SQLite. Общий объём ограничен max_bytes, лишнее вытесняется по LRU.
+    """
+
+    def __init__(self, cache_dir: str = OUTPUT_CACHE_DIR, max_bytes: int = OUTPUT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(cache_dir, "index.sqlite"), timeout=30, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS outputs ("
+            "key TEXT PRIMARY KEY, size INTEGER NOT NULL, meta TEXT, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS outputs_last_used ON outputs(last_used)")
+        self._conn.commit()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.mp4")
+
+    def fetch(self, key: str, dest: str) -> Optional[Dict[str, Any]]:
+        """Кладёт закэшированный результат в dest. Возвращает сохранённые сведения или None при промахе."""
+        with self._lock:
+            row = self._conn.execute("SELECT size, meta FROM outputs WHERE key=?", (key,)).fetchone()
+            if row is None:
+                return None
+            path = self._file(key)
+            try:
+                if os.path.getsize(path) != row[0]:
+                    raise OSError("size mismatch")
+                _place(path, dest)
+            except OSError:
+                # Файл удалён или повреждён снаружи — запись больше не годится
+                self._conn.execute("DELETE FROM outputs WHERE key=?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE outputs SET last_used=julianday('now') WHERE key=?", (key,))
+            self._conn.commit()
+            return json.loads(row[1] or "{}")
+
+    def store(self, key: str, src: str, meta: Optional[Dict[str, Any]] = None):
+        """Сохраняет готовый файл src под ключом key и вытесняет старые записи сверх лимита."""
+        size = os.path.getsize(src)
+        if size > self.max_bytes:
+            return
+        path = self._file(key)
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                _place(src, path)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO outputs (key, size, meta, last_used) VALUES (?, ?, ?, julianday('now'))",
+                    (key, size, json.dumps(meta or {}, ensure_ascii=False))
+                )
+                self._conn.commit()
+                self._evict()
+            except (OSError, sqlite3.Error) as e:
+                print(f"Warning: Cannot store output in cache: {e}")
+
+    def _evict(self):
+        (total,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM outputs").fetchone()
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM outputs ORDER BY last_used").fetchall():
+            try:
+                os.remove(self._file(key))
+            except OSError:
+                pass
+            self._conn.execute("DELETE FROM outputs WHERE key=?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_output_cache() -> Optional[OutputCache]:
+    """Открывает кэш результатов; если это невозможно, работа идёт без него."""
+    try:
+        return OutputCache()
+    except (OSError, sqlite3.Error) as e:
+        print(f"Warning: Output cache disabled: {e}")
+        return None
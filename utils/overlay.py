@@ -0,0 +1,114 @@
+# utils/overlay.py
+import os
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+from .constants import OVERLAY_CACHE_DIR, OVERLAY_PREPARED_MAX_BYTES
+from .probe import probe_media, content_hash
+from .cancellation import Cancelled
+
+
+@dataclass
+class PreparedOverlay:
+    """
+    Картинка/GIF для наложения, уже декодированные в RGBA и вписанные в кадр
+    (или исходный файл, если подготовить не удалось: тогда rgba и scaled — False).
+    """
+    path: str
+    animated: bool
+    rgba: bool = False
+    scaled: bool = False
+
+
+_prepared: Dict[Tuple[str, int, int, Optional[Tuple[int, int]]], PreparedOverlay] = {}
+_lock = threading.Lock()
+
+
+def fit_filter(target: Optional[Tuple[int, int]]) -> Optional[str]:
+    """Уменьшает наложение, которое больше целевого кадра, до размера кадра (пропорции сохраняются)."""
+    if not target:
+        return None
+    width, height = target
+    return f"scale='min(iw,{width})':'min(ih,{height})':force_original_aspect_ratio=decrease"
+
+
+def _estimate_raw_size(path: str) -> int:
+    info = probe_media(path)
+    frames = info.nb_frames or max(1, int(round(info.duration * info.fps)))
+    return info.width * info.height * 4 * frames
+
+
+# Запуск ffmpeg с аргументами (без пути к ffmpeg) для входа path
+Runner = Callable[[List[str], str], None]
+
+
+def _run(args: List[str], path: str):
+    from .ffmpeg_utils import FFMPEG_PATH_EFFECTIVE, run_ffmpeg
+
+    run_ffmpeg([FFMPEG_PATH_EFFECTIVE] + args, input_file_for_log=path)
+
+
+def _render(src: str, dest: str, animated: bool, target: Optional[Tuple[int, int]] = None,
+            runner: Runner = _run):
+    tmp = dest + ".tmp"
+    args = ["-y", "-i", src, "-map", "0:v:0"]
+    if not animated:
+        args.extend(["-frames:v", "1"])
+    if target:
+        args.extend(["-vf", fit_filter(target)])
+    # Несжатые кадры RGBA: при наложении их не нужно ни декодировать, ни конвертировать
+    args.extend(["-c:v", "rawvideo", "-pix_fmt", "rgba", "-f", "nut", tmp])
+    try:
+        runner(args, src)
+        os.replace(tmp, dest)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _prepare_rgba(path: str, animated: bool, target: Optional[Tuple[int, int]] = None,
+                  runner: Runner = _run) -> PreparedOverlay:
+    st = os.stat(path)
+    key = (os.path.normcase(os.path.abspath(path)), st.st_size, st.st_mtime_ns, target)
+    with _lock:
+        if key in _prepared:
+            return _prepared[key]
+        prepared = PreparedOverlay(path, animated)
+        try:
+            if _estimate_raw_size(path) <= OVERLAY_PREPARED_MAX_BYTES:
+                os.makedirs(OVERLAY_CACHE_DIR, exist_ok=True)
+                suffix = f"_{target[0]}x{target[1]}" if target else ""
+                dest = os.path.join(OVERLAY_CACHE_DIR, f"{content_hash(path)}{suffix}.nut")
+                if not os.path.exists(dest):
+                    _render(path, dest, animated, target, runner)
+                prepared = PreparedOverlay(dest, animated, rgba=True, scaled=True)
+            else:
+                print(f"Info: '{os.path.basename(path)}' is too large to pre-decode, using it as is.")
+        except Cancelled:
+            raise
+        except Exception as e:
+            print(f"Warning: Cannot pre-decode '{os.path.basename(path)}', using it as is: {e}")
+        _prepared[key] = prepared
+        return prepared
+
+
+def prepare_overlay(overlay_file: str, target: Optional[Tuple[int, int]] = None,
+                    runner: Runner = _run) -> PreparedOverlay:
+    """
+    Готовит наложение один раз на пакет: кадры GIF (один цикл) или картинка
+    декодируются в RGBA, вписываются в целевой кадр target (fit_filter) и
+    сохраняются в cache/overlays под хэшем содержимого и размером кадра.
+    Задания ссылаются на готовый файл: картинка — один кадр, который overlay
+    повторяет сам, GIF — короткий цикл, зацикливаемый через -stream_loop.
+    Слишком большие GIF и ошибки подготовки — исходный файл как раньше.
+    runner запускает ffmpeg подготовки (по умолчанию run_ffmpeg заданий).
+    """
+    return _prepare_rgba(overlay_file, overlay_file.lower().endswith(".gif"), target, runner)
+
+
+def prepare_gif(gif_path: str) -> PreparedOverlay:
+    """
+    Один цикл входного GIF, декодированный в RGBA. Нужен, когда GIF повторяется
+    несколько раз: палитровые кадры декодируются один раз, а не на каждом повторе.
+    """
+    return _prepare_rgba(gif_path, True)
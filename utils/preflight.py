@@ -0,0 +1,71 @@
+# utils/preflight.py
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+from .constants import PREFLIGHT_WORKERS
+from .probe import MediaInfo, probe_media
+
+# Вызывается по мере проверки: путь, MediaInfo (или None) и причина отказа (или None)
+PreflightCallback = Callable[[str, Optional[MediaInfo], Optional[str]], None]
+
+
+def check_input(path: str) -> MediaInfo:
+    """
+    Проверяет входной файл до начала кодирования и возвращает его MediaInfo.
+    Негодный файл (нет доступа, пустой, битый, без видеопотока) — ValueError с причиной.
+    """
+    if not os.path.isfile(path):
+        raise ValueError("файл не найден")
+    if not os.access(path, os.R_OK):
+        raise ValueError("нет доступа на чтение")
+    if os.path.getsize(path) == 0:
+        raise ValueError("пустой файл")
+    try:
+        info = probe_media(path)
+    except (RuntimeError, ValueError) as e:
+        raise ValueError(f"не удалось прочитать файл: {e}")
+    if not info.has_video:
+        raise ValueError("нет видеопотока" + (" (только звук)" if info.has_audio else ""))
+    if info.width <= 0 or info.height <= 0:
+        raise ValueError("не удалось определить разрешение видео")
+    # У GIF длительность часто не указана, для них она считается при обработке
+    if info.duration <= 0 and not path.lower().endswith('.gif'):
+        raise ValueError("не удалось определить длительность")
+    return info
+
+
+def preflight(files: List[str], workers: int = PREFLIGHT_WORKERS,
+              on_result: Optional[PreflightCallback] = None,
+              should_stop: Optional[Callable[[], bool]] = None) -> Tuple[Dict[str, MediaInfo], List[Tuple[str, str]]]:
+    """
+    Проверяет все входы параллельно (не больше workers запусков ffprobe сразу).
+    Возвращает MediaInfo годных файлов по пути и список отклонённых (путь, причина)
+    в порядке входного списка. Результаты ffprobe попадают в кэш, так что
+    дальнейшие шаги пакета получают сведения о файлах без повторного запуска.
+    """
+    infos: Dict[str, MediaInfo] = {}
+    reasons: Dict[str, str] = {}
+    unique = list(dict.fromkeys(files))
+    if not unique:
+        return infos, []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(unique)))) as pool:
+        futures = {pool.submit(check_input, path): path for path in unique}
+        for future in as_completed(futures):
+            path = futures[future]
+            info, reason = None, None
+            try:
+                info = future.result()
+                infos[path] = info
+            except FileNotFoundError:
+                raise
+            except Exception as e:
+                reason = str(e) if isinstance(e, ValueError) else f"{type(e).__name__}: {e}"
+                reasons[path] = reason
+            if on_result is not None:
+                on_result(path, info, reason)
+            if should_stop is not None and should_stop():
+                for pending in futures:
+                    pending.cancel()
+                break
+    rejected = [(path, reasons[path]) for path in unique if path in reasons]
+    return infos, rejected
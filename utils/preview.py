@@ -0,0 +1,228 @@
+# utils/preview.py
+import os
+import glob
+import random
+import platform
+import threading
+import subprocess
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set, Tuple
+from .constants import (
+    PREVIEW_CACHE_DIR, PREVIEW_CACHE_MAX_FILES, PREVIEW_SECONDS, PREVIEW_FPS, PREVIEW_HEIGHT,
+    BLUR_QUALITY_LEVELS
+)
+from .ffmpeg_utils import FFMPEG_PATH_EFFECTIVE, output_target, resolve_color_filters
+from .filter_graph import VideoGraphBuilder, Branch, ColorChain
+from .overlay import prepare_overlay, fit_filter as fit_overlay
+from .probe import ProbeCache, probe_media, content_hash
+from .jobs import Job, job_seed, pick_percent
+from .cancellation import Cancelled, popen_group_kwargs, kill_process
+
+
+@dataclass
+class ProxyClip:
+    """Несколько секунд входа, уже декодированные в уменьшенные кадры (rawvideo в NUT)."""
+    path: str
+    width: int
+    height: int
+    scale: float  # во сколько раз кадр меньше исходного
+    frames: int
+
+
+_clips: Dict[Tuple[str, int, int], ProxyClip] = {}
+_lock = threading.Lock()
+
+
+class PreviewCancel:
+    """
+    Отмена одного предпросмотра: cancel() завершает его запущенные ffmpeg, а новые
+    не запускаются. У каждой отрисовки своя отмена, поэтому новая не снимает старую.
+    """
+
+    def __init__(self):
+        self._cancelled = False
+        self._processes: Set[subprocess.Popen] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled = True
+            processes = list(self._processes)
+        for process in processes:
+            try:
+                kill_process(process)
+            except (OSError, ValueError):
+                pass
+
+    def _attach(self, process: subprocess.Popen) -> bool:
+        with self._lock:
+            if self._cancelled:
+                return False
+            self._processes.add(process)
+            return True
+
+    def _detach(self, process: subprocess.Popen):
+        with self._lock:
+            self._processes.discard(process)
+
+
+def _even(value: float) -> int:
+    return max(2, int(round(value / 2.0)) * 2)
+
+
+def _ffmpeg(args: List[str], path: str, cancel: Optional[PreviewCancel] = None):
+    """
+    Запускает ffmpeg предпросмотра. Он не регистрируется в отмене заданий:
+    «Отменить всё» останавливает пакет, а не перерисовку картинки. Вместо этого
+    процесс завершает cancel (PreviewCancel) — тогда выбрасывается Cancelled.
+    """
+    cancel = cancel or PreviewCancel()
+    if cancel.cancelled:
+        raise Cancelled("Предпросмотр остановлен")
+    cmd = [FFMPEG_PATH_EFFECTIVE, "-hide_banner", "-loglevel", "error", "-y"] + args
+    creationflags = 0
+    startupinfo = None
+    if platform.system() == "Windows":
+        creationflags = subprocess.CREATE_NO_WINDOW
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        startupinfo.wShowWindow = subprocess.SW_HIDE
+    group = popen_group_kwargs()
+    creationflags |= group.pop("creationflags", 0)
+    try:
+        process = subprocess.Popen(
+            cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+            encoding='utf-8', errors='replace',
+            creationflags=creationflags, startupinfo=startupinfo, **group
+        )
+    except FileNotFoundError:
+        raise FileNotFoundError(f"ffmpeg executable not found at '{FFMPEG_PATH_EFFECTIVE}'.")
+    if not cancel._attach(process):
+        # Отменили, пока процесс запускался
+        kill_process(process)
+    try:
+        _, stderr = process.communicate()
+    finally:
+        cancel._detach(process)
+    if cancel.cancelled:
+        raise Cancelled("Предпросмотр остановлен")
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg preview failed for '{os.path.basename(path)}': {(stderr or '').strip()}")
+
+
+def _evict():
+    files = sorted(glob.glob(os.path.join(PREVIEW_CACHE_DIR, "*.nut")), key=os.path.getmtime)
+    for path in files[:-PREVIEW_CACHE_MAX_FILES]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def proxy_clip(in_path: str, cancel: Optional[PreviewCancel] = None) -> ProxyClip:
+    """
+    Декодирует PREVIEW_SECONDS из середины входа (GIF — с начала) с частотой
+    PREVIEW_FPS и высотой не больше PREVIEW_HEIGHT. Результат хранится в
+    cache/previews под хэшем содержимого, поэтому при смене настроек вход
+    заново не декодируется — перерисовываются только эти кадры.
+    """
+    key = ProbeCache.key_for(in_path)
+    with _lock:
+        clip = _clips.get(key)
+    if clip is not None and os.path.exists(clip.path):
+        return clip
+    # Декодирование идёт без блокировки: предпросмотр других файлов его не ждёт
+    info = probe_media(in_path)
+    if not info.width or not info.height:
+        raise ValueError(f"Не удалось определить размер кадра '{os.path.basename(in_path)}'")
+    height = _even(min(info.height, PREVIEW_HEIGHT))
+    scale = height / info.height
+    width = _even(info.width * scale)
+    seconds = min(PREVIEW_SECONDS, info.duration) if info.duration else PREVIEW_SECONDS
+    start = 0.0 if in_path.lower().endswith('.gif') else max(0.0, (info.duration - seconds) / 2)
+
+    dest = os.path.join(PREVIEW_CACHE_DIR, f"{content_hash(in_path)}_{height}.nut")
+    if not os.path.exists(dest):
+        os.makedirs(PREVIEW_CACHE_DIR, exist_ok=True)
+        # Своё временное имя: тот же файл может декодироваться двумя отрисовками сразу
+        tmp = f"{dest}.{threading.get_ident()}.tmp"
+        try:
+            _ffmpeg(["-ss", f"{start:.3f}", "-t", f"{seconds:.3f}", "-i", in_path, "-map", "0:v:0", "-an",
+                     "-vf", f"fps={PREVIEW_FPS},scale={width}:{height},format=yuv420p",
+                     "-c:v", "rawvideo", "-f", "nut", tmp], in_path, cancel)
+            os.replace(tmp, dest)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        _evict()
+    clip = ProxyClip(dest, width, height, scale, max(1, int(round(seconds * PREVIEW_FPS))))
+    with _lock:
+        _clips[key] = clip
+    return clip
+
+
+def render_preview(in_path: str, options: Dict[str, Any], out_dir: str, variants: int = 1,
+                   cancel: Optional[PreviewCancel] = None) -> List[str]:
+    """
+    Рисует кадры предпросмотра в out_dir (PNG) и возвращает их пути по порядку.
+    Случайные zoom, скорость и фильтры выбираются тем же seed и в том же порядке,
+    что и при обработке (job_seed, _run_job), а граф собирает тот же VideoGraphBuilder —
+    отличаются только размеры: целевой кадр, наложение и радиусы размытия
+    уменьшены в масштабе прокси. options — нормализованные параметры (normalize_job_options);
+    при variants > 1 показывается первый вариант файла.
+    cancel останавливает отрисовку (её ffmpeg завершаются, выбрасывается Cancelled).
+    """
+    clip = proxy_clip(in_path, cancel)
+    rng = random.Random(job_seed(Job(in_path, ""), options))
+    # Все варианты тянут значения из rng по очереди: сначала zoom каждого, затем скорость
+    zooms = []
+    for _ in range(max(1, variants)):
+        zooms.append(pick_percent(options["zoom_mode"], options["zoom_min"], options["zoom_max"], rng))
+    speeds = []
+    for _ in range(max(1, variants)):
+        speeds.append(pick_percent(options["speed_mode"], options["speed_min"], options["speed_max"], rng))
+    zoom, speed = zooms[0], speeds[0]
+    color = ColorChain.from_exprs(resolve_color_filters(options["filters"], rng))
+
+    target = output_target(options["output_format"])
+    if target:
+        target = (_even(target[0] * clip.scale), _even(target[1] * clip.scale))
+    # Фон переиспользуется столько же секунд, сколько при обработке
+    reuse_frames = options["blur_reuse_frames"]
+    if reuse_frames > 1:
+        fps = probe_media(in_path).fps
+        reuse_frames = max(1, int(round(reuse_frames * PREVIEW_FPS / fps))) if fps else 1
+    builder = VideoGraphBuilder("[0:v]", clip.width, clip.height, target, options["blur_background"],
+                                blur_downscale=BLUR_QUALITY_LEVELS.get(options["blur_quality"], 1),
+                                blur_reuse_frames=reuse_frames, src_fps=PREVIEW_FPS, pixel_scale=clip.scale)
+
+    args = ["-i", clip.path]
+    parts = []
+    overlay_label = None
+    overlay_file = options["overlay_file"]
+    if overlay_file and os.path.exists(overlay_file):
+        full_target = output_target(options["output_format"])
+        # Наложение готовится своим ffmpeg: после «Отменить всё» run_ffmpeg заданий отказывает
+        overlay = prepare_overlay(overlay_file, full_target, lambda args, path: _ffmpeg(args, path, cancel))
+        if overlay.animated:
+            args.extend(["-stream_loop", "-1"])
+        args.extend(["-i", overlay.path])
+        fit = None if overlay.scaled else fit_overlay(full_target)
+        chain = [fit] if fit else []
+        chain.append(f"scale=trunc(iw*{clip.scale:.6f}/2)*2:trunc(ih*{clip.scale:.6f}/2)*2")
+        if not overlay.rgba:
+            chain.append("format=rgba")
+        parts.append(f"[1:v]{','.join(chain)}[ovl]")
+        overlay_label = "[ovl]"
+
+    branch = Branch(ColorChain(color.render(clip.scale)), zoom / 100.0, speed / 100.0,
+                    overlay_label, options["overlay_pos"])
+    video_parts, labels = builder.build([branch])
+    args.extend(["-filter_complex", ";".join(video_parts + parts), "-map", labels[0],
+                 "-frames:v", str(clip.frames), os.path.join(out_dir, "frame_%03d.png")])
+    _ffmpeg(args, in_path, cancel)
+    return sorted(glob.glob(os.path.join(out_dir, "frame_*.png")))
@@ -0,0 +1,306 @@
+# utils/probe.py
+import os
+import json
+import shutil
+import hashlib
+import sqlite3
+import platform
+import threading
+import subprocess
+from collections import OrderedDict
+from dataclasses import dataclass, field, fields, asdict
+from typing import Any, Dict, List, Optional, Tuple
+from .constants import (
+    FFMPEG_PATH, PROBE_CACHE_PATH, PROBE_CACHE_MAX_ENTRIES, PROBE_KEYFRAME_WINDOW, CONTENT_HASH_BLOCK
+)
+from .metrics import phase
+
+FFPROBE_PATH_EFFECTIVE = FFMPEG_PATH.replace("ffmpeg.exe", "ffprobe.exe")
+if not os.path.exists(FFPROBE_PATH_EFFECTIVE):
+    FFPROBE_PATH_EFFECTIVE = shutil.which("ffprobe") or FFPROBE_PATH_EFFECTIVE
+
+
+@dataclass
+class MediaInfo:
+    """Всё, что нужно знать о входном файле, из одного запуска ffprobe."""
+    path: str
+    format_name: str = ""
+    duration: float = 0.0
+    width: int = 0
+    height: int = 0
+    fps: float = 0.0
+    nb_frames: Optional[int] = None
+    video_codec: Optional[str] = None
+    audio_codec: Optional[str] = None
+    has_video: bool = False
+    has_audio: bool = False
+    keyframe_interval: Optional[float] = None
+    file_hash: Optional[str] = None
+    keyframes: Optional[List[float]] = field(default=None, repr=False)
+    streams: List[Dict[str, Any]] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "MediaInfo":
+        # Поля из записей старых версий кэша, которых больше нет, пропускаются
+        known = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in data.items() if k in known})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _parse_rate(rate: Optional[str]) -> float:
+    """Переводит частоту кадров вида '30000/1001' в число."""
+    try:
+        num, _, den = (rate or "0").partition("/")
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _keyframe_interval(packets: List[Dict[str, Any]], video_index: int) -> Optional[float]:
+    """Средний интервал между ключевыми кадрами по пакетам из начала файла."""
+    times = sorted(
+        _to_float(p.get("pts_time")) for p in packets
+        if p.get("stream_index") == video_index and "K" in p.get("flags", "") and "pts_time" in p
+    )
+    if len(times) < 2:
+        return None
+    return (times[-1] - times[0]) / (len(times) - 1)
+
+
+def _ffprobe(args: List[str], path: str) -> str:
+    """Запускает ffprobe с аргументами args для файла path и возвращает stdout."""
+    cmd = [FFPROBE_PATH_EFFECTIVE, "-v", "error"] + args + [path]
+    creationflags = 0
+    startupinfo = None
+    if platform.system() == "Windows":
+        creationflags = subprocess.CREATE_NO_WINDOW
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        startupinfo.wShowWindow = subprocess.SW_HIDE
+    try:
+        with phase("probe"):
+            result = subprocess.run(
+                cmd, capture_output=True, text=True, check=True,
+                encoding='utf-8', errors='replace',
+                creationflags=creationflags, startupinfo=startupinfo
+            )
+    except FileNotFoundError:
+        raise FileNotFoundError(f"ffprobe executable not found at '{FFPROBE_PATH_EFFECTIVE}'.")
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"ffprobe failed for '{os.path.basename(path)}': {(e.stderr or '').strip()}")
+    return result.stdout or ""
+
+
+def _run_ffprobe(path: str) -> Dict[str, Any]:
+    output = _ffprobe([
+        "-of", "json", "-show_format", "-show_streams",
+        "-show_entries", "packet=stream_index,pts_time,flags",
+        "-read_intervals", f"%+{PROBE_KEYFRAME_WINDOW}",
+    ], path)
+    return json.loads(output or "{}")
+
+
+# Времена кадров в индексе округлены до микросекунд: границы по ключевым кадрам сдвигаются
+# на полмиллисекунды внутрь нужного интервала, это меньше длительности кадра при любой частоте до 1000 к/с
+KEYFRAME_EDGE = 0.0005
+
+
+def scan_keyframes(path: str) -> List[float]:
+    """
+    Возвращает времена (сек) всех ключевых кадров видеопотока.
+    Читаются только заголовки пакетов, без декодирования.
+    """
+    output = _ffprobe([
+        "-select_streams", "v:0", "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0",
+    ], path)
+    keyframes = []
+    for line in output.splitlines():
+        pts_time, _, flags = line.strip().partition(",")
+        if "K" in flags and pts_time not in ("", "N/A"):
+            keyframes.append(_to_float(pts_time))
+    return sorted(keyframes)
+
+
+def parse_probe(path: str, data: Dict[str, Any]) -> MediaInfo:
+    """Собирает MediaInfo из JSON-вывода ffprobe."""
+    streams = data.get("streams", [])
+    fmt = data.get("format", {})
+    info = MediaInfo(path=path, format_name=fmt.get("format_name", ""), streams=streams)
+    info.duration = _to_float(fmt.get("duration"))
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    if video:
+        info.has_video = True
+        info.video_codec = video.get("codec_name")
+        info.width = int(video.get("width") or 0)
+        info.height = int(video.get("height") or 0)
+        info.fps = _parse_rate(video.get("avg_frame_rate")) or _parse_rate(video.get("r_frame_rate"))
+        if str(video.get("nb_frames", "")).isdigit():
+            info.nb_frames = int(video["nb_frames"])
+        if not info.duration:
+            info.duration = _to_float(video.get("duration"))
+        info.keyframe_interval = _keyframe_interval(data.get("packets", []), video.get("index", 0))
+    if audio:
+        info.has_audio = True
+        info.audio_codec = audio.get("codec_name")
+    return info
+
+
+class ProbeCache:
+    """
+    Кэш результатов ffprobe: в памяти и в SQLite на диске.
+    Ключ — (путь, размер, mtime), так что изменённый файл пробуется заново.
+    Старые записи вытесняются по принципу LRU.
+    """
+
+    def __init__(self, db_path: str = PROBE_CACHE_PATH, max_entries: int = PROBE_CACHE_MAX_ENTRIES,
+                 memory_entries: int = 1024):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self._memory: "OrderedDict[Tuple[str, int, int], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        try:
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS probes ("
+                "path TEXT NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, "
+                "data TEXT NOT NULL, last_used REAL NOT NULL, "
+                "PRIMARY KEY (path, size, mtime_ns))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS probes_last_used ON probes(last_used)")
+            self._conn.commit()
+        except sqlite3.Error as e:
+            print(f"Warning: Probe cache disabled, cannot open '{db_path}': {e}")
+            self._conn = None
+
+    @staticmethod
+    def key_for(path: str) -> Tuple[str, int, int]:
+        st = os.stat(path)
+        return os.path.normcase(os.path.abspath(path)), st.st_size, st.st_mtime_ns
+
+    def get(self, key: Tuple[str, int, int]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+            if self._conn is None:
+                return None
+            try:
+                row = self._conn.execute(
+                    "SELECT data FROM probes WHERE path=? AND size=? AND mtime_ns=?", key
+                ).fetchone()
+                if row is None:
+                    return None
+                self._conn.execute(
+                    "UPDATE probes SET last_used=julianday('now') WHERE path=? AND size=? AND mtime_ns=?", key
+                )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"Warning: Probe cache read failed: {e}")
+                return None
+            data = json.loads(row[0])
+            self._remember(key, data)
+            return data
+
+    def put(self, key: Tuple[str, int, int], data: Dict[str, Any]):
+        with self._lock:
+            self._remember(key, data)
+            if self._conn is None:
+                return
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO probes (path, size, mtime_ns, data, last_used) "
+                    "VALUES (?, ?, ?, ?, julianday('now'))",
+                    (*key, json.dumps(data, ensure_ascii=False))
+                )
+                (count,) = self._conn.execute("SELECT COUNT(*) FROM probes").fetchone()
+                if count > self.max_entries:
+                    self._conn.execute(
+                        "DELETE FROM probes WHERE rowid IN "
+                        "(SELECT rowid FROM probes ORDER BY last_used LIMIT ?)",
+                        (count - self.max_entries,)
+                    )
+                self._conn.commit()
+            except sqlite3.Error as e:
+                print(f"Warning: Probe cache write failed: {e}")
+
+    def _remember(self, key, data):
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+
+_cache: Optional[ProbeCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_probe_cache() -> ProbeCache:
+    """Общий для процесса экземпляр кэша (создаётся при первом обращении)."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ProbeCache()
+        return _cache
+
+
+def file_hash(path: str, block: int = CONTENT_HASH_BLOCK) -> str:
+    """
+    SHA-256 всего файла. По нему адресуются кэш результатов и seed заданий,
+    поэтому разные файлы одного размера не должны совпадать ни при каких данных.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(block), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_hash(path: str) -> str:
+    """Хэш содержимого файла; считается один раз и хранится в кэше ffprobe рядом с MediaInfo."""
+    try:
+        info = probe_media(path)
+    except Exception:
+        return file_hash(path)
+    if info.file_hash is None:
+        info.file_hash = file_hash(path)
+        get_probe_cache().put(ProbeCache.key_for(path), info.to_dict())
+    return info.file_hash
+
+
+def keyframe_index(path: str) -> List[float]:
+    """Времена ключевых кадров; сканируются один раз и хранятся в кэше ffprobe рядом с MediaInfo."""
+    info = probe_media(path)
+    if info.keyframes is None:
+        info.keyframes = scan_keyframes(path)
+        get_probe_cache().put(ProbeCache.key_for(path), info.to_dict())
+    return info.keyframes
+
+
+def probe_media(path: str, use_cache: bool = True) -> MediaInfo:
+    """
+    Пробует файл одним запуском ffprobe и возвращает MediaInfo.
+    Повторные вызовы (в том числе между запусками программы) берутся из кэша.
+    """
+    key = ProbeCache.key_for(path)
+    cache = get_probe_cache() if use_cache else None
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return MediaInfo.from_dict({**cached, "path": path})
+    info = parse_probe(path, _run_ffprobe(path))
+    if cache is not None:
+        cache.put(key, info.to_dict())
+    return info
@@ -0,0 +1,130 @@
+# utils/scheduler.py
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from .constants import (
+    BLUR_QUALITY_LEVELS, COST_REFERENCE_PIXELS, COST_WEIGHTS, DEFAULT_SCHEDULE,
+    GIF_DEFAULT_LOOPS, GIF_FALLBACK_DURATION, GIF_MAX_DURATION
+)
+from .ffmpeg_utils import encoding_profile, output_target, plan_stream_copy, resolve_color_filters, video_bitrate_cap
+from .jobs import Job
+
+
+def _output_length(job: Job, options: Dict[str, Any]) -> float:
+    """Длина результата задания (сек) с учётом отрезка, повторов GIF и средней скорости."""
+    info = job.info
+    if job.in_path.lower().endswith('.gif'):
+        one_loop = info.duration if info else 0.0
+        length = (options["gif_duration"]
+                  or (one_loop * max(1, options.get("gif_loops", GIF_DEFAULT_LOOPS)) if one_loop > 0 else 0.0)
+                  or GIF_FALLBACK_DURATION)
+        length = min(length, GIF_MAX_DURATION)
+    else:
+        length = job.duration or (info.duration if info else 0.0)
+    speed = (options["speed_min"] + options["speed_max"]) / 200.0
+    return length / speed if speed > 0 else length
+
+
+def _copies_video(job: Job, options: Dict[str, Any]) -> bool:
+    """
+    Будет ли видео скопировано без перекодирования (только при фиксированных zoom и скорости).
+    Отрезок с одним выходом тоже считается копией: utils.smart_cut перекодирует у него только границы.
+    """
+    if job.info is None or options["zoom_min"] != options["zoom_max"] or options["speed_min"] != options["speed_max"]:
+        return False
+    plan = plan_stream_copy(
+        job.info, output_target(options["output_format"]), options["zoom_min"], options["speed_min"],
+        resolve_color_filters(options["filters"], random.Random(0)), bool(options["overlay_file"]),
+        options["mute_audio"], job.start if len(job.outputs) > 1 else None,
+        video_bitrate_cap(encoding_profile(options["output_format"])))
+    return plan.copy_video
+
+
+def estimate_cost(job: Job, options: Dict[str, Any]) -> Optional[float]:
+    """
+    Оценка стоимости задания в условных единицах: секунды результата × размер
+    кадра относительно 1080p × множитель выбранных опций (COST_WEIGHTS).
+    Абсолютное значение неважно — оно нужно для сравнения заданий и расчёта ETA.
+    None — о входе ничего не известно (нет MediaInfo).
+    """
+    info = job.info
+    if info is None:
+        return None
+    seconds = _output_length(job, options)
+    src_pixels = max(1, info.width * info.height) / COST_REFERENCE_PIXELS
+    if _copies_video(job, options):
+        return seconds * COST_WEIGHTS["copy"] * len(job.outputs)
+    target = output_target(options["output_format"])
+    out_pixels = target[0] * target[1] / COST_REFERENCE_PIXELS if target else src_pixels
+    per_output = COST_WEIGHTS["encode"] + COST_WEIGHTS["filter"] * len(options["filters"])
+    if options["zoom_min"] != 100 or options["zoom_max"] != 100:
+        per_output += COST_WEIGHTS["zoom"]
+    if options["overlay_file"]:
+        per_output += COST_WEIGHTS["overlay"]
+    if options["blur_background"]:
+        downscale = BLUR_QUALITY_LEVELS.get(options["blur_quality"], 1)
+        per_output += COST_WEIGHTS["blur"] / downscale / max(1, options["blur_reuse_frames"])
+    return seconds * (src_pixels * COST_WEIGHTS["decode"] + out_pixels * per_output * len(job.outputs))
+
+
+def order_jobs(jobs: List[Job], costs: Dict[str, float], policy: str = DEFAULT_SCHEDULE) -> List[Job]:
+    """
+    Упорядочивает задания пакета по оценке стоимости costs (ключ — out_path):
+    longest — самые долгие первыми (LPT: короче общий хвост при параллельной работе),
+    shortest — самые быстрые первыми (первые результаты раньше), fifo — как в списке.
+    Сортировка устойчивая: равные задания сохраняют порядок списка.
+    """
+    if policy == "fifo":
+        return list(jobs)
+    return sorted(jobs, key=lambda job: costs[job.out_path], reverse=(policy == "longest"))
+
+
+def plan_costs(jobs: List[Job], options: Dict[str, Any]) -> Dict[str, float]:
+    """Оценки стоимости всех заданий; неизвестные получают среднюю оценку известных."""
+    estimates = {job.out_path: estimate_cost(job, options) for job in jobs}
+    known = [cost for cost in estimates.values() if cost is not None]
+    fallback = sum(known) / len(known) if known else 1.0
+    return {key: (fallback if cost is None else cost) for key, cost in estimates.items()}
+
+
+class BatchEta:
+    """
+    Прогресс и оставшееся время пакета, взвешенные по стоимости заданий.
+    Скорость (единиц стоимости в секунду) меряется по уже сделанной работе,
+    поэтому оценка уточняется по ходу пакета и учитывает реальную машину.
+    """
+
+    def __init__(self, costs: Dict[str, float]):
+        self.costs = dict(costs)
+        self.total = sum(self.costs.values()) or 1.0
+        self.started = time.monotonic()
+        self._done = 0.0
+        self._running: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def update(self, key: str, fraction: float):
+        with self._lock:
+            self._running[key] = min(1.0, max(0.0, fraction))
+
+    def finish(self, key: str):
+        """Задание завершено (успешно, с ошибкой или пропущено): его стоимость больше не ожидается."""
+        with self._lock:
+            self._running.pop(key, None)
+            self._done += self.costs.get(key, 0.0)
+
+    def _completed(self) -> float:
+        return self._done + sum(self.costs.get(key, 0.0) * f for key, f in self._running.items())
+
+    def fraction(self) -> float:
+        with self._lock:
+            return min(1.0, self._completed() / self.total)
+
+    def eta(self) -> Optional[float]:
+        """Оставшееся время (сек) или None, пока скорость ещё не измерена."""
+        with self._lock:
+            completed = self._completed()
+        elapsed = time.monotonic() - self.started
+        if completed <= 0 or elapsed <= 0:
+            return None
+        return max(0.0, (self.total - completed) / (completed / elapsed))
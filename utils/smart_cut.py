@@ -0,0 +1,155 @@
+# utils/smart_cut.py
+import os
+import bisect
+import shutil
+import tempfile
+from dataclasses import dataclass
+from typing import List, Optional
+from .constants import (
+    CHUNK_DIR_PREFIX, SMART_CUT_ENCODERS, SMART_CUT_CRF, SMART_CUT_MIN_COPY
+)
+from .ffmpeg_utils import FFMPEG_PATH_EFFECTIVE, ProgressCallback, run_ffmpeg
+from .probe import MediaInfo, KEYFRAME_EDGE, keyframe_index
+
+_EDGE = KEYFRAME_EDGE
+
+# ffprobe пишет профиль H.264 словами, libx264 принимает свои имена
+_H264_PROFILES = {
+    "Constrained Baseline": "baseline",
+    "Baseline": "baseline",
+    "Main": "main",
+    "High": "high",
+    "High 10": "high10",
+    "High 4:2:2": "high422",
+    "High 4:4:4 Predictive": "high444",
+}
+
+
+@dataclass
+class CutPlan:
+    """Отрезок [start, end): голова и хвост до/после ключевых кадров перекодируются, [copy_start, copy_end) копируется."""
+    start: float
+    copy_start: float
+    copy_end: float
+    end: float
+
+
+def plan_smart_cut(keyframes: List[float], start: float, end: float, total: float = 0.0,
+                   min_copy: float = SMART_CUT_MIN_COPY) -> Optional[CutPlan]:
+    """
+    Находит целые GOP внутри отрезка: копия начинается с первого ключевого кадра
+    не раньше start и заканчивается на последнем ключевом кадре не позже end
+    (или на конце файла total, если отрезок доходит до него).
+    None — копировать нечего (GOP длиннее отрезка или целых GOP меньше min_copy сек).
+    """
+    first = bisect.bisect_left(keyframes, start - _EDGE)
+    last = bisect.bisect_right(keyframes, end + _EDGE) - 1
+    if first >= len(keyframes) or last < first:
+        return None
+    copy_start = keyframes[first]
+    copy_end = end if total and end >= total - _EDGE else keyframes[last]
+    if copy_end - copy_start < min_copy:
+        return None
+    return CutPlan(start, max(start, copy_start), copy_end, end)
+
+
+def _video_stream(info: MediaInfo) -> dict:
+    return next((s for s in info.streams if s.get("codec_type") == "video"), {})
+
+
+def _encode_args(info: MediaInfo, threads: Optional[int]) -> List[str]:
+    """
+    Кодирование границ с теми же параметрами, что у копируемых GOP: профиль, уровень,
+    число опорных кадров, формат пикселей и цветовые свойства.
+    """
+    stream = _video_stream(info)
+    args = ["-c:v", SMART_CUT_ENCODERS[info.video_codec], "-preset", "veryfast", "-crf", str(SMART_CUT_CRF)]
+    if stream.get("pix_fmt"):
+        args.extend(["-pix_fmt", stream["pix_fmt"]])
+    profile = _H264_PROFILES.get(stream.get("profile", ""))
+    if profile:
+        args.extend(["-profile:v", profile])
+    level = stream.get("level")
+    if isinstance(level, int) and level > 0:
+        args.extend(["-level:v", f"{level / 10:.1f}"])
+    if stream.get("refs"):
+        args.extend(["-refs", str(stream["refs"])])
+    for option, entry in (("-color_range", "color_range"), ("-color_primaries", "color_primaries"),
+                          ("-color_trc", "color_transfer"), ("-colorspace", "color_space")):
+        if stream.get(entry) not in (None, "", "unknown"):
+            args.extend([option, stream[entry]])
+    if threads:
+        args.extend(["-threads", str(threads)])
+    return args
+
+
+def smart_cut(in_path: str, out_path: str, start: float, duration: float, info: MediaInfo,
+              mute_audio: bool = False, copy_audio: bool = True, strip_metadata: bool = False,
+              threads: Optional[int] = None, progress_callback: Optional[ProgressCallback] = None) -> bool:
+    """
+    Вырезает отрезок [start, start + duration) точно по времени без полного перекодирования.
+    Целые GOP между ключевыми кадрами (по индексу keyframe_index) копируются, неполные GOP
+    на границах перекодируются с параметрами исходного потока. SPS/PPS перекодированных
+    границ обычно отличаются от исходных, поэтому каждый кусок несёт их перед своим
+    ключевым кадром (MPEG-TS), а склейка пишется в MP4 как avc3 — с параметрами
+    внутри потока, которые могут меняться на ключевых кадрах.
+    Звук берётся из входа по всей длине отрезка (копией при copy_audio, иначе AAC),
+    поэтому на стыках он не прерывается.
+    Возвращает False, если копировать нечего или кодек не поддерживается, — тогда
+    отрезок нужно перекодировать обычным способом.
+    """
+    if info.video_codec not in SMART_CUT_ENCODERS:
+        return False
+    end = min(start + duration, info.duration) if info.duration else start + duration
+    plan = plan_smart_cut(keyframe_index(in_path), start, end, info.duration)
+    if plan is None:
+        return False
+
+    out_dir = os.path.dirname(os.path.abspath(out_path))
+    work_dir = tempfile.mkdtemp(prefix=CHUNK_DIR_PREFIX, dir=out_dir)
+    try:
+        pieces = []
+        encode = _encode_args(info, threads)
+        if plan.copy_start - plan.start > _EDGE:
+            head = os.path.join(work_dir, "head.ts")
+            run_ffmpeg([FFMPEG_PATH_EFFECTIVE, "-y", "-ss", f"{plan.start:.6f}", "-i", in_path,
+                        "-t", f"{plan.copy_start - plan.start - _EDGE:.6f}", "-map", "0:v:0", "-an",
+                        *encode, head], input_file_for_log=in_path)
+            pieces.append(head)
+        # Поиск чуть дальше ключевого кадра попадает ровно на него, а -t обрывает копию до следующего
+        middle = os.path.join(work_dir, "middle.ts")
+        run_ffmpeg([FFMPEG_PATH_EFFECTIVE, "-y", "-ss", f"{plan.copy_start + _EDGE:.6f}", "-i", in_path,
+                    "-t", f"{plan.copy_end - plan.copy_start - 2 * _EDGE:.6f}", "-map", "0:v:0", "-an",
+                    "-c:v", "copy", middle], input_file_for_log=in_path)
+        pieces.append(middle)
+        if plan.end - plan.copy_end > _EDGE:
+            tail = os.path.join(work_dir, "tail.ts")
+            run_ffmpeg([FFMPEG_PATH_EFFECTIVE, "-y", "-ss", f"{plan.copy_end - _EDGE:.6f}", "-i", in_path,
+                        "-t", f"{plan.end - plan.copy_end:.6f}", "-map", "0:v:0", "-an",
+                        *encode, tail], input_file_for_log=in_path)
+            pieces.append(tail)
+
+        list_path = os.path.join(work_dir, "pieces.txt")
+        with open(list_path, "w", encoding="utf-8") as f:
+            for piece in pieces:
+                escaped = piece.replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+
+        cmd = [FFMPEG_PATH_EFFECTIVE, "-y", "-f", "concat", "-safe", "0", "-i", list_path,
+               "-ss", f"{start:.6f}", "-t", f"{end - start:.6f}", "-i", in_path,
+               "-map", "0:v:0", "-c:v", "copy", "-tag:v", "avc3"]
+        if info.has_audio and not mute_audio:
+            cmd.extend(["-map", "1:a:0"])
+            cmd.extend(["-c:a", "copy"] if copy_audio else ["-c:a", "aac", "-b:a", "128k"])
+        else:
+            cmd.append("-an")
+        if strip_metadata:
+            cmd.extend(["-map_metadata", "-1", "-map_chapters", "-1"])
+        else:
+            cmd.extend(["-map_metadata", "1"])
+        cmd.extend(["-t", f"{end - start:.6f}", out_path])
+        run_ffmpeg(cmd, input_file_for_log=in_path,
+                   progress_callback=progress_callback, expected_duration=end - start)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return True
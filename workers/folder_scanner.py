@@ -0,0 +1,30 @@
+from PyQt5.QtCore import QThread, pyqtSignal
+from typing import List
+from VideoUniqueizer.utils.file_utils import iter_video_batches
+
+
+class FolderScanner(QThread):
+    """Ищет видео в папках в фоне и отдаёт найденное пачками, не блокируя интерфейс."""
+    batch_found = pyqtSignal(list)
+    scan_finished = pyqtSignal(int)
+
+    def __init__(self, folders: List[str], include_gifs: bool = False, batch_size: int = 500):
+        super().__init__()
+        self.folders = folders
+        self.include_gifs = include_gifs
+        self.batch_size = batch_size
+        self._stop = False
+
+    def stop(self):
+        self._stop = True
+
+    def run(self):
+        found = 0
+        for folder in self.folders:
+            for batch in iter_video_batches(folder, self.include_gifs, self.batch_size):
+                if self._stop:
+                    self.scan_finished.emit(found)
+                    return
+                found += len(batch)
+                self.batch_found.emit(batch)
+        self.scan_finished.emit(found)
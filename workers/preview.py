@@ -0,0 +1,48 @@
+import shutil
+import tempfile
+from PyQt5.QtCore import QThread, pyqtSignal
+from PyQt5.QtGui import QImage
+from typing import Any, Dict
+from VideoUniqueizer.utils.preview import render_preview, PreviewCancel
+from VideoUniqueizer.utils.cancellation import Cancelled
+
+
+class PreviewRenderer(QThread):
+    """Рисует кадры предпросмотра одного файла с текущими настройками в фоне."""
+    rendered = pyqtSignal(list)  # список QImage по порядку
+    failed = pyqtSignal(str)
+
+    def __init__(self, in_path: str, options: Dict[str, Any], variants: int = 1):
+        super().__init__()
+        self.in_path = in_path
+        self.options = options
+        self.variants = variants
+        self.stopped = False
+        self._cancel = PreviewCancel()
+
+    def stop(self):
+        """Останавливает рисование: ffmpeg предпросмотра завершается, сигналы не отправляются."""
+        self.stopped = True
+        self._cancel.cancel()
+
+    def run(self):
+        if self.stopped:
+            return
+        work_dir = tempfile.mkdtemp(prefix="uniqueizer_preview_")
+        try:
+            # Кадры загружаются здесь же: PNG удаляются вместе с папкой
+            frames = [QImage(path) for path in render_preview(self.in_path, self.options, work_dir, self.variants, self._cancel)]
+            frames = [frame for frame in frames if not frame.isNull()]
+            if self.stopped:
+                return
+            if frames:
+                self.rendered.emit(frames)
+            else:
+                self.failed.emit("ffmpeg не вернул ни одного кадра")
+        except Cancelled:
+            pass
+        except Exception as e:
+            if not self.stopped:
+                self.failed.emit(str(e))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
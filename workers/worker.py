@@ -1,16 +1,35 @@
 import subprocess
 from PyQt5.QtCore import QThread, pyqtSignal
 import os
-import random
-from typing import List, Optional
-from VideoUniqueizer.utils.ffmpeg_utils import process_single, get_video_dimensions
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional
+from VideoUniqueizer.utils.constants import DEFAULT_BLUR_QUALITY, GIF_DEFAULT_LOOPS, DEFAULT_SCHEDULE
+from VideoUniqueizer.utils.ffmpeg_utils import threads_per_job
+from VideoUniqueizer.utils.jobs import JOB_OPTION_DEFAULTS, Job, pick_percent, build_out_path, iter_jobs, run_job
+from VideoUniqueizer.utils.journal import open_journal, remove_partials
+from VideoUniqueizer.utils.output_cache import open_output_cache
+from VideoUniqueizer.utils.preflight import preflight
+from VideoUniqueizer.utils.metrics import open_metrics
+from VideoUniqueizer.utils.scheduler import BatchEta, order_jobs, plan_costs
+from VideoUniqueizer.utils.cancellation import Cancelled, registry, cancel_all, cancel_job
+from VideoUniqueizer.utils.governor import Governor
 
 
 class Worker(QThread):
-    progress = pyqtSignal(int, int)
+    # Готово заданий, всего заданий, оставшееся время пакета в секундах (-1, пока неизвестно)
+    progress = pyqtSignal(int, int, float)
     finished = pyqtSignal()
     error = pyqtSignal(str)
     file_processing = pyqtSignal(str)
+    # Прогресс внутри файла: имя задания и словарь с полями
+    # percent, out_time, frame, fps, speed, total_size, batch_percent, eta
+    file_progress = pyqtSignal(str, dict)
+    # Файл, не прошедший предварительную проверку: путь и причина
+    file_rejected = pyqtSignal(str, str)
+    # Отменённое задание (имя) и завершение пакета по отмене
+    job_cancelled = pyqtSignal(str)
+    cancelled = pyqtSignal()
 
     def __init__(
             self,
@@ -29,6 +48,20 @@ class Worker(QThread):
             output_format: str,
             blur_background: bool,
             strip_metadata: bool,
+            parallel_jobs: int = 1,
+            split_duration: Optional[int] = None,
+            chunk_parallel: bool = False,
+            variants_per_input: int = 1,
+            blur_quality: str = DEFAULT_BLUR_QUALITY,
+            blur_reuse_frames: int = 1,
+            resume: bool = False,
+            seed: Optional[int] = None,
+            use_output_cache: bool = True,
+            gif_loops: int = GIF_DEFAULT_LOOPS,
+            gif_duration: Optional[float] = None,
+            gif_silent_audio: bool = False,
+            schedule: str = DEFAULT_SCHEDULE,
+            use_governor: bool = True,
     ):
         super().__init__()
         self.files = list(files)
@@ -45,37 +78,117 @@ class Worker(QThread):
         self.mute_audio = mute_audio
         self.output_format = output_format
         self.blur_background = blur_background
+        self.blur_quality = blur_quality
+        self.blur_reuse_frames = max(1, blur_reuse_frames)
         self.strip_metadata = strip_metadata
+        self.parallel_jobs = max(1, parallel_jobs)
+        self.split_duration = split_duration
+        self.chunk_parallel = chunk_parallel
+        self.variants_per_input = max(1, variants_per_input)
+        self.resume = resume
+        self.seed = seed
+        self.use_output_cache = use_output_cache
+        self.gif_loops = max(1, gif_loops)
+        self.gif_duration = gif_duration
+        self.gif_silent_audio = gif_silent_audio
+        self.schedule = schedule
+        self.use_governor = use_governor
+        self._governor = None
+        self._journal = None
+        self._output_cache = None
+        self._metrics = None
         self._is_running = True
+        self._progress_lock = threading.Lock()
+        self._running_jobs: Dict[str, str] = {}
+        self._eta: Optional[BatchEta] = None
+        self._skipped_jobs = 0
+        self._cancelled_jobs = 0
+        self._total_jobs = 0
 
     def pick_zoom(self) -> int:
         """Выбирает значение Zoom в зависимости от режима."""
-        if self.zoom_mode == "dynamic" and self.zoom_max >= self.zoom_min:
-            try:
-                return random.randint(self.zoom_min, self.zoom_max)
-            except ValueError:
-                return self.zoom_min
-        return self.zoom_min
+        return pick_percent(self.zoom_mode, self.zoom_min, self.zoom_max)
 
     def pick_speed(self) -> int:
         """Выбирает значение скорости в зависимости от режима."""
-        if self.speed_mode == "dynamic" and self.speed_max >= self.speed_min:
-            try:
-                return random.randint(self.speed_min, self.speed_max)
-            except ValueError:
-                return self.speed_min
-        return self.speed_min
-
-    def stop(self):
+        return pick_percent(self.speed_mode, self.speed_min, self.speed_max)
+
+    def job_options(self) -> Dict[str, Any]:
+        """Параметры обработки в виде словаря для utils.jobs.run_job."""
+        return {name: getattr(self, name) for name in JOB_OPTION_DEFAULTS}
+
+    def stop(self, wait: bool = False):
+        """
+        Отменяет весь пакет: новые задания не запускаются, а работающие ffmpeg
+        останавливаются (мягко, затем принудительно). wait=True ждёт их остановки.
+        """
         self._is_running = False
         print("Worker stop requested.")
+        cancel_all(wait=wait)
+
+    def running_jobs(self) -> List[tuple]:
+        """Выполняющиеся сейчас задания: (ключ для cancel_job, имя)."""
+        with self._progress_lock:
+            return list(self._running_jobs.items())
+
+    def cancel_job(self, key: str):
+        """Отменяет одно задание; остальные продолжают работу."""
+        print(f"Worker: cancel requested for '{self._running_jobs.get(key, key)}'.")
+        cancel_job(key)
+
+    def _on_preflight_result(self, path: str, info, reason: Optional[str]):
+        if reason is not None:
+            self.file_rejected.emit(path, reason)
+
+    def build_out_path(self, in_file_path: str) -> str:
+        """Формирует путь к выходному файлу для входного."""
+        return build_out_path(in_file_path, self.out_dir, self.output_format)
+
+    def process_job(self, job: Job, threads: int) -> bool:
+        """Обрабатывает одно задание (файл или его часть). Выполняется в потоке пула."""
+        if not self._is_running:
+            return False
+
+        with self._progress_lock:
+            self._running_jobs[job.out_path] = job.name
+        self.file_processing.emit(job.name)
+
+        def on_progress(stats: Dict[str, Any]):
+            self._eta.update(job.out_path, (stats["percent"] or 0.0) / 100.0)
+            self.file_progress.emit(job.name, dict(stats, batch_percent=self.batch_percent(), eta=self._eta.eta()))
+
+        try:
+            run_job(job, self.job_options(), threads=threads, chunk_workers=self.parallel_jobs,
+                    progress_callback=on_progress, journal=self._journal, output_cache=self._output_cache,
+                    metrics=self._metrics, governor=self._governor)
+        finally:
+            self._eta.finish(job.out_path)
+            with self._progress_lock:
+                self._running_jobs.pop(job.out_path, None)
+        return True
+
+    def batch_percent(self) -> float:
+        """Прогресс пакета: пропущенные задания плюс сделанная доля работы по оценке стоимости."""
+        runnable = self._total_jobs - self._skipped_jobs
+        done = self._skipped_jobs + self._eta.fraction() * runnable
+        return min(100.0, done * 100.0 / max(1, self._total_jobs))
+
+    def emit_progress(self, done: int):
+        # Отменённые задания не выполнены, но и не ждут выполнения: из общего числа они убираются
+        eta = self._eta.eta() if self._eta is not None else None
+        self.progress.emit(done, self._total_jobs - self._cancelled_jobs, -1.0 if eta is None else eta)
 
     def run(self):
-        """Основной цикл обработки файлов."""
-        total_files = len(self.files)
-        if total_files == 0:
+        """
+        Основной цикл: после проверки входов (preflight) все задания планируются
+        заранее (с нарезкой на виртуальные части), оцениваются по стоимости и в
+        выбранном порядке отправляются в пул из parallel_jobs ffmpeg-процессов.
+        """
+        if not self.files:
             self.finished.emit()
             return
+        # Отметки отмены предыдущего пакета больше не действуют
+        registry.reset()
 
         try:
             os.makedirs(self.out_dir, exist_ok=True)
@@ -83,53 +196,113 @@ class Worker(QThread):
             self.error.emit(f"Не удалось создать выходную папку: {self.out_dir}\nОшибка: {e}")
             return
 
-        for i, in_file_path in enumerate(self.files):
-            if not self._is_running:
-                print("Worker stopped.")
-                break
-
-            base_name = os.path.basename(in_file_path)
-            name_part, _ = os.path.splitext(base_name)
-            suffix = "_reels" if self.output_format != "Оригинальный" else "_processed"
-            out_file_name = f"{name_part}{suffix}.mp4"
-            out_file_path = os.path.join(self.out_dir, out_file_name)
-
-            if os.path.abspath(in_file_path) == os.path.abspath(out_file_path):
-                alt_out_file_name = f"{name_part}{suffix}_output.mp4"
-                out_file_path = os.path.join(self.out_dir, alt_out_file_name)
-                print(f"Warning: Output path is same as input. Saving to: {alt_out_file_name}")
-
-            self.file_processing.emit(base_name)
-
-            try:
-                current_zoom = self.pick_zoom()
-                current_speed = self.pick_speed()
-
-                process_single(
-                    in_path=in_file_path,
-                    out_path=out_file_path,
-                    filters=self.filters,
-                    zoom_p=current_zoom,
-                    speed_p=current_speed,
-                    overlay_file=self.overlay_file,
-                    overlay_pos=self.overlay_pos,
-                    output_format=self.output_format,
-                    blur_background=self.blur_background,
-                    mute_audio=self.mute_audio,
-                    strip_metadata=self.strip_metadata,
-                )
-                self.progress.emit(i + 1, total_files)
-
-            except Exception as e:
-                error_msg = f"Ошибка при обработке файла '{base_name}':\n{type(e).__name__}: {e}"
-                if isinstance(e, subprocess.CalledProcessError) and e.output:
-                    error_msg += f"\n\nFFmpeg output:\n{e.output[-500:]}"
-                print(f"Error in worker thread: {error_msg}")
-                self.error.emit(error_msg)
-                continue
+        # Все входы проверяются до кодирования: негодные не занимают место в пуле
+        try:
+            infos, rejected = preflight(self.files, should_stop=lambda: not self._is_running,
+                                        on_result=self._on_preflight_result)
+        except FileNotFoundError as e:
+            self.error.emit(str(e))
+            return
+        if rejected:
+            print(f"Worker: preflight rejected {len(rejected)} of {len(self.files)} file(s).")
+        files = [path for path in self.files if path in infos]
+        if not self._is_running:
+            self.cancelled.emit()
+            return
+        if not files:
+            self.finished.emit()
+            return
+
+        threads = threads_per_job(self.parallel_jobs)
+        # Задания запускаются по нагрузке системы, ffmpeg закрепляются за своими ядрами
+        self._governor = Governor(self.parallel_jobs) if self.use_governor else None
+        if self._governor is not None:
+            threads = self._governor.threads
+        print(f"Worker: {self.parallel_jobs} parallel job(s), {threads} thread(s) per job.")
+        done = 0
+        skipped = 0
+
+        # Журнал в выходной папке: по нему можно продолжить прерванный пакет
+        self._journal = open_journal(self.out_dir)
+        if self.use_output_cache:
+            self._output_cache = open_output_cache()
+        self._metrics = open_metrics()
+        options = self.job_options()
+        if self.resume:
+            removed = remove_partials(self.out_dir)
+            if removed:
+                print(f"Worker: removed {removed} partial output(s) left by an interrupted run.")
+
+        # Все задания планируются заранее: сведения о входах уже есть после проверки,
+        # а порядок запуска выбирается по оценке стоимости (см. utils.scheduler)
+        pending = []
+        for job in iter_jobs(files, self.out_dir, self.output_format,
+                             self.split_duration, self.variants_per_input, infos):
+            if self.resume and self._journal is not None and self._journal.is_done(job, options):
+                skipped += 1
+            else:
+                pending.append(job)
+        costs = plan_costs(pending, options)
+        pending = order_jobs(pending, costs, self.schedule)
+        self._eta = BatchEta(costs)
+        self._skipped_jobs = skipped
+        self._cancelled_jobs = 0
+        self._total_jobs = len(pending) + skipped
+        done = skipped
+        self.emit_progress(done)
+
+        with ThreadPoolExecutor(max_workers=self.parallel_jobs) as pool:
+            futures = {}
+            for job in pending:
+                if not self._is_running:
+                    break
+                futures[pool.submit(self.process_job, job, threads)] = job
+            if skipped:
+                print(f"Worker: resume mode, skipped {skipped} already finished job(s).")
+
+            for future in as_completed(futures):
+                job_name = futures[future].name
+                try:
+                    if not future.result():
+                        continue
+                except (Cancelled, CancelledError):
+                    if not self._is_running:
+                        continue
+                    # Отменено одно задание: пакет продолжается
+                    print(f"Worker: job '{job_name}' cancelled.")
+                    self.job_cancelled.emit(job_name)
+                    self._cancelled_jobs += 1
+                    self.emit_progress(done)
+                    continue
+                except Exception as e:
+                    error_msg = f"Ошибка при обработке файла '{job_name}':\n{type(e).__name__}: {e}"
+                    if isinstance(e, subprocess.CalledProcessError) and e.output:
+                        error_msg += f"\n\nFFmpeg output:\n{e.output[-500:]}"
+                    print(f"Error in worker thread: {error_msg}")
+                    self.error.emit(error_msg)
+                    continue
+                finally:
+                    if not self._is_running:
+                        for queued in futures:
+                            queued.cancel()
+
+                done += 1
+                self.emit_progress(done)
 
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if self._output_cache is not None:
+            self._output_cache.close()
+            self._output_cache = None
+        if self._metrics is not None:
+            self._metrics.close()
+            self._metrics = None
+        if self._cancelled_jobs:
+            print(f"Worker: {self._cancelled_jobs} job(s) cancelled.")
         if self._is_running:
             print("Worker finished processing all files.")
             self.finished.emit()
         else:
             print("Worker finished due to stop request.")
+            self.cancelled.emit()